@@ -1,14 +1,26 @@
 import os
-import cv2
-import numpy as np
-import face_recognition
-import pickle
-import datetime
-from flask import Flask, request, jsonify
+import time
+import threading
+import json
+import sys
+import shutil
+import tempfile
+import subprocess
+from flask import Flask, request, jsonify, Response, stream_with_context, g
 from flask_cors import CORS
-from pathlib import Path
 from werkzeug.utils import secure_filename
-from model_integration import face_service
+from model_integration import (face_service, ENABLE_DEEP_LEARNING, INFERENCE_BACKEND, TFLITE_QUANTIZATION,
+                               FACE_DETECTOR, FACE_DETECT_MAX_WIDTH, DECODE_MIN_WIDTH, MULTI_WORKER)
+from startup import startup_state, warmup
+from streaming import StreamSession, FrameTooLarge, iter_jpeg_frames
+from attendance_store import AttendanceStore
+from attendance_policy import AttendancePolicy
+from user_store import UserStore
+from bulk_enrol import load_results
+from training_jobs import TrainingJobManager
+from metrics import registry, span, REQUEST_SECONDS, REQUESTS, ATTENDANCE_WRITES
+from profiler import profiler
+from models.preprocessing import decode_image
 
 app = Flask(__name__)
 CORS(app)
@@ -18,19 +30,116 @@ UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'upload
 ENCODINGS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'encodings')
 MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../models')
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
+# Seconds before a tracked face in a stream is encoded again
+STREAM_REVERIFY_SECONDS = float(os.environ.get('STREAM_REVERIFY_SECONDS', 2.0))
+ATTENDANCE_DB = os.environ.get('ATTENDANCE_DB', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'attendance.db'))
+# Registered users are shared by all workers through SQLite, by default in the attendance database
+USERS_DB = os.environ.get('USERS_DB', ATTENDANCE_DB)
+# Training jobs too, so any worker can report or cancel a job another one runs
+TRAINING_JOBS_DB = os.environ.get('TRAINING_JOBS_DB', ATTENDANCE_DB)
+MAX_PAGE_SIZE = 1000
+# Which recognitions become attendance writes: cooldown, daily, session or checkinout
+ATTENDANCE_MODE = os.environ.get('ATTENDANCE_MODE', 'cooldown')
+ATTENDANCE_COOLDOWN_SECONDS = float(os.environ.get('ATTENDANCE_COOLDOWN_SECONDS', 60))
+ATTENDANCE_SESSION_GAP_SECONDS = float(os.environ.get('ATTENDANCE_SESSION_GAP_SECONDS', 1800))
+# Size of the process pool encoding bulk enrolments (default: CPU count)
+BULK_ENROL_PROCESSES = int(os.environ.get('BULK_ENROL_PROCESSES', 0)) or None
+# Start the sampling profiler with the server (it can also be toggled at /api/debug/profiler)
+PROFILER_ENABLED = os.environ.get('PROFILER_ENABLED', 'false').lower() == 'true'
+PROFILER_INTERVAL_MS = float(os.environ.get('PROFILER_INTERVAL_MS', 10))
 
 # Create necessary directories
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(ENCODINGS_PATH, exist_ok=True)
 os.makedirs(MODEL_PATH, exist_ok=True)
 
-# Database mock (replace with real DB in production)
-attendance_records = []
-registered_users = {}
+# Attendance records are persisted in SQLite
+attendance_store = AttendanceStore(ATTENDANCE_DB)
+attendance_policy = AttendancePolicy(ATTENDANCE_MODE, ATTENDANCE_COOLDOWN_SECONDS, ATTENDANCE_SESSION_GAP_SECONDS)
+registered_users = UserStore(USERS_DB)
+# Model training runs as background jobs in a separate process
+training_jobs = TrainingJobManager(face_service, TRAINING_JOBS_DB,
+                                   tflite=TFLITE_QUANTIZATION if INFERENCE_BACKEND == 'tflite' else None)
+
+# Scrape-time gauges of the service state
+registry.gauge('face_attendance_gallery_size', 'Face encodings in the matching gallery',
+               fn=lambda: len(face_service.gallery))
+registry.gauge('face_attendance_embedding_gallery_size', 'Deep learning embeddings of enrolled users',
+               fn=lambda: len(face_service.embedding_gallery))
+registry.gauge('face_attendance_registered_users', 'Registered users',
+               fn=lambda: registered_users.count())
+registry.gauge('face_attendance_startup_step_seconds', 'Duration of each startup step (model loads, warmup)',
+               ('step',), fn=lambda: {(step,): ms / 1000.0 for step, ms in startup_state.timings.items()})
+registry.gauge('face_attendance_ready', 'Whether models are loaded and warmed up',
+               fn=lambda: float(startup_state.ready))
+
+if PROFILER_ENABLED:
+    profiler.start(PROFILER_INTERVAL_MS / 1000.0)
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint, method=request.method)
+        REQUESTS.inc(endpoint=endpoint, method=request.method, status=str(response.status_code))
+    return response
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def user_name(user_id):
+    return registered_users.name(user_id)
+
+def write_attendance_events(events, confidence=None):
+    """Persist (user_id, event, timestamp) events from the attendance policy"""
+    if events:
+        for _, event, _ in events:
+            ATTENDANCE_WRITES.inc(event=event)
+        attendance_store.add_many([
+            {
+                "userId": user_id,
+                "name": user_name(user_id),
+                "timestamp": timestamp.isoformat(),
+                "confidence": confidence if event != 'check_out' else None,
+                "event": event
+            }
+            for user_id, event, timestamp in events
+        ])
+
+def sweep_attendance(interval=60):
+    """Close idle check-in/out sessions even when nobody else is seen"""
+    while True:
+        time.sleep(interval)
+        try:
+            write_attendance_events(attendance_policy.expire())
+        except Exception as e:
+            print(f"Error expiring attendance sessions: {e}")
+
+if ATTENDANCE_MODE == 'checkinout':
+    threading.Thread(target=sweep_attendance, name='attendance-sweeper', daemon=True).start()
+
+def record_attendance(user_id, confidence):
+    """Record a sighting of a recognized user, writing only what the policy asks for
+    
+    Returns the user's attendance state; `timestamp` is when attendance was
+    last written for them and `recorded` tells whether this sighting wrote it.
+    """
+    with span('attendance'):
+        events, presence = attendance_policy.observe(user_id)
+        write_attendance_events(events, confidence)
+    return {
+        "userId": user_id,
+        "name": user_name(user_id),
+        "timestamp": presence.last_written.isoformat(),
+        "confidence": confidence,
+        "recorded": any(event[0] == user_id and event[1] != 'check_out' for event in events)
+    }
+
 @app.route('/api/register', methods=['POST'])
 def register_user():
     """Register a new user with their face"""
@@ -45,31 +154,104 @@ def register_user():
         return jsonify({"error": "No file selected"}), 400
     
     if file and allowed_file(file.filename):
-        filename = secure_filename(f"{user_id}_{file.filename}")
-        file_path = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(file_path)
-        
-        # Register user using the face service
-        result = face_service.register_user(user_id, file_path)
+        body, status = register_photo(user_id, name, file.filename, file.read())
+        return jsonify(body), status
+    
+    return jsonify({"error": "Invalid file type"}), 400
+
+def register_photo(user_id, name, filename, data):
+    """Register a user from the bytes of their uploaded photo; returns (body, status)
+    
+    Shared with the async server (asgi.py), which runs it on its worker pool.
+    """
+    # Decode in memory: no temp file shared between concurrent requests
+    with span('decode'):
+        image, _ = decode_image(data, DECODE_MIN_WIDTH)
+    if image is None:
+        return {"error": "Failed to read image"}, 400
+    
+    # Register user using the face service
+    result = face_service.register_user(user_id, image)
+    
+    if not result["success"]:
+        return {"error": result.get("error", "Registration failed")}, 400
+    
+    # Only persist the photo once the registration succeeded
+    filename = secure_filename(f"{user_id}_{filename}")
+    file_path = os.path.join(UPLOAD_FOLDER, filename)
+    with span('upload_save'), open(file_path, 'wb') as f:
+        f.write(data)
+    
+    # Store user info
+    registered_users.put(user_id, name, file_path)
+    
+    return {
+        "success": True,
+        "message": f"User {name} registered successfully",
+        "userId": user_id
+    }, 200
+
+@app.route('/api/register/bulk', methods=['POST'])
+def register_bulk():
+    """Register many users at once from a zip file or a directory upload
+    
+    Photos are named `<userId>.jpg` or stored as `<userId>/<any>.jpg`; an
+    optional `users.csv` (userId,name) gives display names. Send a zip as
+    `file`, or the files of a directory as `files` (with relative paths as
+    filenames). Photos are encoded on a process pool by bulk_enrol.py and
+    enrolled with one batched store update; failures are reported per photo.
+    """
+    workdir = tempfile.mkdtemp(prefix='bulk_enrol_')
+    try:
+        if 'file' in request.files and request.files['file'].filename:
+            source = os.path.join(workdir, 'upload.zip')
+            request.files['file'].save(source)
+        elif request.files.getlist('files'):
+            source = os.path.join(workdir, 'upload')
+            for upload in request.files.getlist('files'):
+                parts = [secure_filename(part) for part in upload.filename.replace('\\', '/').split('/')]
+                parts = [part for part in parts if part]
+                if not parts:
+                    continue
+                path = os.path.join(source, *parts[-2:])
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                upload.save(path)
+        else:
+            return jsonify({"error": "Missing zip file or directory files"}), 400
         
-        if not result["success"]:
-            # Clean up the file if registration failed
-            os.remove(file_path)
-            return jsonify({"error": result.get("error", "Registration failed")}), 400
+        results_path = os.path.join(workdir, 'results.npz')
+        command = [
+            sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bulk_enrol.py'), source,
+            '--output', results_path, '--data-dir', face_service.data_dir,
+            '--detector', FACE_DETECTOR, '--max-width', str(FACE_DETECT_MAX_WIDTH),
+            '--decode-min-width', str(DECODE_MIN_WIDTH)
+        ]
+        if BULK_ENROL_PROCESSES:
+            command += ['--processes', str(BULK_ENROL_PROCESSES)]
+        started = time.perf_counter()
+        run = subprocess.run(command, capture_output=True, text=True)
+        if run.returncode != 0:
+            return jsonify({"error": f"Bulk enrolment failed: {(run.stderr.strip().splitlines() or ['unknown error'])[-1]}"}), 400
         
-        # Store user info
-        registered_users[user_id] = {
-            "name": name,
-            "photo": file_path
-        }
+        user_ids, encodings, names, failures = load_results(results_path)
+        if user_ids:
+            face_service.register_many(user_ids, encodings)
+        registered_users.put_many([
+            (user_id, names.get(user_id, user_id), os.path.join(face_service.data_dir, user_id, f"{user_id}_face.jpg"))
+            for user_id in user_ids
+        ])
+        elapsed = time.perf_counter() - started
         
         return jsonify({
             "success": True,
-            "message": f"User {name} registered successfully",
-            "userId": user_id
+            "enrolled": len(user_ids),
+            "userIds": user_ids,
+            "failed": failures,
+            "seconds": elapsed,
+            "enrolmentsPerSecond": len(user_ids) / elapsed if elapsed else 0.0
         })
-    
-    return jsonify({"error": "Invalid file type"}), 400
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
 
 @app.route('/api/recognize', methods=['POST'])
 def recognize_face():
@@ -83,88 +265,256 @@ def recognize_face():
     
     # Get option to use deep learning model if available
     use_deep_learning = request.form.get('useDeepLearning', 'false').lower() == 'true'
+    # Recognize every face in the frame instead of only the first one
+    multi_face = request.form.get('multiFace', 'false').lower() == 'true'
     
     if file and allowed_file(file.filename):
-        # Save temporary file
-        temp_filename = secure_filename(f"temp_{file.filename}")
-        temp_file_path = os.path.join(UPLOAD_FOLDER, temp_filename)
-        file.save(temp_file_path)
-        
-        # Recognize face using the service
-        result = face_service.recognize_face(temp_file_path, use_deep_learning)
-        
-        # Clean up
-        os.remove(temp_file_path)
+        body, status = recognize_photo(file.read(), use_deep_learning, multi_face)
+        return jsonify(body), status
+    
+    return jsonify({"error": "Invalid file type"}), 400
+
+def recognize_photo(data, use_deep_learning=False, multi_face=False):
+    """Recognize the face(s) of an uploaded photo and record attendance; returns (body, status)
+    
+    Shared with the async server (asgi.py), which runs it on its worker pool.
+    """
+    # Decode in memory: no temp file shared between concurrent requests
+    with span('decode'):
+        image, scale = decode_image(data, DECODE_MIN_WIDTH)
+    if image is None:
+        return {"error": "Failed to read image"}, 400
+    
+    # Recognize face using the service
+    if multi_face:
+        result = face_service.recognize_faces(image, use_deep_learning, scale)
+    else:
+        result = face_service.recognize_face(image, use_deep_learning)
+    
+    if not result["success"]:
+        return {"error": result.get("error", "Recognition failed")}, 400
+    
+    if multi_face:
+        return recognize_faces_response(result["faces"])
+    
+    if result["recognized"]:
+        user_id = result["user"]
         
-        if not result["success"]:
-            return jsonify({"error": result.get("error", "Recognition failed")}), 400
+        # Record attendance
+        attendance_record = record_attendance(user_id, result.get("confidence", 0.0))
         
-        if result["recognized"]:
-            user_id = result["user"]
-            user_data = registered_users.get(user_id, {"name": user_id})
-            
-            # Record attendance
-            timestamp = datetime.datetime.now().isoformat()
-            attendance_record = {
+        return {
+            "success": True,
+            "recognized": True,
+            "user": {
                 "userId": user_id,
-                "name": user_data.get("name", user_id),
-                "timestamp": timestamp,
-                "confidence": result.get("confidence", 0.0)
-            }
-            attendance_records.append(attendance_record)
-            
-            return jsonify({
-                "success": True,
-                "recognized": True,
-                "user": {
-                    "userId": user_id,
-                    "name": user_data.get("name", user_id)
-                },
-                "confidence": result.get("confidence", 0.0),
-                "attendanceRecorded": timestamp
-            })
-        else:
-            return jsonify({
-                "success": True,
-                "recognized": False
-            }), 404
+                "name": attendance_record["name"]
+            },
+            "confidence": result.get("confidence", 0.0),
+            "attendanceRecorded": attendance_record["timestamp"],
+            "newRecord": attendance_record["recorded"]
+        }, 200
+    else:
+        return {
+            "success": True,
+            "recognized": False
+        }, 404
+
+def recognize_faces_response(faces):
+    """Record attendance for every recognized face of a multi-face result"""
+    response_faces = []
+    for face in faces:
+        if not face["recognized"]:
+            response_faces.append({"recognized": False, "box": face["box"]})
+            continue
+        
+        attendance_record = record_attendance(face["user"], face.get("confidence", 0.0))
+        response_faces.append({
+            "recognized": True,
+            "user": {
+                "userId": face["user"],
+                "name": attendance_record["name"]
+            },
+            "confidence": face.get("confidence", 0.0),
+            "box": face["box"],
+            "attendanceRecorded": attendance_record["timestamp"],
+            "newRecord": attendance_record["recorded"]
+        })
     
-    return jsonify({"error": "Invalid file type"}), 400
+    recognized = any(face["recognized"] for face in response_faces)
+    return {
+        "success": True,
+        "recognized": recognized,
+        "faces": response_faces
+    }, 200 if recognized else 404
+
+@app.route('/api/stream', methods=['POST'])
+def recognize_stream():
+    """Recognize faces over a continuous MJPEG upload
+
+    The camera pushes JPEG frames in one chunked request body (raw or
+    multipart/x-mixed-replace); one JSON line per frame is streamed back,
+    followed by a summary line.
+    """
+    session = StreamSession(face_service, on_recognized=record_attendance,
+                            reverify_interval=STREAM_REVERIFY_SECONDS, decode_min_width=DECODE_MIN_WIDTH)
+    
+    def generate():
+        try:
+            for frame in iter_jpeg_frames(request.stream):
+                yield json.dumps(session.process_jpeg(frame)) + "\n"
+        except FrameTooLarge as e:
+            # Report it in the stream, the status line has already been sent
+            yield json.dumps({"error": str(e)}) + "\n"
+        yield json.dumps({"done": True, "stats": session.stats()}) + "\n"
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
 
 @app.route('/api/attendance', methods=['GET'])
 def get_attendance():
-    """Get all attendance records"""
+    """Get attendance records, newest first
+    
+    Query parameters: page, pageSize, userId, start and end (ISO 8601).
+    """
+    try:
+        page = max(int(request.args.get('page', 1)), 1)
+        page_size = min(max(int(request.args.get('pageSize', 100)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({"error": "page and pageSize must be integers"}), 400
+    
+    records, total = attendance_store.query(
+        user_id=request.args.get('userId'),
+        start=request.args.get('start'),
+        end=request.args.get('end'),
+        limit=page_size,
+        offset=(page - 1) * page_size
+    )
     return jsonify({
         "success": True,
-        "records": attendance_records
+        "records": records,
+        "total": total,
+        "page": page,
+        "pageSize": page_size
     })
 
+@app.route('/api/attendance/stats', methods=['GET'])
+def get_attendance_stats():
+    """Dashboard aggregates: totals, counts per day and top users"""
+    try:
+        days = min(max(int(request.args.get('days', 7)), 1), 366)
+    except ValueError:
+        return jsonify({"error": "days must be an integer"}), 400
+    
+    stats = attendance_store.stats(days=days)
+    names = registered_users.names(entry["userId"] for entry in stats["perUser"])
+    for entry in stats["perUser"]:
+        entry["name"] = names.get(entry["userId"], entry["userId"])
+    return jsonify({"success": True, **stats})
+
+@app.route('/api/attendance/last-seen', methods=['GET'])
+def get_last_seen():
+    """Users currently held by the attendance cache, with their last sighting"""
+    write_attendance_events(attendance_policy.expire())
+    return jsonify({
+        "success": True,
+        "mode": attendance_policy.mode,
+        "users": attendance_policy.last_seen()
+    })
+
+@app.route('/api/health', methods=['GET'])
+def health():
+    """Readiness probe: 200 once models are loaded and warmed up"""
+    body, status = health_status()
+    return jsonify(body), status
+
+def health_status():
+    status = startup_state.to_dict()
+    status["deepLearning"] = ENABLE_DEEP_LEARNING and face_service.model is not None
+    status["registeredEncodings"] = len(face_service.gallery)
+    status["pid"] = os.getpid()
+    status["multiWorker"] = MULTI_WORKER
+    return status, 200 if status["ready"] else 503
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics of this process: latencies per stage and endpoint, counters, gallery size"""
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/debug/profiler', methods=['GET', 'POST'])
+def sampling_profiler():
+    """Status of the sampling profiler; POST {"enabled": bool, "intervalMs": n} starts or stops it"""
+    if request.method == 'POST':
+        options = request.get_json(silent=True) or {}
+        if options.get('enabled', True):
+            interval_ms = float(options.get('intervalMs', PROFILER_INTERVAL_MS))
+            if interval_ms < 1:
+                return jsonify({"success": False, "error": "intervalMs must be at least 1"}), 400
+            profiler.start(interval_ms / 1000.0, reset=options.get('reset', True))
+        else:
+            profiler.stop()
+    return jsonify({"success": True, "profiler": profiler.status()})
+
+@app.route('/api/debug/profiler/stacks', methods=['GET'])
+def sampling_profiler_stacks():
+    """Sampled stacks in collapsed format (flamegraph.pl, speedscope)"""
+    return Response(profiler.collapsed(), mimetype='text/plain')
+
 @app.route('/api/users', methods=['GET'])
 def get_users():
     """Get all registered users"""
-    user_list = [{"userId": uid, "name": data["name"]} for uid, data in registered_users.items()]
     return jsonify({
         "success": True,
-        "users": user_list
+        "users": registered_users.all()
     })
 
 @app.route('/api/train-model', methods=['POST'])
 def train_model():
-    """Train the deep learning model with registered users"""
-    force_retrain = request.json.get('forceRetrain', False)
+    """Queue a training job for the deep learning model; poll it with the returned jobId"""
+    options = request.get_json(silent=True) or {}
+    force_retrain = options.get('forceRetrain', False)
+    # Only add users missing from the current model instead of retraining it
+    incremental = options.get('incremental', False)
     
-    result = face_service.train_model(force_retrain)
+    result = training_jobs.submit(force_retrain, incremental)
     
     if result["success"]:
+        job = result["job"]
         return jsonify({
             "success": True,
-            "message": result["message"]
-        })
+            "message": "Training job queued",
+            "jobId": job.id,
+            "job": job.to_dict()
+        }), 202
     else:
         return jsonify({
             "success": False,
             "error": result.get("error", "Training failed")
         }), 400
 
+@app.route('/api/train-model/jobs', methods=['GET'])
+def list_training_jobs():
+    """Recent training jobs, newest first"""
+    return jsonify({
+        "success": True,
+        "jobs": [job.to_dict() for job in training_jobs.jobs()]
+    })
+
+@app.route('/api/train-model/jobs/<job_id>', methods=['GET'])
+def get_training_job(job_id):
+    """Status and progress (phase, epoch, loss, ETA) of a training job"""
+    job = training_jobs.get(job_id)
+    if job is None:
+        return jsonify({"success": False, "error": "Unknown job"}), 404
+    return jsonify({"success": True, "job": job.to_dict()})
+
+@app.route('/api/train-model/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_training_job(job_id):
+    """Cancel a queued or running training job"""
+    result = training_jobs.cancel(job_id)
+    if not result["success"]:
+        return jsonify(result), 404 if result["error"] == "Unknown job" else 409
+    return jsonify({"success": True, "job": result["job"].to_dict()})
+
 if __name__ == '__main__':
+    warmup(face_service)
     app.run(debug=True, host='0.0.0.0', port=5000) 
\ No newline at end of file
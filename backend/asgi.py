@@ -0,0 +1,176 @@
+"""Async serving mode: an ASGI app with the same /api/* contract as app.py
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+
+Uploads are received and parsed on the event loop, so slow clients hold no
+thread. Recognition and registration (decoding, detection, encoding,
+inference) run on a bounded pool of ASYNC_WORKERS threads; at most
+ASYNC_MAX_QUEUE more requests wait for a thread, and the rest are refused
+at once with 503 and Retry-After instead of queueing without bound. Every
+other route is served by the Flask app through a2wsgi, on a pool of its own.
+
+For more than one process, run `uvicorn --workers N` with MULTI_WORKER=true
+(see model_integration.py). benchmarks/bench_async.py load-tests this server
+against the Flask one.
+"""
+import os
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from starlette.applications import Starlette
+from starlette.datastructures import UploadFile
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse
+from starlette.routing import Route, Mount
+from a2wsgi import WSGIMiddleware
+
+from app import app as flask_app, face_service, allowed_file, register_photo, recognize_photo, health_status
+from startup import warmup
+from metrics import registry, REQUEST_SECONDS, REQUESTS, STAGE_SECONDS, SHED_REQUESTS
+
+# Threads running recognition and registration (default: CPU count)
+ASYNC_WORKERS = int(os.environ.get('ASYNC_WORKERS', 0)) or os.cpu_count() or 1
+# Requests allowed to wait for one of those threads (default: 4 per thread);
+# beyond that they get a 503, so a request waits at most a few recognitions
+ASYNC_MAX_QUEUE = int(os.environ.get('ASYNC_MAX_QUEUE', 0)) or 4 * ASYNC_WORKERS
+# Seconds clients are told to wait before retrying a shed request
+ASYNC_RETRY_AFTER = int(os.environ.get('ASYNC_RETRY_AFTER', 1))
+# Threads serving the other routes (attendance, users, training, streams) through Flask
+ASYNC_WSGI_WORKERS = int(os.environ.get('ASYNC_WSGI_WORKERS', 8))
+
+
+class Overloaded(Exception):
+    pass
+
+
+class WorkerPool:
+    """Thread pool for CPU-bound request work with a bounded wait queue
+
+    `run` raises Overloaded when every thread is busy and `max_queue`
+    requests are already waiting. Only used from the event loop thread, so
+    the count needs no lock. A task counts until its thread finishes it,
+    even when the client that asked for it has gone.
+    """
+
+    def __init__(self, workers, max_queue):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix='async-worker')
+        self.pending = 0
+
+    @property
+    def queued(self):
+        return max(self.pending - self.workers, 0)
+
+    def full(self):
+        return self.pending >= self.workers + self.max_queue
+
+    def _done(self):
+        self.pending -= 1
+
+    def _timed(self, submitted, fn, args):
+        STAGE_SECONDS.observe(time.perf_counter() - submitted, stage='queue')
+        return fn(*args)
+
+    async def run(self, fn, *args):
+        if self.full():
+            raise Overloaded()
+        loop = asyncio.get_running_loop()
+        future = self.executor.submit(self._timed, time.perf_counter(), fn, args)
+        self.pending += 1
+        future.add_done_callback(lambda future: loop.call_soon_threadsafe(self._done))
+        return await asyncio.wrap_future(future)
+
+
+pool = WorkerPool(ASYNC_WORKERS, ASYNC_MAX_QUEUE)
+registry.gauge('face_attendance_async_queue_depth', 'Requests waiting for an async worker thread',
+               fn=lambda: pool.queued)
+
+
+def endpoint(rule, handler, methods):
+    """Route recording the request metrics Flask's hooks record, and shedding with 503 when overloaded"""
+    async def timed(request):
+        start = time.perf_counter()
+        try:
+            response = await handler(request)
+        except Overloaded:
+            SHED_REQUESTS.inc(endpoint=rule)
+            response = JSONResponse({"error": "Server overloaded, retry later"}, 503,
+                                    headers={"Retry-After": str(ASYNC_RETRY_AFTER)})
+        REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=rule, method=request.method)
+        REQUESTS.inc(endpoint=rule, method=request.method, status=str(response.status_code))
+        return response
+    return Route(rule, timed, methods=methods)
+
+
+async def register_user(request):
+    """Register a new user with their face"""
+    # Shed before reading the upload
+    if pool.full():
+        raise Overloaded()
+    form = await request.form()
+    file = form.get('file')
+    if not isinstance(file, UploadFile) or 'userId' not in form:
+        return JSONResponse({"error": "Missing file or userId"}, 400)
+
+    user_id = form['userId']
+    name = form.get('name', user_id)
+
+    if not file.filename:
+        return JSONResponse({"error": "No file selected"}, 400)
+    if not allowed_file(file.filename):
+        return JSONResponse({"error": "Invalid file type"}, 400)
+
+    data = await file.read()
+    body, status = await pool.run(register_photo, user_id, name, file.filename, data)
+    return JSONResponse(body, status)
+
+
+async def recognize_face(request):
+    """Recognize a face from an uploaded image"""
+    if pool.full():
+        raise Overloaded()
+    form = await request.form()
+    file = form.get('file')
+    if not isinstance(file, UploadFile):
+        return JSONResponse({"error": "No file uploaded"}, 400)
+    if not file.filename:
+        return JSONResponse({"error": "No file selected"}, 400)
+
+    use_deep_learning = form.get('useDeepLearning', 'false').lower() == 'true'
+    multi_face = form.get('multiFace', 'false').lower() == 'true'
+
+    if not allowed_file(file.filename):
+        return JSONResponse({"error": "Invalid file type"}, 400)
+
+    data = await file.read()
+    body, status = await pool.run(recognize_photo, data, use_deep_learning, multi_face)
+    return JSONResponse(body, status)
+
+
+async def health(request):
+    """Readiness probe, answered on the event loop even when the worker pool is saturated"""
+    body, status = health_status()
+    return JSONResponse(body, status)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Load and warm up the models before accepting requests, as app.py does before app.run
+    await asyncio.get_running_loop().run_in_executor(None, warmup, face_service)
+    yield
+    pool.executor.shutdown(wait=False)
+
+
+app = Starlette(
+    routes=[
+        endpoint('/api/recognize', recognize_face, ['POST']),
+        endpoint('/api/register', register_user, ['POST']),
+        endpoint('/api/health', health, ['GET']),
+        Mount('/', app=WSGIMiddleware(flask_app, workers=ASYNC_WSGI_WORKERS))
+    ],
+    middleware=[Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])],
+    lifespan=lifespan
+)
@@ -0,0 +1,116 @@
+import datetime
+import threading
+from collections import OrderedDict
+
+ATTENDANCE_MODES = ('cooldown', 'daily', 'session', 'checkinout')
+
+
+class Presence:
+    """What the cache remembers about one user: only aggregated last-seen state"""
+
+    __slots__ = ('first_seen', 'last_seen', 'last_written', 'sightings')
+
+    def __init__(self, now):
+        self.first_seen = now
+        self.last_seen = now
+        self.last_written = None
+        self.sightings = 0
+
+    def to_dict(self):
+        return {
+            "firstSeen": self.first_seen.isoformat(),
+            "lastSeen": self.last_seen.isoformat(),
+            "lastRecorded": self.last_written.isoformat() if self.last_written else None,
+            "sightings": self.sightings
+        }
+
+
+class AttendancePolicy:
+    """Decides which recognitions become attendance writes
+
+    Modes:
+      cooldown    one 'attendance' record per user per `cooldown` seconds
+      daily       the first sighting of each user per calendar day
+      session     the first sighting after `session_gap` seconds unseen
+      checkinout  'check_in' on the first sighting of a session and
+                  'check_out' (at the last sighting) once the user has been
+                  unseen for `session_gap` seconds
+
+    Users are kept in an LRU ordered by last sighting and evicted once
+    unseen for the mode's TTL, so memory is bounded by who is around.
+    """
+
+    def __init__(self, mode='cooldown', cooldown=60, session_gap=1800):
+        if mode not in ATTENDANCE_MODES:
+            raise ValueError(f"Unknown attendance mode '{mode}', expected one of {ATTENDANCE_MODES}")
+        self.mode = mode
+        self.cooldown = datetime.timedelta(seconds=cooldown)
+        self.session_gap = datetime.timedelta(seconds=session_gap)
+        self.ttl = {
+            'cooldown': self.cooldown,
+            'daily': datetime.timedelta(days=1),
+            'session': self.session_gap,
+            'checkinout': self.session_gap
+        }[mode]
+        self.sightings = 0
+        self.writes = 0
+        self._presence = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict(self, now):
+        """Drop users unseen for longer than the TTL, closing their sessions"""
+        events = []
+        while self._presence:
+            user_id, presence = next(iter(self._presence.items()))
+            if now - presence.last_seen < self.ttl:
+                break
+            del self._presence[user_id]
+            if self.mode == 'checkinout':
+                events.append((user_id, 'check_out', presence.last_seen))
+        return events
+
+    def observe(self, user_id, now=None):
+        """Record a sighting; returns (events to write, the user's presence)
+
+        Events are (user_id, event, timestamp) tuples and may include
+        check-outs of other users whose sessions just expired.
+        """
+        now = now or datetime.datetime.now()
+        with self._lock:
+            self.sightings += 1
+            events = self._evict(now)
+            presence = self._presence.pop(user_id, None)
+
+            if presence is None:
+                presence = Presence(now)
+                write = True
+            elif self.mode == 'cooldown':
+                write = now - presence.last_written >= self.cooldown
+            elif self.mode == 'daily':
+                write = presence.last_written.date() != now.date()
+            else:
+                # The TTL equals the session gap, so a cached user is still in session
+                write = False
+
+            if write:
+                if presence.last_written is not None:
+                    presence.first_seen = now
+                presence.last_written = now
+                events.append((user_id, 'check_in' if self.mode == 'checkinout' else 'attendance', now))
+            presence.last_seen = now
+            presence.sightings += 1
+            self._presence[user_id] = presence
+
+            self.writes += len(events)
+            return events, presence
+
+    def expire(self, now=None):
+        """Evict idle users without a new sighting, e.g. from a periodic sweep"""
+        with self._lock:
+            events = self._evict(now or datetime.datetime.now())
+            self.writes += len(events)
+            return events
+
+    def last_seen(self):
+        with self._lock:
+            return {user_id: presence.to_dict() for user_id, presence in self._presence.items()}
@@ -0,0 +1,220 @@
+import os
+import queue
+import sqlite3
+import datetime
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS attendance (
+    id INTEGER PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    name TEXT,
+    timestamp TEXT NOT NULL,
+    confidence REAL,
+    event TEXT NOT NULL DEFAULT 'attendance'
+);
+CREATE INDEX IF NOT EXISTS idx_attendance_timestamp ON attendance (timestamp);
+CREATE INDEX IF NOT EXISTS idx_attendance_user_timestamp ON attendance (user_id, timestamp);
+CREATE TABLE IF NOT EXISTS attendance_daily (
+    day TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (day, user_id)
+);
+CREATE TABLE IF NOT EXISTS attendance_user_totals (
+    user_id TEXT PRIMARY KEY,
+    count INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS attendance_counters (
+    name TEXT PRIMARY KEY,
+    count INTEGER NOT NULL
+);
+"""
+
+COLUMNS = ("userId", "name", "timestamp", "confidence", "event")
+
+
+class AttendanceStore:
+    """SQLite (WAL) attendance storage with batched background inserts
+
+    `add` only queues the record; a writer thread inserts queued records
+    in one transaction per batch. Queries first wait for the queue to be
+    written, so a request always sees the attendance it just recorded.
+    Timestamps are ISO 8601 strings in local time, which sort and compare
+    correctly as text. Per-day/per-user and per-user counts are kept up
+    to date in `attendance_daily` and `attendance_user_totals` on insert,
+    and the number of records of every event in `attendance_counters`, so
+    dashboard aggregates and unfiltered pages never scan the raw records.
+    """
+
+    def __init__(self, path, batch_size=500, async_writes=True):
+        self.path = path
+        self.batch_size = batch_size
+        self.async_writes = async_writes
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        conn.executescript(SCHEMA)
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(attendance)')]
+        if 'event' not in columns:
+            conn.execute("ALTER TABLE attendance ADD COLUMN event TEXT NOT NULL DEFAULT 'attendance'")
+        with conn:
+            # Counted once for databases written before the counter existed
+            conn.execute("INSERT OR IGNORE INTO attendance_counters (name, count) "
+                         "SELECT 'events', COUNT(*) FROM attendance")
+
+        self._queue = queue.Queue()
+        if async_writes:
+            self._writer = threading.Thread(target=self._run_writer, name='attendance-writer', daemon=True)
+            self._writer.start()
+
+    def _connection(self):
+        """One connection per thread, as sqlite3 connections are not shareable"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def _row(self, record):
+        row = [record.get(column) for column in COLUMNS]
+        row[-1] = row[-1] or 'attendance'
+        return tuple(row)
+
+    def add(self, record):
+        """Queue an attendance record ({userId, name, timestamp, confidence, event})"""
+        row = self._row(record)
+        if self.async_writes:
+            self._queue.put(row)
+        else:
+            self._insert([row])
+
+    def add_many(self, records):
+        rows = [self._row(record) for record in records]
+        if self.async_writes:
+            for row in rows:
+                self._queue.put(row)
+        else:
+            self._insert(rows)
+
+    def _insert(self, rows):
+        with self._write_lock:
+            conn = self._connection()
+            daily, totals = {}, {}
+            for row in rows:
+                if row[4] == 'check_out':
+                    # Only arrivals count as attendance
+                    continue
+                key = (row[2][:10], row[0])
+                daily[key] = daily.get(key, 0) + 1
+                totals[row[0]] = totals.get(row[0], 0) + 1
+            with conn:
+                conn.executemany(
+                    'INSERT INTO attendance (user_id, name, timestamp, confidence, event) VALUES (?, ?, ?, ?, ?)',
+                    rows
+                )
+                conn.executemany(
+                    'INSERT INTO attendance_daily (day, user_id, count) VALUES (?, ?, ?) '
+                    'ON CONFLICT (day, user_id) DO UPDATE SET count = count + excluded.count',
+                    [(day, user_id, count) for (day, user_id), count in daily.items()]
+                )
+                conn.executemany(
+                    'INSERT INTO attendance_user_totals (user_id, count) VALUES (?, ?) '
+                    'ON CONFLICT (user_id) DO UPDATE SET count = count + excluded.count',
+                    list(totals.items())
+                )
+                conn.execute("UPDATE attendance_counters SET count = count + ? WHERE name = 'events'", (len(rows),))
+
+    def _drain(self, first):
+        rows = [first]
+        while len(rows) < self.batch_size:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return rows
+
+    def _run_writer(self):
+        while True:
+            rows = self._drain(self._queue.get())
+            try:
+                self._insert(rows)
+            except Exception as e:
+                print(f"Error writing attendance records: {e}")
+            finally:
+                for _ in rows:
+                    self._queue.task_done()
+
+    def flush(self):
+        """Block until every queued record has been written"""
+        if self.async_writes:
+            self._queue.join()
+
+    def query(self, user_id=None, start=None, end=None, limit=100, offset=0):
+        """Records matching the filters, newest first, plus the total match count"""
+        self.flush()
+        clauses, params = [], []
+        if user_id:
+            clauses.append('user_id = ?')
+            params.append(user_id)
+        if start:
+            clauses.append('timestamp >= ?')
+            params.append(start)
+        if end:
+            clauses.append('timestamp < ?')
+            params.append(end)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+
+        conn = self._connection()
+        if clauses:
+            total = conn.execute(f'SELECT COUNT(*) FROM attendance {where}', params).fetchone()[0]
+        else:
+            # Every event, check-outs included, unlike attendance_user_totals
+            total = conn.execute("SELECT count FROM attendance_counters WHERE name = 'events'").fetchone()[0]
+        rows = conn.execute(
+            f'SELECT user_id, name, timestamp, confidence, event FROM attendance {where} '
+            f'ORDER BY timestamp DESC LIMIT ? OFFSET ?',
+            params + [limit, offset]
+        ).fetchall()
+        records = [
+            {"userId": row["user_id"], "name": row["name"],
+             "timestamp": row["timestamp"], "confidence": row["confidence"], "event": row["event"]}
+            for row in rows
+        ]
+        return records, total
+
+    def stats(self, days=7, top_users=5, now=None):
+        """Server-side aggregates for the dashboard"""
+        self.flush()
+        now = now or datetime.datetime.now()
+        today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        first_day = today - datetime.timedelta(days=days - 1)
+
+        conn = self._connection()
+        per_day = dict(conn.execute(
+            'SELECT day, SUM(count) FROM attendance_daily WHERE day >= ? GROUP BY day',
+            (first_day.date().isoformat(),)
+        ).fetchall())
+        per_user = conn.execute(
+            'SELECT user_id, count FROM attendance_user_totals ORDER BY count DESC LIMIT ?',
+            (top_users,)
+        ).fetchall()
+        total, unique_users = conn.execute(
+            'SELECT COALESCE(SUM(count), 0), COUNT(*) FROM attendance_user_totals'
+        ).fetchone()
+
+        dates = [(first_day + datetime.timedelta(days=i)).date().isoformat() for i in range(days)]
+        return {
+            "total": total,
+            "today": per_day.get(today.date().isoformat(), 0),
+            "uniqueAttendees": unique_users,
+            "perDay": [{"date": date, "count": per_day.get(date, 0)} for date in dates],
+            "perUser": [{"userId": row[0], "count": row[1]} for row in per_user]
+        }
@@ -0,0 +1,61 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    """Coalesce items submitted by concurrent requests into batched calls
+
+    `batch_fn` takes a list of items and returns a list of results in the
+    same order. A background thread flushes the pending items as soon as
+    `max_batch_size` of them are queued or the oldest one has waited
+    `max_wait` seconds, whichever comes first.
+    """
+
+    def __init__(self, batch_fn, max_batch_size=32, max_wait=0.005, name='micro-batcher'):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, items, timeout=None):
+        """Queue items and block until their batch has run; returns their results"""
+        futures = []
+        for item in items:
+            future = Future()
+            self._queue.put((item, future))
+            futures.append(future)
+        return [future.result(timeout) for future in futures]
+
+    def _collect(self):
+        """Wait for a first item, then gather more until the batch is full or stale"""
+        pending = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(pending) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                pending.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return pending
+
+    def _run(self):
+        while True:
+            pending = self._collect()
+            items = [item for item, _ in pending]
+            try:
+                results = list(self.batch_fn(items))
+                if len(results) != len(items):
+                    raise ValueError(f"Batch function returned {len(results)} results for {len(items)} items")
+                for (_, future), result in zip(pending, results):
+                    future.set_result(result)
+            except Exception as e:
+                # Fail every request still waiting, so none of them hangs
+                for _, future in pending:
+                    if not future.done():
+                        future.set_exception(e)
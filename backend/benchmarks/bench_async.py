@@ -0,0 +1,153 @@
+"""Load-test /api/recognize on the Flask server and on the async server (asgi.py)
+
+Starts each server in a subprocess on a free port, waits for /api/health,
+then runs closed-loop clients: each sends a face photo (a camera-sized
+frame built from backend/data) as soon as its previous response arrived,
+for `--duration` seconds per concurrency level. Nobody is enrolled, so every
+request does the full decode, detection, encoding and matching and answers
+404 (not recognized). Reports throughput and p50/p99 latency of the
+requests that were served, and the share shed with 503 by the async server.
+The clients run on the same machine, so they compete with the server for CPU.
+
+Usage: python benchmarks/bench_async.py [--concurrency 1 4 16 64] [--duration 10]
+"""
+import os
+import sys
+import time
+import uuid
+import socket
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+import numpy as np
+import cv2
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FRAME_SIZE = (640, 480)
+
+SERVERS = {
+    'flask': [sys.executable, '-c',
+              "import sys, app, startup; startup.warmup(app.face_service); "
+              "app.app.run(host='127.0.0.1', port=int(sys.argv[1]), threaded=True)"],
+    'async': [sys.executable, '-m', 'uvicorn', 'asgi:app', '--host', '127.0.0.1', '--log-level', 'warning',
+              '--port']
+}
+
+
+def sample_payload():
+    """multipart/form-data body with one face photo centred on a camera frame"""
+    data_dir = os.path.join(BACKEND_DIR, 'data')
+    user_dir = os.path.join(data_dir, sorted(os.listdir(data_dir))[0])
+    face = cv2.resize(cv2.imread(os.path.join(user_dir, sorted(os.listdir(user_dir))[0])), (200, 200))
+    width, height = FRAME_SIZE
+    frame = np.full((height, width, 3), 128, dtype=np.uint8)
+    frame[140:340, 220:420] = face
+    jpeg = cv2.imencode('.jpg', frame)[1].tobytes()
+
+    boundary = uuid.uuid4().hex
+    body = (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="frame.jpg"\r\n'
+            f'Content-Type: image/jpeg\r\n\r\n').encode() + jpeg + f'\r\n--{boundary}--\r\n'.encode()
+    return body, f'multipart/form-data; boundary={boundary}'
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(kind, port, env):
+    process = subprocess.Popen(SERVERS[kind] + [str(port)], cwd=BACKEND_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 300
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{kind} server exited with code {process.returncode}")
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            conn.request('GET', '/api/health')
+            if conn.getresponse().status == 200:
+                return process
+        except OSError:
+            pass
+        time.sleep(0.5)
+    process.kill()
+    raise RuntimeError(f"{kind} server did not become ready")
+
+
+def load_test(port, body, content_type, clients, duration):
+    """(latencies of served requests in s, status code counts, elapsed)"""
+    latencies, statuses = [], {}
+    lock = threading.Lock()
+    stop = time.perf_counter() + duration
+
+    def client():
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+        while time.perf_counter() < stop:
+            start = time.perf_counter()
+            try:
+                conn.request('POST', '/api/recognize', body=body, headers={'Content-Type': content_type})
+                response = conn.getresponse()
+                response.read()
+                status = response.status
+            except OSError:
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+                status = 'error'
+            elapsed = time.perf_counter() - start
+            with lock:
+                statuses[status] = statuses.get(status, 0) + 1
+                if status not in (503, 'error'):
+                    latencies.append(elapsed)
+            if status == 503:
+                # Back off as Retry-After asks, like a well-behaved kiosk
+                time.sleep(1.0)
+        conn.close()
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, statuses, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16, 64])
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds per concurrency level')
+    parser.add_argument('--servers', nargs='+', choices=sorted(SERVERS), default=['flask', 'async'])
+    args = parser.parse_args()
+
+    body, content_type = sample_payload()
+    workdir = tempfile.mkdtemp(prefix='bench_async_')
+    env = dict(os.environ, ENABLE_DEEP_LEARNING=os.environ.get('ENABLE_DEEP_LEARNING', 'false'),
+               ATTENDANCE_DB=os.path.join(workdir, 'attendance.db'))
+
+    print(f"{'server':>6} {'clients':>8} {'req/s':>7} {'p50 ms':>8} {'p99 ms':>9} {'shed %':>7}")
+    try:
+        for kind in args.servers:
+            port = free_port()
+            process = start_server(kind, port, env)
+            try:
+                for clients in args.concurrency:
+                    latencies, statuses, elapsed = load_test(port, body, content_type, clients, args.duration)
+                    latencies = np.array(latencies) * 1000
+                    total = sum(statuses.values())
+                    p50, p99 = (np.percentile(latencies, 50), np.percentile(latencies, 99)) if len(latencies) \
+                        else (np.nan, np.nan)
+                    shed = 100.0 * statuses.get(503, 0) / total if total else 0.0
+                    print(f"{kind:>6} {clients:8d} {len(latencies) / elapsed:7.1f} {p50:8.1f} {p99:9.1f} {shed:7.1f}")
+            finally:
+                process.terminate()
+                process.wait()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
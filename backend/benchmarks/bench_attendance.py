@@ -0,0 +1,92 @@
+"""Benchmark attendance store insert throughput and query latency
+
+Usage: python benchmarks/bench_attendance.py [--records 10000000] [--users 5000] [--db /tmp/attendance_bench.db]
+"""
+import os
+import sys
+import time
+import argparse
+import datetime
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from attendance_store import AttendanceStore
+
+
+def synthetic_records(count, users, days, rng, start):
+    """Records spread over `days` days before now, in increasing time order"""
+    offsets = np.sort(rng.uniform(0, days * 86400, count))
+    user_ids = rng.integers(0, users, count)
+    for offset, user in zip(offsets, user_ids):
+        yield {
+            "userId": f"user{user}",
+            "name": f"User {user}",
+            "timestamp": (start + datetime.timedelta(seconds=float(offset))).isoformat(),
+            "confidence": 0.9
+        }
+
+
+def timed(fn, repeats=20):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - start) * 1000 / repeats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=10000000)
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--db', default='/tmp/attendance_bench.db')
+    args = parser.parse_args()
+
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(args.db + suffix):
+            os.remove(args.db + suffix)
+
+    rng = np.random.default_rng(0)
+    now = datetime.datetime.now()
+    start = now - datetime.timedelta(days=args.days)
+
+    # Bulk load through the synchronous batched path
+    store = AttendanceStore(args.db, async_writes=False)
+    began = time.perf_counter()
+    batch = []
+    for record in synthetic_records(args.records, args.users, args.days, rng, start):
+        batch.append(record)
+        if len(batch) == 10000:
+            store.add_many(batch)
+            batch = []
+    if batch:
+        store.add_many(batch)
+    bulk_s = time.perf_counter() - began
+    print(f"bulk insert: {args.records} records in {bulk_s:.1f} s ({args.records / bulk_s:,.0f} rec/s)")
+
+    # Recognition-path style single adds through the background writer
+    async_store = AttendanceStore(args.db)
+    single = list(synthetic_records(20000, args.users, 1, rng, now - datetime.timedelta(days=1)))
+    began = time.perf_counter()
+    for record in single:
+        async_store.add(record)
+    queued_s = time.perf_counter() - began
+    async_store.flush()
+    written_s = time.perf_counter() - began
+    print(f"async add:   {len(single)} records queued at {len(single) / queued_s:,.0f} rec/s, "
+          f"written at {len(single) / written_s:,.0f} rec/s")
+
+    week_ago = (now - datetime.timedelta(days=7)).isoformat()
+    queries = {
+        "latest page (100)": lambda: store.query(limit=100),
+        "page 50 (100)": lambda: store.query(limit=100, offset=4900),
+        "one user, page": lambda: store.query(user_id="user42", limit=100),
+        "last 7 days, page": lambda: store.query(start=week_ago, limit=100),
+        "user + 7 days": lambda: store.query(user_id="user42", start=week_ago, limit=100),
+        "dashboard stats": lambda: store.stats(days=7),
+    }
+    for label, query in queries.items():
+        print(f"{label:>20}: {timed(query):8.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""Load-test the micro-batching scheduler against one inference call per request
+
+Concurrent client threads each submit one face at a time. The simulated
+model has a fixed per-call overhead plus a per-face cost, which is what
+makes batching pay off on CPU; pass --keras-model to use a saved model.
+
+Usage: python benchmarks/bench_batching.py [--clients 1 8 32] [--wait-ms 5] [--batch-size 32]
+"""
+import os
+import sys
+import time
+import argparse
+import threading
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from batching import MicroBatcher
+
+
+def simulated_model(call_overhead=0.004, per_item=0.0005):
+    """Model whose calls are serialized, like a CPU already saturated by one inference"""
+    weights = np.random.default_rng(0).normal(size=(512, 512)).astype(np.float32)
+    device = threading.Lock()
+
+    def predict(batch):
+        with device:
+            time.sleep(call_overhead + per_item * len(batch))
+            return np.tanh(np.asarray(batch) @ weights)
+    return predict, (512,)
+
+
+def keras_model(path):
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+    from models.face_model import FaceRecognitionModel
+    model = FaceRecognitionModel(model_path=path)
+    return model.predict_batch, model.input_shape
+
+
+def load_test(infer_one, shape, clients, requests_per_client):
+    latencies = []
+    lock = threading.Lock()
+    item = np.zeros(shape, dtype=np.float32)
+
+    def client():
+        local = []
+        for _ in range(requests_per_client):
+            start = time.perf_counter()
+            infer_one(item)
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    latencies = np.array(latencies) * 1000
+    return np.percentile(latencies, 50), np.percentile(latencies, 99), len(latencies) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--requests', type=int, default=50, help="requests per client")
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--wait-ms', type=float, default=5)
+    parser.add_argument('--keras-model', help="path of a saved FaceRecognitionModel")
+    args = parser.parse_args()
+
+    predict, shape = keras_model(args.keras_model) if args.keras_model else simulated_model()
+    batcher = MicroBatcher(lambda items: list(predict(np.stack(items))),
+                           args.batch_size, args.wait_ms / 1000.0)
+    modes = {
+        "direct": lambda item: predict(item[None]),
+        "batched": lambda item: batcher.submit([item]),
+    }
+
+    print(f"{'clients':>7} {'mode':>8} {'p50 ms':>8} {'p99 ms':>8} {'req/s':>8}")
+    for clients in args.clients:
+        for mode, infer_one in modes.items():
+            p50, p99, rps = load_test(infer_one, shape, clients, args.requests)
+            print(f"{clients:>7} {mode:>8} {p50:>8.1f} {p99:>8.1f} {rps:>8.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""Benchmark bulk enrolment throughput against the size of the process pool
+
+Builds an intake of `--images` photos by repeating the enrolment photos in
+backend/data under distinct user ids, then encodes it with
+bulk_enrol.encode_items on pools of increasing size (store writes excluded).
+
+Usage: python benchmarks/bench_bulk_enrol.py [--images 200] [--processes 1 2 4 8]
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BACKEND_DIR)
+from bulk_enrol import IMAGE_EXTENSIONS, read_directory, encode_items
+
+
+def make_intake(directory, count, data_dir):
+    photos = [os.path.join(root, name) for root, _, names in sorted(os.walk(data_dir))
+              for name in sorted(names) if name.lower().endswith(IMAGE_EXTENSIONS)]
+    for i in range(count):
+        shutil.copy(photos[i % len(photos)], os.path.join(directory, f'student{i:05d}.jpg'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--images', type=int, default=200)
+    parser.add_argument('--processes', type=int, nargs='+',
+                        default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    parser.add_argument('--detector', default='hog')
+    args = parser.parse_args()
+
+    intake = tempfile.mkdtemp(prefix='bench_bulk_enrol_')
+    try:
+        make_intake(intake, args.images, os.path.join(BACKEND_DIR, 'data'))
+        items, _ = read_directory(intake)
+
+        print(f"{os.cpu_count()} cores, {len(items)} photos")
+        print(f"{'processes':>9} {'enrolled':>9} {'failed':>7} {'enrolments/s':>13} {'speedup':>8}")
+        baseline = None
+        for processes in args.processes:
+            start = time.perf_counter()
+            user_ids, _, _, failures = encode_items(items, processes, args.detector)
+            rate = len(user_ids) / (time.perf_counter() - start)
+            baseline = baseline or rate
+            print(f"{processes:9d} {len(user_ids):9d} {len(failures):7d} {rate:13.1f} {rate / baseline:7.1f}x")
+    finally:
+        shutil.rmtree(intake, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""Benchmark the training input pipeline: re-decoding JPEGs every epoch against the dataset cache
+
+Writes a synthetic data directory of JPEG photos, then measures images/sec
+and epoch time of the input pipeline alone (no model). The baseline is
+Keras' ImageDataGenerator.flow_from_directory when TensorFlow is installed,
+otherwise an equivalent per-image OpenCV decode/resize/warp loop. The
+cached pipeline is timed cold (decoding into the cache) and warm.
+
+Usage: python benchmarks/bench_dataset.py [--users 20] [--images 10] [--batch-size 8] [--epochs 3]
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+import cv2
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.dirname(BACKEND_DIR))
+from models.training_data import DatasetCache, BatchLoader, random_affine
+
+SIZE = (224, 224)
+
+
+def make_dataset(directory, users, images, rng):
+    for u in range(users):
+        user_dir = os.path.join(directory, f'user{u:04d}')
+        os.makedirs(user_dir)
+        for i in range(images):
+            # Smooth noise compresses like a photo rather than like static
+            photo = cv2.resize(rng.integers(0, 256, size=(60, 80, 3), dtype=np.uint8), (480, 640))
+            cv2.imwrite(os.path.join(user_dir, f'{i}.jpg'), photo)
+
+
+def keras_baseline(data_dir, batch_size):
+    from tensorflow import keras
+    generator = keras.preprocessing.image.ImageDataGenerator(
+        rescale=1.0/255, rotation_range=20, width_shift_range=0.2, height_shift_range=0.2,
+        shear_range=0.2, zoom_range=0.2, horizontal_flip=True, fill_mode='nearest'
+    ).flow_from_directory(data_dir, target_size=SIZE, batch_size=batch_size, class_mode='categorical')
+    return generator, max(generator.samples // batch_size, 1)
+
+
+def opencv_baseline(data_dir, batch_size, rng):
+    """Decode, resize and warp every image one by one, every epoch"""
+    paths = [os.path.join(root, name) for root, _, names in os.walk(data_dir) for name in names]
+
+    def batches():
+        while True:
+            order = rng.permutation(len(paths))
+            for start in range(0, len(order) - batch_size + 1, batch_size):
+                batch = np.empty((batch_size,) + SIZE + (3,), dtype=np.float32)
+                for i, index in enumerate(order[start:start + batch_size]):
+                    image = cv2.resize(cv2.imread(paths[index]), SIZE)
+                    matrix = random_affine(1, SIZE, rng)[0]
+                    image = cv2.warpAffine(image, matrix, SIZE, flags=cv2.WARP_INVERSE_MAP,
+                                           borderMode=cv2.BORDER_REPLICATE)
+                    batch[i] = image / 255.0
+                yield batch
+    return batches(), max(len(paths) // batch_size, 1)
+
+
+def time_epochs(batches, steps, epochs, batch_size):
+    start = time.perf_counter()
+    for _ in range(epochs * steps):
+        next(batches)
+    elapsed = time.perf_counter() - start
+    return epochs * steps * batch_size / elapsed, elapsed / epochs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--images', type=int, default=10)
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--epochs', type=int, default=3)
+    parser.add_argument('--workers', type=int, default=2)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    root = tempfile.mkdtemp(prefix='bench_dataset_')
+    try:
+        data_dir = os.path.join(root, 'data')
+        cache_dir = os.path.join(root, 'data_cache')
+        make_dataset(data_dir, args.users, args.images, rng)
+
+        try:
+            batches, steps = keras_baseline(data_dir, args.batch_size)
+            baseline = 'flow_from_directory'
+        except ImportError:
+            batches, steps = opencv_baseline(data_dir, args.batch_size, rng)
+            baseline = 'per-image decode'
+        rows = [(baseline,) + time_epochs(batches, steps, args.epochs, args.batch_size)]
+
+        start = time.perf_counter()
+        DatasetCache(data_dir, cache_dir, SIZE).load()
+        build = time.perf_counter() - start
+        start = time.perf_counter()
+        dataset = DatasetCache(data_dir, cache_dir, SIZE).load()
+        reload = time.perf_counter() - start
+
+        loader = BatchLoader(dataset, args.batch_size, workers=args.workers)
+        rows.append(('cached + prefetch',) + time_epochs(iter(loader), loader.steps_per_epoch,
+                                                         args.epochs, args.batch_size))
+        loader.close()
+
+        print(f"{len(dataset)} images, batch size {args.batch_size}, {args.epochs} epochs")
+        print(f"cache build {build:.2f} s (once), warm load {reload * 1000:.1f} ms")
+        print(f"{'pipeline':20} {'images/s':>10} {'epoch (s)':>10}")
+        for name, images_per_second, epoch_time in rows:
+            print(f"{name:20} {images_per_second:10.0f} {epoch_time:10.2f}")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
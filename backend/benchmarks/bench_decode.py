@@ -0,0 +1,126 @@
+"""Benchmark per-frame CPU time and allocations of decoding and preprocessing
+
+Each sample photo in backend/data is tiled four times on JPEG frames of
+several sizes. Per frame, the baseline decodes at full resolution, shrinks
+the frame for detection and preprocesses every face with float64
+division and a batch dimension per face (the previous pipeline); the fast
+path decodes at reduced resolution into RGB (models.preprocessing) and
+fills a preallocated float32 batch. Allocations are the peak of memory
+traced by tracemalloc during a frame, which includes numpy and OpenCV
+output arrays.
+
+Usage: python benchmarks/bench_decode.py [--min-width 1280] [--repeats 20]
+"""
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+import numpy as np
+import cv2
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BACKEND_DIR)
+sys.path.append(os.path.dirname(BACKEND_DIR))
+from models.preprocessing import decode_image, FaceBatchBuffer
+
+FRAME_SIZES = ((640, 480), (1920, 1080), (4032, 3024))
+INPUT_SHAPE = (224, 224, 3)
+DETECT_WIDTH = 640
+
+
+def sample_frames(width, height):
+    """(JPEG bytes, (x, y, w, h) face boxes) frames with four faces each"""
+    data_dir = os.path.join(BACKEND_DIR, 'data')
+    side = width // 6
+    frames = []
+    for user_id in sorted(os.listdir(data_dir)):
+        user_dir = os.path.join(data_dir, user_id)
+        for name in sorted(os.listdir(user_dir)):
+            face = cv2.imread(os.path.join(user_dir, name))
+            if face is None:
+                continue
+            face = cv2.resize(face, (side, side))
+            frame = np.full((height, width, 3), 127, dtype=np.uint8)
+            boxes = []
+            for i in range(4):
+                x, y = side // 2 + i * (side + side // 4), (height - side) // 2
+                frame[y:y + side, x:x + side] = face
+                boxes.append((x, y, side, side))
+            frames.append((cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes(), boxes))
+    return frames
+
+
+def detection_frame(image):
+    """The downscaled copy a FaceDetector runs on"""
+    height, width = image.shape[:2]
+    if width <= DETECT_WIDTH:
+        return image
+    return cv2.resize(image, (DETECT_WIDTH, int(round(height * DETECT_WIDTH / float(width)))),
+                      interpolation=cv2.INTER_AREA)
+
+
+def baseline(data, boxes):
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    detection_frame(image)
+    batch = np.empty((len(boxes),) + INPUT_SHAPE, dtype=np.float32)
+    for i, (x, y, w, h) in enumerate(boxes):
+        face_img = cv2.resize(image[y:y+h, x:x+w], (INPUT_SHAPE[0], INPUT_SHAPE[1]))
+        face_img = face_img / 255.0
+        face_img = np.expand_dims(face_img, axis=0)
+        batch[i] = face_img[0]
+    return batch
+
+
+def fast_path(data, boxes, buffer, min_width):
+    image, scale = decode_image(data, min_width)
+    detection_frame(image)
+    boxes = [[int(v / scale) for v in box] for box in boxes]
+    return buffer.fill(image[y:y+h, x:x+w] for x, y, w, h in boxes)
+
+
+def measure(fn, frames, repeats):
+    """(CPU ms per frame, peak traced MB per frame)"""
+    for data, boxes in frames:
+        fn(data, boxes)
+    start = time.process_time()
+    for _ in range(repeats):
+        for data, boxes in frames:
+            fn(data, boxes)
+    cpu = (time.process_time() - start) * 1000 / (repeats * len(frames))
+
+    peaks = []
+    tracemalloc.start()
+    for data, boxes in frames:
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        fn(data, boxes)
+        peaks.append(tracemalloc.get_traced_memory()[1] - base)
+    tracemalloc.stop()
+    return cpu, np.mean(peaks) / 2 ** 20
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--min-width', type=int, default=1280, help='DECODE_MIN_WIDTH of the fast path')
+    parser.add_argument('--repeats', type=int, default=20)
+    args = parser.parse_args()
+
+    buffer = FaceBatchBuffer(INPUT_SHAPE)
+    print(f"4 faces per frame, detection at {DETECT_WIDTH} px, DECODE_MIN_WIDTH={args.min_width}")
+    print(f"{'frame':>10} {'path':>9} {'decoded':>10} {'CPU ms/frame':>13} {'alloc MB/frame':>15}")
+    for width, height in FRAME_SIZES:
+        frames = sample_frames(width, height)
+        decoded, _ = decode_image(frames[0][0], args.min_width)
+        paths = (
+            ('baseline', baseline, f"{width}x{height}"),
+            ('fast', lambda data, boxes: fast_path(data, boxes, buffer, args.min_width),
+             f"{decoded.shape[1]}x{decoded.shape[0]}")
+        )
+        for name, fn, size in paths:
+            cpu, allocated = measure(fn, frames, args.repeats)
+            print(f"{f'{width}x{height}':>10} {name:>9} {size:>10} {cpu:13.2f} {allocated:15.2f}")
+
+
+if __name__ == '__main__':
+    main()
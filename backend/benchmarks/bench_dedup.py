@@ -0,0 +1,59 @@
+"""Simulate a continuous kiosk stream and report attendance write volume per policy mode
+
+Users walk past over a working day; while in view each one is recognized
+several times per second. Without a policy every recognition is a write.
+
+Usage: python benchmarks/bench_dedup.py [--users 200] [--fps 5] [--hours 8]
+"""
+import os
+import sys
+import time
+import argparse
+import datetime
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from attendance_policy import ATTENDANCE_MODES, AttendancePolicy
+
+
+def simulated_sightings(users, fps, hours, rng):
+    """(seconds since start, user_id) sorted by time"""
+    sightings = []
+    for user in range(users):
+        for _ in range(rng.integers(1, 4)):  # a few visits per user
+            arrival = rng.uniform(0, hours * 3600)
+            stay = rng.uniform(10, 600)
+            times = np.arange(arrival, min(arrival + stay, hours * 3600), 1.0 / fps)
+            sightings.extend((t, f"user{user}") for t in times)
+    sightings.sort()
+    return sightings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--fps', type=float, default=5)
+    parser.add_argument('--hours', type=float, default=8)
+    parser.add_argument('--cooldown', type=float, default=60)
+    parser.add_argument('--session-gap', type=float, default=1800)
+    args = parser.parse_args()
+
+    sightings = simulated_sightings(args.users, args.fps, args.hours, np.random.default_rng(0))
+    start = datetime.datetime(2024, 1, 1, 8)
+    print(f"{len(sightings)} recognitions ({len(sightings)} writes without a policy)")
+    print(f"{'mode':>11} {'writes':>8} {'reduction':>10} {'us/observe':>11}")
+    for mode in ATTENDANCE_MODES:
+        policy = AttendancePolicy(mode, args.cooldown, args.session_gap)
+        writes = 0
+        began = time.perf_counter()
+        for seconds, user_id in sightings:
+            events, _ = policy.observe(user_id, start + datetime.timedelta(seconds=seconds))
+            writes += len(events)
+        elapsed = time.perf_counter() - began
+        writes += len(policy.expire(start + datetime.timedelta(hours=args.hours + 24)))
+        print(f"{mode:>11} {writes:>8} {len(sightings) / max(writes, 1):>9.0f}x "
+              f"{elapsed * 1e6 / len(sightings):>11.2f}")
+
+
+if __name__ == '__main__':
+    main()
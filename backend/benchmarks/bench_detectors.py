@@ -0,0 +1,73 @@
+"""Benchmark per-frame latency and recall of the HOG, Haar and DNN face detectors
+
+Every photo in backend/data holds exactly one face. Each is placed on a
+1280x720 frame so the downscaling path is exercised; recall is the share
+of frames where a box overlaps the true face.
+
+Usage: python benchmarks/bench_detectors.py [--max-widths 0 640 320] [--repeats 3]
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import cv2
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BACKEND_DIR)
+sys.path.append(os.path.dirname(BACKEND_DIR))
+from models.face_detectors import DETECTOR_KINDS, create_detector
+from tracking import iou
+
+FRAME_SIZE = (720, 1280)
+
+
+def sample_frames():
+    data_dir = os.path.join(BACKEND_DIR, 'data')
+    frames = []
+    for user_id in sorted(os.listdir(data_dir)):
+        user_dir = os.path.join(data_dir, user_id)
+        for name in sorted(os.listdir(user_dir)):
+            face = cv2.imread(os.path.join(user_dir, name))
+            if face is None:
+                continue
+            face = cv2.cvtColor(cv2.resize(face, (300, 300)), cv2.COLOR_BGR2RGB)
+            frame = np.full(FRAME_SIZE + (3,), 127, dtype=np.uint8)
+            top, left = 200, 490
+            frame[top:top + 300, left:left + 300] = face
+            frames.append((frame, (top, left + 300, top + 300, left)))
+    return frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--max-widths', type=int, nargs='+', default=[0, 640, 320],
+                        help="detection widths, 0 = full resolution")
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    frames = sample_frames()
+    print(f"{len(frames)} frames of {FRAME_SIZE[1]}x{FRAME_SIZE[0]}")
+    print(f"{'detector':>8} {'width':>6} {'ms/frame':>9} {'recall':>7}")
+    for kind in DETECTOR_KINDS:
+        for max_width in args.max_widths:
+            try:
+                detector = create_detector(kind, max_width=max_width or None)
+                detector.detect(frames[0][0])
+            except (ImportError, FileNotFoundError) as e:
+                print(f"{kind:>8} skipped: {e}")
+                break
+
+            hits = 0
+            start = time.perf_counter()
+            for _ in range(args.repeats):
+                for frame, truth in frames:
+                    boxes = detector.detect(frame)
+                    hits += any(iou(box, truth) >= 0.3 for box in boxes)
+            elapsed_ms = (time.perf_counter() - start) * 1000 / (args.repeats * len(frames))
+            recall = hits / float(args.repeats * len(frames))
+            print(f"{kind:>8} {max_width or FRAME_SIZE[1]:>6} {elapsed_ms:>9.1f} {recall:>7.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""Benchmark enrolment time and recognition latency of the embedding and softmax deep learning paths
+
+Uses synthetic face crops (random images, so accuracy is not measured).
+Enrolling one more user costs a full train + fine_tune of a fresh softmax
+classifier, but a single forward pass in embedding mode. Recognition is
+timed on a preprocessed face batch, without detection, against a gallery
+of `--gallery` enrolled embeddings.
+
+Usage: python benchmarks/bench_embedding.py [--users 10] [--images 4] [--epochs 15 5] [--gallery 1000]
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+import cv2
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BACKEND_DIR)
+sys.path.append(os.path.dirname(BACKEND_DIR))
+from face_index import FlatIndex
+from models.face_model import FaceRecognitionModel
+
+CROP = 160
+
+
+def make_dataset(directory, users, images, rng):
+    for u in range(users):
+        user_dir = os.path.join(directory, f'user{u:04d}')
+        os.makedirs(user_dir)
+        for i in range(images):
+            crop = rng.integers(0, 256, size=(CROP, CROP, 3), dtype=np.uint8)
+            cv2.imwrite(os.path.join(user_dir, f'{i}.jpg'), crop)
+
+
+def timed(fn, repeats):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--images', type=int, default=4)
+    parser.add_argument('--epochs', type=int, nargs=2, default=[15, 5], metavar=('TRAIN', 'FINE_TUNE'))
+    parser.add_argument('--gallery', type=int, default=1000)
+    parser.add_argument('--faces', type=int, default=1)
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    data_dir = tempfile.mkdtemp(prefix='bench_embedding_')
+    try:
+        make_dataset(data_dir, args.users, args.images, rng)
+        crop = rng.integers(0, 256, size=(CROP, CROP, 3), dtype=np.uint8)
+        face = (0, 0, CROP, CROP)
+
+        # Softmax: a new user means a classifier over every user, trained from scratch
+        softmax = FaceRecognitionModel(num_classes=args.users)
+        start = time.perf_counter()
+        softmax.train(data_dir, epochs=args.epochs[0], batch_size=8)
+        softmax.fine_tune(data_dir, epochs=args.epochs[1], batch_size=8)
+        softmax_enrol = time.perf_counter() - start
+
+        # Embedding: a new user is one forward pass and a gallery insert
+        embedding = FaceRecognitionModel(mode='embedding')
+        gallery = FlatIndex(dim=embedding.embedding_dim)
+        vectors = rng.standard_normal((args.gallery, embedding.embedding_dim)).astype(np.float32)
+        gallery.add_many([f'user{i:06d}' for i in range(args.gallery)],
+                         vectors / np.linalg.norm(vectors, axis=1, keepdims=True))
+        embedding.warmup()
+
+        def enrol():
+            batch = embedding.preprocess_faces(crop, [face])
+            gallery.add('new-user', embedding.embed_faces(batch)[0])
+        embedding_enrol = timed(enrol, args.repeats)
+
+        frame = np.tile(crop, (1, args.faces, 1))
+        faces = [(i * CROP, 0, CROP, CROP) for i in range(args.faces)]
+        softmax.warmup()
+
+        def recognize_softmax():
+            batch = softmax.preprocess_faces(frame, faces)
+            softmax.decode_predictions(faces, softmax.predict_batch(batch))
+
+        def recognize_embedding():
+            batch = embedding.preprocess_faces(frame, faces)
+            embedding.decode_matches(faces, gallery.match_many(embedding.embed_faces(batch), tolerance=0.77))
+
+        print(f"{'path':10} {'enrol one user':>16} {'recognize (ms)':>16}")
+        print(f"{'softmax':10} {softmax_enrol:14.1f} s {timed(recognize_softmax, args.repeats) * 1000:16.1f}")
+        print(f"{'embedding':10} {embedding_enrol * 1000:13.1f} ms {timed(recognize_embedding, args.repeats) * 1000:16.1f}")
+        print(f"softmax: {args.users} users x {args.images} images, {sum(args.epochs)} epochs; "
+              f"embedding: gallery of {args.gallery}, {args.faces} face(s) per frame")
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
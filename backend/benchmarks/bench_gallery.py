@@ -0,0 +1,64 @@
+"""Benchmark best-match latency of the gallery matrix against gallery size
+
+Usage: python benchmarks/bench_gallery.py [--sizes 1000 10000 100000]
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from gallery import FaceGallery
+
+
+def loop_match(encodings, ids, query, tolerance=0.6):
+    """Baseline: the old per-user loop, first match under tolerance wins"""
+    for user_id, stored in zip(ids, encodings):
+        distance = np.linalg.norm(stored - query)
+        if distance <= tolerance:
+            return user_id, distance
+    return None, None
+
+
+def bench(size, queries=50, seed=0):
+    rng = np.random.default_rng(seed)
+    encodings = rng.normal(0, 0.1, (size, 128)).astype(np.float32)
+    ids = [f"user_{i}" for i in range(size)]
+
+    gallery = FaceGallery()
+    start = time.perf_counter()
+    gallery.add_many(ids, encodings)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    probes = encodings[rng.integers(0, size, queries)] + rng.normal(0, 0.01, (queries, 128)).astype(np.float32)
+
+    start = time.perf_counter()
+    for probe in probes:
+        gallery.match(probe)
+    vector_ms = (time.perf_counter() - start) * 1000 / queries
+
+    # The per-user loop is too slow to run many queries on big galleries
+    loop_queries = max(1, min(queries, 200000 // size))
+    start = time.perf_counter()
+    for probe in probes[:loop_queries]:
+        loop_match(encodings, ids, probe, tolerance=-1.0)
+    loop_ms = (time.perf_counter() - start) * 1000 / loop_queries
+
+    return {"size": size, "build_ms": build_ms, "vectorized_ms": vector_ms, "loop_ms": loop_ms}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--queries', type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"{'size':>8} {'build ms':>10} {'vectorized ms':>14} {'loop ms':>10}")
+    for size in args.sizes:
+        r = bench(size, args.queries)
+        print(f"{r['size']:>8} {r['build_ms']:>10.2f} {r['vectorized_ms']:>14.3f} {r['loop_ms']:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""Benchmark adding one user to the softmax model: incremental update against full retraining
+
+For each number of existing identities, a model over them is built, then
+one more user is added either with FaceRecognitionModel.update (head
+extended, new images plus a replay sample) or by training a fresh model
+on every user. Synthetic face crops are used, so accuracy is not measured;
+the dataset cache is built before timing.
+
+Usage: python benchmarks/bench_incremental.py [--identities 10 50 200] [--images 5] [--epochs 5]
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+import cv2
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.dirname(BACKEND_DIR))
+from models.face_model import FaceRecognitionModel
+
+CROP = 160
+
+
+def add_users(data_dir, first, count, images, rng):
+    for u in range(first, first + count):
+        user_dir = os.path.join(data_dir, f'user{u:05d}')
+        os.makedirs(user_dir)
+        for i in range(images):
+            crop = cv2.resize(rng.integers(0, 256, size=(20, 20, 3), dtype=np.uint8), (CROP, CROP))
+            cv2.imwrite(os.path.join(user_dir, f'{i}.jpg'), crop)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--identities', type=int, nargs='+', default=[10, 50, 200])
+    parser.add_argument('--images', type=int, default=5)
+    parser.add_argument('--epochs', type=int, default=5)
+    parser.add_argument('--replay', type=int, default=5)
+    parser.add_argument('--batch-size', type=int, default=8)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'identities':>10} {'update (s)':>12} {'full train (s)':>16} {'speedup':>8}")
+    for identities in args.identities:
+        root = tempfile.mkdtemp(prefix='bench_incremental_')
+        try:
+            data_dir = os.path.join(root, 'data')
+            add_users(data_dir, 0, identities, args.images, rng)
+
+            # An existing model over `identities` users (trained briefly; only the timing matters)
+            model = FaceRecognitionModel(num_classes=identities)
+            model.train(data_dir, epochs=1, batch_size=args.batch_size)
+
+            add_users(data_dir, identities, 1, args.images, rng)
+            model.load_dataset(data_dir)
+
+            start = time.perf_counter()
+            model.update(data_dir, epochs=args.epochs, batch_size=args.batch_size, replay_per_class=args.replay)
+            update = time.perf_counter() - start
+
+            full = FaceRecognitionModel(num_classes=identities + 1)
+            start = time.perf_counter()
+            full.train(data_dir, epochs=args.epochs, batch_size=args.batch_size)
+            retrain = time.perf_counter() - start
+
+            print(f"{identities:10d} {update:12.1f} {retrain:16.1f} {retrain / update:7.1f}x")
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+    print(f"{args.images} images per user, {args.epochs} epochs, replay {args.replay} images per existing user")
+
+
+if __name__ == '__main__':
+    main()
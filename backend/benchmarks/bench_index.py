@@ -0,0 +1,61 @@
+"""Benchmark recall and latency of the approximate IVF index against the exact flat index
+
+Usage: python benchmarks/bench_index.py [--size 100000] [--nprobe 1 4 8 16]
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from face_index import create_index
+
+
+def synthetic_gallery(size, seed=0):
+    """Clustered random encodings, closer to real face embeddings than pure noise"""
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(0, 0.15, (max(1, size // 500), 128))
+    encodings = centres[rng.integers(0, len(centres), size)] + rng.normal(0, 0.05, (size, 128))
+    return [f"user_{i}" for i in range(size)], encodings.astype(np.float32), rng
+
+
+def timed_queries(index, probes):
+    start = time.perf_counter()
+    answers = [index.match(probe, tolerance=10.0, k=1)["user"] for probe in probes]
+    return answers, (time.perf_counter() - start) * 1000 / len(probes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--nlist', type=int, default=0)
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 4, 8, 16])
+    args = parser.parse_args()
+
+    ids, encodings, rng = synthetic_gallery(args.size)
+    rows = rng.integers(0, args.size, args.queries)
+    probes = encodings[rows] + rng.normal(0, 0.02, (args.queries, 128)).astype(np.float32)
+
+    flat = create_index('flat')
+    flat.add_many(ids, encodings)
+    truth, flat_ms = timed_queries(flat, probes)
+
+    start = time.perf_counter()
+    ivf = create_index('ivf', nlist=args.nlist or None, train_threshold=1)
+    ivf.add_many(ids, encodings)
+    build_s = time.perf_counter() - start
+
+    print(f"gallery size {args.size}, {len(ivf.centroids)} lists, IVF build {build_s:.1f} s")
+    print(f"{'index':>10} {'recall@1':>9} {'ms/query':>9}")
+    print(f"{'flat':>10} {1.0:>9.3f} {flat_ms:>9.3f}")
+    for nprobe in args.nprobe:
+        ivf.nprobe = nprobe
+        answers, ivf_ms = timed_queries(ivf, probes)
+        recall = np.mean([a == t for a, t in zip(answers, truth)])
+        print(f"{'ivf/' + str(nprobe):>10} {recall:>9.3f} {ivf_ms:>9.3f}")
+
+
+if __name__ == '__main__':
+    main()
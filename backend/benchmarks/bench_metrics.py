@@ -0,0 +1,77 @@
+"""Benchmark the overhead of the metrics and of the sampling profiler
+
+Reports the cost of one timing span, counter increment and histogram
+observation, the time to render /metrics, and how much the sampling
+profiler slows down a CPU-bound stand-in for the recognition pipeline at
+several sampling intervals.
+
+Usage: python benchmarks/bench_metrics.py [--calls 200000] [--intervals 1 5 10]
+"""
+import os
+import sys
+import time
+import argparse
+import threading
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BACKEND_DIR)
+from metrics import span, registry, REQUESTS, REQUEST_SECONDS
+from profiler import SamplingProfiler
+
+
+def per_call(fn, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - start) / calls
+
+
+def timed_span():
+    with span('bench'):
+        pass
+
+
+def workload(seconds):
+    """Calls per second of a CPU-bound loop with a few threads, as under a threaded server"""
+    done = [0]
+    deadline = time.perf_counter() + seconds
+
+    def work():
+        while time.perf_counter() < deadline:
+            sum(i * i for i in range(2000))
+            done[0] += 1
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return done[0] / seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--calls', type=int, default=200000)
+    parser.add_argument('--intervals', type=float, nargs='+', default=[1, 5, 10], help='Sampling intervals (ms)')
+    parser.add_argument('--seconds', type=float, default=3.0)
+    args = parser.parse_args()
+
+    print(f"{'operation':28} {'cost (us)':>10}")
+    print(f"{'span':28} {per_call(timed_span, args.calls) * 1e6:10.2f}")
+    print(f"{'counter inc':28} {per_call(lambda: REQUESTS.inc(endpoint='/bench', method='GET', status='200'), args.calls) * 1e6:10.2f}")
+    print(f"{'histogram observe':28} {per_call(lambda: REQUEST_SECONDS.observe(0.01, endpoint='/bench', method='GET'), args.calls) * 1e6:10.2f}")
+    print(f"{'render /metrics':28} {per_call(registry.render, 1000) * 1e6:10.2f}")
+
+    baseline = workload(args.seconds)
+    print(f"\n{'profiler':14} {'calls/s':>10} {'slowdown':>9} {'samples':>8}")
+    print(f"{'off':14} {baseline:10.0f} {0:8.1f}% {0:8d}")
+    for interval in args.intervals:
+        profiler = SamplingProfiler(interval / 1000.0)
+        profiler.start()
+        rate = workload(args.seconds)
+        profiler.stop()
+        print(f"{f'every {interval:g} ms':14} {rate:10.0f} {(1 - rate / baseline) * 100:8.1f}% {profiler.samples:8d}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""Benchmark faces-per-second of multi-face batch recognition against per-face recognition
+
+Builds group frames by tiling the enrolment photos in backend/data, then
+times the old per-face encode/compare path and the batched path of
+FaceRecognitionService.
+
+Usage: python benchmarks/bench_multiface.py [--faces 5 20 40] [--repeats 3]
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import cv2
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BACKEND_DIR)
+from gallery import FaceGallery
+
+TILE = 200
+
+
+def load_faces(data_dir):
+    faces = []
+    for user_id in sorted(os.listdir(data_dir)):
+        user_dir = os.path.join(data_dir, user_id)
+        for name in sorted(os.listdir(user_dir)):
+            image = cv2.imread(os.path.join(user_dir, name))
+            if image is not None:
+                faces.append((user_id, cv2.resize(image, (TILE, TILE))))
+    return faces
+
+
+def group_frame(faces, count):
+    """Tile `count` faces (repeating the sample set) into one frame"""
+    columns = int(np.ceil(np.sqrt(count)))
+    rows = int(np.ceil(count / columns))
+    frame = np.full((rows * TILE, columns * TILE, 3), 255, dtype=np.uint8)
+    for i in range(count):
+        r, c = divmod(i, columns)
+        frame[r * TILE:(r + 1) * TILE, c * TILE:(c + 1) * TILE] = faces[i % len(faces)][1]
+    return frame
+
+
+def per_face(image, locations, gallery):
+    import face_recognition
+    for location in locations:
+        encoding = face_recognition.face_encodings(image, [location])[0]
+        gallery.match(encoding)
+
+
+def batched(image, locations, gallery):
+    import face_recognition
+    gallery.match_many(face_recognition.face_encodings(image, locations))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--faces', type=int, nargs='+', default=[5, 20, 40])
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--gallery-size', type=int, default=10000)
+    args = parser.parse_args()
+
+    import face_recognition
+    faces = load_faces(os.path.join(BACKEND_DIR, 'data'))
+    rng = np.random.default_rng(0)
+    gallery = FaceGallery()
+    gallery.add_many([f"user_{i}" for i in range(args.gallery_size)],
+                     rng.normal(0, 0.1, (args.gallery_size, 128)))
+
+    print(f"{'faces':>6} {'detected':>9} {'per-face f/s':>13} {'batched f/s':>12}")
+    for count in args.faces:
+        image = cv2.cvtColor(group_frame(faces, count), cv2.COLOR_BGR2RGB)
+        locations = face_recognition.face_locations(image)
+        if not locations:
+            continue
+        timings = {}
+        for name, path in (('per-face', per_face), ('batched', batched)):
+            start = time.perf_counter()
+            for _ in range(args.repeats):
+                path(image, locations, gallery)
+            timings[name] = len(locations) * args.repeats / (time.perf_counter() - start)
+        print(f"{count:>6} {len(locations):>9} {timings['per-face']:>13.1f} {timings['batched']:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
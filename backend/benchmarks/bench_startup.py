@@ -0,0 +1,55 @@
+"""Benchmark worker cold start with and without the TensorFlow deep learning path
+
+Each measurement runs in a fresh interpreter: import of the Flask app,
+then startup.warmup(), with ENABLE_DEEP_LEARNING set to false and true.
+
+Usage: python benchmarks/bench_startup.py [--repeats 3]
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COLD_START = r'''
+import sys, time, json
+start = time.perf_counter()
+sys.path.insert(0, sys.argv[1])
+import app
+imported = time.perf_counter() - start
+from startup import warmup
+state = warmup(app.face_service)
+print(json.dumps({
+    "import_s": imported,
+    "ready_s": time.perf_counter() - start,
+    "tensorflow_loaded": "tensorflow" in sys.modules,
+    "timings_ms": state.timings
+}))
+'''
+
+
+def cold_start(deep_learning):
+    env = dict(os.environ, ENABLE_DEEP_LEARNING='true' if deep_learning else 'false')
+    out = subprocess.run([sys.executable, '-c', COLD_START, BACKEND_DIR], cwd=BACKEND_DIR,
+                         env=env, check=True, capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    for deep_learning in (False, True):
+        runs = [cold_start(deep_learning) for _ in range(args.repeats)]
+        best = min(runs, key=lambda r: r["ready_s"])
+        print(f"ENABLE_DEEP_LEARNING={str(deep_learning).lower():5} "
+              f"import {best['import_s']:.2f} s, ready {best['ready_s']:.2f} s, "
+              f"tensorflow loaded: {best['tensorflow_loaded']}")
+        print(f"    {best['timings_ms']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Benchmark gallery startup from per-user pickles against the consolidated encoding store
+
+Runs each loader in a fresh interpreter and reports wall time and peak
+resident memory.
+
+Usage: python benchmarks/bench_store.py [--size 100000] [--workdir /tmp/face_store_bench]
+"""
+import os
+import sys
+import json
+import pickle
+import shutil
+import argparse
+import subprocess
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BACKEND_DIR)
+from encoding_store import EncodingStore
+
+LOADER = r'''
+import os, sys, time, json, pickle, resource
+sys.path.append(sys.argv[3])
+import numpy as np
+from gallery import FaceGallery
+from face_index import FlatIndex
+from encoding_store import EncodingStore
+
+mode, directory = sys.argv[1], sys.argv[2]
+start = time.perf_counter()
+if mode == 'pickle':
+    ids, encodings = [], []
+    for name in os.listdir(directory):
+        if name.endswith('.pkl'):
+            with open(os.path.join(directory, name), 'rb') as f:
+                encodings.append(pickle.load(f))
+            ids.append(name.split('.')[0])
+    gallery = FaceGallery()
+    gallery.add_many(ids, encodings)
+else:
+    ids, matrix = EncodingStore(directory).load()
+    gallery = FlatIndex.from_matrix(ids, matrix)
+elapsed = time.perf_counter() - start
+gallery.match(np.zeros(128))
+print(json.dumps({"seconds": elapsed, "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}))
+'''
+
+
+def run_loader(mode, directory):
+    out = subprocess.run([sys.executable, '-c', LOADER, mode, directory, BACKEND_DIR],
+                         check=True, capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=int, default=100000)
+    parser.add_argument('--workdir', default='/tmp/face_store_bench')
+    args = parser.parse_args()
+
+    pickle_dir = os.path.join(args.workdir, 'pickles')
+    store_dir = os.path.join(args.workdir, 'store')
+    shutil.rmtree(args.workdir, ignore_errors=True)
+    os.makedirs(pickle_dir)
+
+    rng = np.random.default_rng(0)
+    for i in range(args.size):
+        with open(os.path.join(pickle_dir, f"user{i}.pkl"), 'wb') as f:
+            pickle.dump(rng.normal(0, 0.1, 128), f)
+    EncodingStore(store_dir).migrate_pickles(pickle_dir)
+
+    # Both loaders run against a warm page cache
+    print(f"{args.size} identities")
+    for mode, directory in (('pickle', pickle_dir), ('store', store_dir)):
+        result = run_loader(mode, directory)
+        print(f"{mode:>7}: startup {result['seconds'] * 1000:9.1f} ms, peak RSS {result['max_rss_mb']:7.1f} MB")
+
+    shutil.rmtree(args.workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""Benchmark the TFLite exports of the trained model against the Keras SavedModel
+
+Exports the saved softmax model to TFLite as float32, float16 and int8
+(calibrated on the backend/data crops), then loads each variant in a fresh
+process and reports model size, peak RSS, single-face and batch latency,
+and top-1 accuracy on the backend/data crops plus agreement with Keras.
+
+Usage: python benchmarks/bench_tflite.py [--model ../models/face_recognition_model] [--repeats 50]
+"""
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ROOT_DIR = os.path.dirname(BACKEND_DIR)
+sys.path.append(ROOT_DIR)
+
+MEASURE = r'''
+import sys, time, json, resource
+import numpy as np
+sys.path.insert(0, sys.argv[1])
+from models.face_model import FaceRecognitionModel
+model_path, backend, data_dir, repeats = sys.argv[2], sys.argv[3], sys.argv[4], int(sys.argv[5])
+
+start = time.perf_counter()
+model = FaceRecognitionModel(model_path=model_path, backend=backend)
+model.warmup()
+load = time.perf_counter() - start
+
+dataset = model.load_dataset(data_dir)
+images = dataset.images[:].astype(np.float32) * (1.0 / 255)
+labels = model._label_map(dataset)[dataset.labels]
+
+def latency(batch):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        model.predict_batch(batch)
+        times.append(time.perf_counter() - start)
+    return float(np.median(times))
+
+predictions = np.concatenate([model.predict_batch(images[i:i + 32]) for i in range(0, len(images), 32)])
+print(json.dumps({
+    "load_s": load,
+    "single_ms": latency(images[:1]) * 1000,
+    "batch8_ms": latency(np.resize(images, (8,) + images.shape[1:])) * 1000,
+    "predicted": predictions.argmax(axis=1).tolist(),
+    "accuracy": float((predictions.argmax(axis=1) == labels).mean()),
+    "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+}))
+'''
+
+
+def size_of(path):
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(root, name))
+                   for root, _, names in os.walk(path) for name in names)
+    return os.path.getsize(path)
+
+
+def measure(model_path, backend, data_dir, repeats):
+    out = subprocess.run([sys.executable, '-c', MEASURE, ROOT_DIR, model_path, backend, data_dir, str(repeats)],
+                         check=True, capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--model', default=os.path.join(ROOT_DIR, 'models', 'face_recognition_model'))
+    parser.add_argument('--data', default=os.path.join(BACKEND_DIR, 'data'))
+    parser.add_argument('--repeats', type=int, default=50)
+    args = parser.parse_args()
+
+    from models.face_model import FaceRecognitionModel
+
+    workdir = tempfile.mkdtemp(prefix='bench_tflite_')
+    try:
+        # Work on a copy so the exports never touch the deployed model
+        model_path = os.path.join(workdir, 'model')
+        if os.path.isdir(args.model):
+            shutil.copytree(args.model, model_path)
+        else:
+            shutil.copy(args.model, model_path)
+        shutil.copy(args.model + '_classes.pkl', model_path + '_classes.pkl')
+
+        rows = [('keras', size_of(model_path), measure(model_path, 'keras', args.data, args.repeats))]
+        keras_model = FaceRecognitionModel(model_path=model_path)
+        for quantization in ('float32', 'float16', 'int8'):
+            variant = os.path.join(workdir, quantization)
+            os.symlink(model_path, variant)
+            shutil.copy(model_path + '_classes.pkl', variant + '_classes.pkl')
+            size = keras_model.export_tflite(variant + '.tflite', quantization, calibration_dir=args.data)
+            rows.append((f'tflite {quantization}', size, measure(variant, 'tflite', args.data, args.repeats)))
+
+        reference = rows[0][2]["predicted"]
+        print(f"{'backend':16} {'size (MB)':>10} {'RSS (MB)':>9} {'load (s)':>9} {'1 face (ms)':>12} "
+              f"{'8 faces (ms)':>13} {'accuracy':>9} {'agreement':>10}")
+        for name, size, result in rows:
+            agreement = sum(a == b for a, b in zip(result["predicted"], reference)) / max(len(reference), 1)
+            print(f"{name:16} {size / 1e6:10.1f} {result['rss_mb']:9.0f} {result['load_s']:9.2f} "
+                  f"{result['single_ms']:12.1f} {result['batch8_ms']:13.1f} "
+                  f"{result['accuracy']:9.3f} {agreement:10.3f}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
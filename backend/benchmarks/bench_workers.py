@@ -0,0 +1,160 @@
+"""Benchmark per-worker memory and the visibility lag of a registration across workers
+
+Forks `--workers` processes the way gunicorn does (after preloading the
+face_recognition models in the parent when installed), each serving a
+FaceRecognitionService over the same gallery: `--gallery` encodings in the
+store file plus `--log-records` enrolments in its log. Reports RSS and PSS
+(shared pages split between the processes) per worker, then has worker 0
+register new users while the others handle a request every
+`--request-interval-ms` and records when each registration first matches.
+Runs with MULTI_WORKER off (separate in-memory galleries) and on.
+
+Usage: python benchmarks/bench_workers.py [--workers 4] [--gallery 100000] [--registrations 20]
+"""
+import os
+import sys
+import time
+import json
+import shutil
+import argparse
+import tempfile
+import subprocess
+import multiprocessing
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BACKEND_DIR)
+
+
+def memory_mb():
+    values = {}
+    for path, key in (('/proc/self/status', 'VmRSS:'), ('/proc/self/smaps_rollup', 'Pss:')):
+        with open(path) as f:
+            for line in f:
+                if line.startswith(key):
+                    values[key.rstrip(':').lower()] = int(line.split()[1]) / 1024
+    return values
+
+
+def worker(index, encodings_dir, args, conn):
+    from model_integration import FaceRecognitionService
+    service = FaceRecognitionService(encodings_dir=encodings_dir, data_dir=os.path.join(encodings_dir, 'data'))
+    service.match_encodings(np.zeros((1, 128), dtype=np.float32))
+    conn.send(memory_mb())
+
+    rng = np.random.default_rng(index)
+    while True:
+        command = conn.recv()
+        if command is None:
+            return
+        user_id, encoding, timeout = command
+        if index == 0:
+            service.register_many([user_id], encoding[None])
+            conn.send(time.time())
+            continue
+        # Handle a "request" every interval until the new user is recognized
+        deadline = time.time() + timeout
+        seen = None
+        while time.time() < deadline:
+            if service.match_encodings([encoding])[0]["user"] == user_id:
+                seen = time.time()
+                break
+            service.match_encodings(rng.normal(0, 0.1, (1, 128)))
+            time.sleep(args.request_interval_ms / 1000.0)
+        conn.send(seen)
+
+
+def run(mode, encodings_dir, args):
+    """One measurement in this (fresh) process; prints a JSON result line"""
+    os.environ['MULTI_WORKER'] = 'true' if mode == 'shared' else 'false'
+    preloaded = False
+    try:
+        from startup import preload_shared
+        preload_shared()
+        preloaded = True
+    except ImportError:
+        pass
+
+    context = multiprocessing.get_context('fork')
+    pipes, processes = [], []
+    for i in range(args.workers):
+        parent, child = context.Pipe()
+        process = context.Process(target=worker, args=(i, encodings_dir, args, child))
+        process.start()
+        pipes.append(parent)
+        processes.append(process)
+    memory = [conn.recv() for conn in pipes]
+
+    rng = np.random.default_rng(1)
+    lags, missed = [], 0
+    for n in range(args.registrations):
+        user_id = f"{mode}_new_{n}"
+        encoding = rng.normal(0, 0.1, 128).astype(np.float32)
+        for conn in pipes[1:]:
+            conn.send((user_id, encoding, args.timeout))
+        pipes[0].send((user_id, encoding, args.timeout))
+        written = pipes[0].recv()
+        for conn in pipes[1:]:
+            seen = conn.recv()
+            if seen is None:
+                missed += 1
+            else:
+                lags.append(max(seen - written, 0.0))
+    for conn in pipes:
+        conn.send(None)
+    for process in processes:
+        process.join()
+
+    print(json.dumps({"preloaded": preloaded, "memory": memory, "lags": lags, "missed": missed}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--gallery', type=int, default=100000)
+    parser.add_argument('--log-records', type=int, default=500)
+    parser.add_argument('--registrations', type=int, default=20)
+    parser.add_argument('--request-interval-ms', type=float, default=20)
+    parser.add_argument('--timeout', type=float, default=1.0, help='Seconds to wait for a registration to show up')
+    parser.add_argument('--run', choices=('private', 'shared'), help=argparse.SUPPRESS)
+    parser.add_argument('--dir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run(args.run, args.dir, args)
+        return
+
+    from encoding_store import EncodingStore
+    root = tempfile.mkdtemp(prefix='bench_workers_')
+    try:
+        rng = np.random.default_rng(0)
+        store = EncodingStore(root)
+        store.write([f'user{i:07d}' for i in range(args.gallery)],
+                    rng.normal(0, 0.1, (args.gallery, 128)).astype(np.float32))
+        store.append_many([f'late{i:05d}' for i in range(args.log_records)],
+                          rng.normal(0, 0.1, (args.log_records, 128)).astype(np.float32))
+
+        print(f"{args.workers} workers, {args.gallery} encodings + {args.log_records} in the log, "
+              f"a request every {args.request_interval_ms:g} ms per worker")
+        print(f"{'mode':8} {'RSS/worker (MB)':>16} {'PSS/worker (MB)':>16} {'lag p50 (ms)':>13} "
+              f"{'lag p95 (ms)':>13} {'not seen':>9}")
+        for mode in ('private', 'shared'):
+            # Copy the store so each mode starts from the same state
+            encodings_dir = os.path.join(root, mode)
+            shutil.copytree(root, encodings_dir, ignore=shutil.ignore_patterns('private', 'shared'))
+            out = subprocess.run([sys.executable, os.path.abspath(__file__), '--run', mode, '--dir', encodings_dir]
+                                 + sys.argv[1:], check=True, capture_output=True, text=True).stdout
+            result = json.loads(out.strip().splitlines()[-1])
+            rss = np.mean([m['vmrss'] for m in result['memory']])
+            pss = np.mean([m.get('pss', np.nan) for m in result['memory']])
+            lags = np.array(result['lags']) * 1000
+            p50, p95 = (np.percentile(lags, 50), np.percentile(lags, 95)) if len(lags) else (np.nan, np.nan)
+            print(f"{mode:8} {rss:16.1f} {pss:16.1f} {p50:13.1f} {p95:13.1f} {result['missed']:9d}")
+        if not result['preloaded']:
+            print("face_recognition is not installed: its models were not preloaded")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,465 @@
+"""End-to-end benchmark suite of recognition, enrolment and training, written to JSON
+
+Runs offline in a temporary workspace with a fixed seed. Synthetic
+galleries of `--gallery-sizes` random 128-d encodings are written to an
+encoding store, and the photos in backend/data are placed on camera-sized
+frames (their own encodings are added to the galleries so they match).
+
+Scenarios:
+  gallery_load     EncodingStore load into the gallery index
+  match            gallery matching of 1 and 8 encodings
+  recognize        FaceRecognitionService single- and multi-face latency,
+                   with a per-stage breakdown from the metrics spans
+  enrolment        register_user and batched register_many throughput
+  api              /api/recognize through the Flask test client under concurrency
+  training         FaceRecognitionModel training epoch time on backend/data
+
+Scenarios whose dependencies (face_recognition, TensorFlow) are missing are
+recorded as skipped. Results go to benchmarks/results/<commit>.json unless
+--output is given; --compare prints the change of every metric against
+an earlier results file and flags regressions beyond --tolerance.
+
+Usage: python benchmarks/run_suite.py [--gallery-sizes 1000 10000 100000] [--only match api] [--compare old.json]
+"""
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import importlib.util
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+import numpy as np
+import cv2
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+sys.path.append(BACKEND_DIR)
+sys.path.append(os.path.dirname(BACKEND_DIR))
+from models.preprocessing import to_bgr
+
+SCENARIOS = ('gallery_load', 'match', 'recognize', 'enrolment', 'api', 'training')
+FRAME_SIZE = (640, 480)
+TILE = 200
+
+
+def latency(times):
+    times = np.asarray(times) * 1000
+    return {
+        "n": int(len(times)),
+        "mean_ms": float(times.mean()),
+        "p50_ms": float(np.percentile(times, 50)),
+        "p95_ms": float(np.percentile(times, 95)),
+        "p99_ms": float(np.percentile(times, 99))
+    }
+
+
+def repeat(fn, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=BACKEND_DIR, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=BACKEND_DIR,
+                                    capture_output=True, text=True).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def load_faces(data_dir):
+    """(user_id, RGB face photo resized to TILE x TILE) of every photo in backend/data"""
+    faces = []
+    for user_id in sorted(os.listdir(data_dir)):
+        user_dir = os.path.join(data_dir, user_id)
+        if not os.path.isdir(user_dir):
+            continue
+        for name in sorted(os.listdir(user_dir)):
+            image = cv2.imread(os.path.join(user_dir, name))
+            if image is not None:
+                faces.append((user_id, cv2.cvtColor(cv2.resize(image, (TILE, TILE)), cv2.COLOR_BGR2RGB)))
+    return faces
+
+
+def single_frame(face):
+    """One face centred on a camera-sized frame"""
+    width, height = FRAME_SIZE
+    frame = np.full((height, width, 3), 128, dtype=np.uint8)
+    top, left = (height - TILE) // 2, (width - TILE) // 2
+    frame[top:top + TILE, left:left + TILE] = face
+    return frame
+
+
+def group_frame(faces, count):
+    """`count` faces (repeating the sample set) tiled side by side"""
+    columns = int(np.ceil(np.sqrt(count)))
+    rows = int(np.ceil(count / columns))
+    margin = TILE // 4
+    frame = np.full((rows * (TILE + margin) + margin, columns * (TILE + margin) + margin, 3), 128, dtype=np.uint8)
+    for i in range(count):
+        r, c = divmod(i, columns)
+        top, left = margin + r * (TILE + margin), margin + c * (TILE + margin)
+        frame[top:top + TILE, left:left + TILE] = faces[i % len(faces)][1]
+    return frame
+
+
+class Workspace:
+    """Synthetic galleries and services shared by the scenarios"""
+
+    def __init__(self, root, args):
+        self.root = root
+        self.args = args
+        self.faces = load_faces(os.path.join(BACKEND_DIR, 'data'))
+        self._services = {}
+        self._sample_encodings = None
+
+    def encodings_dir(self, size):
+        return os.path.join(self.root, f'gallery_{size}')
+
+    def write_gallery(self, size):
+        """Write a store of `size` random encodings (seeded by size, so identical across runs)"""
+        from encoding_store import EncodingStore
+        rng = np.random.default_rng([self.args.seed, size])
+        matrix = rng.normal(0, 0.1, (size, 128)).astype(np.float32)
+        EncodingStore(self.encodings_dir(size)).write([f'synthetic_{i:07d}' for i in range(size)], matrix)
+
+    def service(self, size):
+        """A FaceRecognitionService over the synthetic gallery of `size` encodings"""
+        if size not in self._services:
+            from model_integration import FaceRecognitionService
+            if not os.path.exists(self.encodings_dir(size)):
+                self.write_gallery(size)
+            data_dir = os.path.join(self.root, f'data_{size}')
+            self._services[size] = FaceRecognitionService(encodings_dir=self.encodings_dir(size), data_dir=data_dir)
+        return self._services[size]
+
+    def sample_encodings(self):
+        """Encodings of the backend/data photos, computed once (needs face_recognition)"""
+        if self._sample_encodings is None:
+            import face_recognition
+            user_ids, encodings = [], []
+            for user_id, face in self.faces:
+                frame = single_frame(face)
+                locations = face_recognition.face_locations(frame)
+                if locations:
+                    user_ids.append(user_id)
+                    encodings.append(face_recognition.face_encodings(frame, locations[:1])[0])
+            self._sample_encodings = (user_ids, np.array(encodings, dtype=np.float32).reshape(-1, 128))
+        return self._sample_encodings
+
+    def recognition_service(self, size):
+        """service(size) with the sample users enrolled in memory, so the sample frames are recognized"""
+        service = self.service(size)
+        user_ids, encodings = self.sample_encodings()
+        missing = [i for i, user_id in enumerate(user_ids) if user_id not in service.gallery]
+        if missing:
+            service.gallery.add_many([user_ids[i] for i in missing], encodings[missing])
+        return service
+
+
+def bench_gallery_load(ws, args):
+    from encoding_store import EncodingStore
+    results = {}
+    for size in args.gallery_sizes:
+        start = time.perf_counter()
+        ws.write_gallery(size)
+        write = time.perf_counter() - start
+        service = ws.service(size)
+        times = repeat(service.load_encodings, args.load_repeats)
+        results[str(size)] = {
+            "write_s": write,
+            "load": latency(times),
+            "file_mb": os.path.getsize(EncodingStore(ws.encodings_dir(size)).main_path) / 1e6
+        }
+    return results
+
+
+def bench_match(ws, args):
+    rng = np.random.default_rng(args.seed)
+    results = {}
+    for size in args.gallery_sizes:
+        service = ws.service(size)
+        results[str(size)] = {}
+        for count in (1, 8):
+            queries = rng.normal(0, 0.1, (count, 128)).astype(np.float32)
+            service.match_encodings(queries)
+            results[str(size)][f"{count}_faces"] = latency(repeat(lambda: service.match_encodings(queries),
+                                                                  args.repeats))
+    return results
+
+
+def stage_breakdown(before, after):
+    """Mean milliseconds per stage between two STAGE_SECONDS.totals() snapshots"""
+    stages = {}
+    for key, (count, total) in after.items():
+        count0, total0 = before.get(key, (0, 0.0))
+        if count > count0:
+            stages[key[0]] = (total - total0) / (count - count0) * 1000
+    return stages
+
+
+def bench_recognize(ws, args):
+    from metrics import STAGE_SECONDS
+    frames = [single_frame(face) for _, face in ws.faces]
+    group = group_frame(ws.faces, args.faces)
+    results = {}
+    for size in args.gallery_sizes:
+        service = ws.recognition_service(size)
+        service.recognize_face(frames[0])
+
+        frame_iter = iter(frames * args.repeats)
+        recognized = [0]
+
+        def single():
+            recognized[0] += service.recognize_face(next(frame_iter)).get("recognized", False)
+
+        before = STAGE_SECONDS.totals()
+        times = repeat(single, args.repeats)
+        single_stages = stage_breakdown(before, STAGE_SECONDS.totals())
+
+        faces_found = len(service.recognize_faces(group).get("faces", []))
+        before = STAGE_SECONDS.totals()
+        multi_times = repeat(lambda: service.recognize_faces(group), args.repeats)
+        multi_stages = stage_breakdown(before, STAGE_SECONDS.totals())
+
+        results[str(size)] = {
+            "single": dict(latency(times), recognized_rate=recognized[0] / args.repeats, stages_ms=single_stages),
+            "multi": dict(latency(multi_times), faces=faces_found,
+                          faces_per_s=faces_found * len(multi_times) / sum(multi_times), stages_ms=multi_stages)
+        }
+    return results
+
+
+def bench_enrolment(ws, args):
+    from model_integration import FaceRecognitionService
+    results = {}
+
+    # Batched appends of precomputed encodings (bulk enrolment), no detection
+    rng = np.random.default_rng(args.seed)
+    service = FaceRecognitionService(encodings_dir=os.path.join(ws.root, 'enrol_bulk'),
+                                     data_dir=os.path.join(ws.root, 'enrol_bulk_data'))
+    encodings = rng.normal(0, 0.1, (args.enrolments, 128)).astype(np.float32)
+    user_ids = [f'bulk_{i:06d}' for i in range(args.enrolments)]
+    start = time.perf_counter()
+    for i in range(0, args.enrolments, 1000):
+        service.register_many(user_ids[i:i + 1000], encodings[i:i + 1000])
+    elapsed = time.perf_counter() - start
+    results["register_many"] = {"enrolments": args.enrolments, "enrolments_per_s": args.enrolments / elapsed}
+
+    # One user at a time through detection, encoding and the store (needs face_recognition)
+    if importlib.util.find_spec('face_recognition') is None:
+        results["register_user"] = {"skipped": "missing dependency: face_recognition"}
+        return results
+    service = FaceRecognitionService(encodings_dir=os.path.join(ws.root, 'enrol_single'),
+                                     data_dir=os.path.join(ws.root, 'enrol_single_data'))
+    frames = [single_frame(face) for _, face in ws.faces]
+    count = min(args.enrolments, args.repeats)
+    enrolled = 0
+    start = time.perf_counter()
+    for i in range(count):
+        enrolled += service.register_user(f'single_{i:06d}', frames[i % len(frames)])["success"]
+    elapsed = time.perf_counter() - start
+    results["register_user"] = {"attempts": count, "enrolled": enrolled, "enrolments_per_s": count / elapsed}
+    return results
+
+
+def bench_api(ws, args):
+    if importlib.util.find_spec('face_recognition') is None:
+        return {"skipped": "missing dependency: face_recognition"}
+    import app as app_module
+
+    # The endpoints look up the module's face_service, so point it at the synthetic gallery
+    app_module.face_service = ws.recognition_service(args.api_gallery_size)
+    payloads = [cv2.imencode('.jpg', to_bgr(single_frame(face)))[1].tobytes() for _, face in ws.faces]
+
+    results = {}
+    for concurrency in args.concurrency:
+        per_thread = max(args.api_requests // concurrency, 1)
+        times, statuses = [], {}
+        lock = threading.Lock()
+
+        def client(offset):
+            test_client = app_module.app.test_client()
+            for i in range(per_thread):
+                data = {'file': (io.BytesIO(payloads[(offset + i) % len(payloads)]), 'frame.jpg')}
+                start = time.perf_counter()
+                response = test_client.post('/api/recognize', data=data, content_type='multipart/form-data')
+                elapsed = time.perf_counter() - start
+                with lock:
+                    times.append(elapsed)
+                    statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+
+        threads = [threading.Thread(target=client, args=(t,)) for t in range(concurrency)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - start
+        results[str(concurrency)] = dict(latency(times), requests_per_s=len(times) / wall, statuses=statuses)
+    return {"gallery_size": args.api_gallery_size, "concurrency": results}
+
+
+def bench_training(ws, args):
+    from tensorflow import keras
+    from models.face_model import FaceRecognitionModel
+
+    data_dir = os.path.join(BACKEND_DIR, 'data')
+    classes = len([d for d in os.listdir(data_dir) if os.path.isdir(os.path.join(data_dir, d))])
+    cache_dir = os.path.join(ws.root, 'training_cache')
+
+    class EpochTimer(keras.callbacks.Callback):
+        def on_epoch_begin(self, epoch, logs=None):
+            self.start = time.perf_counter()
+
+        def on_epoch_end(self, epoch, logs=None):
+            epoch_times.append(time.perf_counter() - self.start)
+
+    epoch_times = []
+    model = FaceRecognitionModel(num_classes=classes)
+    start = time.perf_counter()
+    model.train(data_dir, epochs=args.epochs, batch_size=8, callbacks=[EpochTimer()], cache_dir=cache_dir)
+    total = time.perf_counter() - start
+    images = len(model.load_dataset(data_dir, cache_dir=cache_dir))
+    steady = epoch_times[1:] or epoch_times
+    return {
+        "classes": classes,
+        "images": images,
+        "epochs": len(epoch_times),
+        "first_epoch_s": epoch_times[0],
+        "epoch_s": float(np.mean(steady)),
+        "images_per_s": images / float(np.mean(steady)),
+        "total_s": total
+    }
+
+
+BENCHMARKS = {
+    'gallery_load': bench_gallery_load,
+    'match': bench_match,
+    'recognize': bench_recognize,
+    'enrolment': bench_enrolment,
+    'api': bench_api,
+    'training': bench_training
+}
+
+
+def flatten(results, prefix=''):
+    """Numeric leaves of nested results as {dotted.path: value}"""
+    flat = {}
+    for key, value in results.items():
+        path = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            flat.update(flatten(value, path))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = value
+    return flat
+
+
+def lower_is_better(path):
+    name = path.rsplit('.', 1)[-1]
+    if name.endswith('per_s') or name.endswith('_rate'):
+        return False
+    if name.endswith('_ms') or name.endswith('_s') or '.stages_ms.' in path:
+        return True
+    return None
+
+
+def compare(current, baseline, tolerance):
+    """Print the change of every timing and throughput metric; returns the regressed paths"""
+    now, before = flatten(current["results"]), flatten(baseline["results"])
+    regressions = []
+    print(f"\nAgainst {baseline['meta'].get('commit') or 'baseline'}:")
+    print(f"{'metric':72} {'before':>11} {'now':>11} {'change':>8}")
+    for path in sorted(set(now) & set(before)):
+        direction = lower_is_better(path)
+        if direction is None or before[path] == 0:
+            continue
+        change = now[path] / before[path] - 1
+        worse = change > tolerance if direction else change < -tolerance
+        if worse:
+            regressions.append(path)
+        print(f"{path:72} {before[path]:11.3f} {now[path]:11.3f} {change * 100:+7.1f}%{'  REGRESSION' if worse else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--only', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--gallery-sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--repeats', type=int, default=50)
+    parser.add_argument('--load-repeats', type=int, default=5)
+    parser.add_argument('--faces', type=int, default=4, help='Faces in the multi-face frame')
+    parser.add_argument('--enrolments', type=int, default=10000)
+    parser.add_argument('--api-gallery-size', type=int, default=10000)
+    parser.add_argument('--api-requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 8])
+    parser.add_argument('--epochs', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Results file (default: benchmarks/results/<commit>.json)')
+    parser.add_argument('--compare', help='Earlier results file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='Relative change reported as a regression')
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='bench_suite_')
+    # Keep the app's attendance writes and the models' logging out of the real backend
+    os.environ['ATTENDANCE_DB'] = os.path.join(root, 'attendance.db')
+    os.environ.setdefault('ENABLE_DEEP_LEARNING', 'false')
+    commit, dirty = git_commit()
+    report = {
+        "meta": {
+            "commit": commit,
+            "dirty": dirty,
+            "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "opencv": cv2.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": {k: v for k, v in vars(args).items() if k not in ('output', 'compare')}
+        },
+        "results": {}
+    }
+
+    try:
+        ws = Workspace(root, args)
+        for name in args.only:
+            print(f"Running {name}...", flush=True)
+            start = time.perf_counter()
+            try:
+                result = BENCHMARKS[name](ws, args)
+            except ImportError as e:
+                result = {"skipped": f"missing dependency: {e.name or e}"}
+            except Exception as e:
+                result = {"error": f"{type(e).__name__}: {e}"}
+            report["results"][name] = result
+            print(f"  {json.dumps(result)[:200]} ({time.perf_counter() - start:.1f} s)", flush=True)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{(commit or 'unknown')[:12]}{'-dirty' if dirty else ''}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        print(f"{len(regressions)} regressions beyond {args.tolerance:.0%}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+"""Bulk enrolment: detect and encode a whole intake of photos on a process pool
+
+The source is a directory or a zip file laid out as either
+`<user_id>.jpg` or `<user_id>/<any>.jpg` (several photos per user are
+fine; the first one that encodes becomes the user's gallery encoding).
+An optional `users.csv` with `userId,name` columns supplies display names.
+Photos that cannot be decoded or contain no face are reported, not fatal.
+
+Usage: python bulk_enrol.py SOURCE [--processes N] [--output results.npz]
+
+Without --output the encodings are written straight to the encoding store
+in one batched append and the users, with their names, to the users
+database (--users-db), for offline use; with --output they are saved to
+an .npz file instead, which the /api/register/bulk endpoint applies to
+the running service.
+"""
+import os
+import sys
+import csv
+import io
+import json
+import time
+import zipfile
+import argparse
+import multiprocessing
+import numpy as np
+import cv2
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from models.face_detectors import create_detector
+from models.preprocessing import decode_image, read_image, to_bgr
+from gallery import ENCODING_DIM
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+_detector = None
+_decode_min_width = 0
+
+
+def _user_id(parts):
+    """User id of an image from its path components below the source root"""
+    if len(parts) == 1:
+        return os.path.splitext(parts[0])[0]
+    return parts[-2]
+
+
+def _read_names(data):
+    return {row['userId']: row.get('name') or row['userId']
+            for row in csv.DictReader(io.StringIO(data.decode('utf-8-sig')))}
+
+
+def read_directory(directory):
+    """(items, names) of a directory; items are (user_id, source name, path) tuples"""
+    items, names = [], {}
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            parts = os.path.relpath(path, directory).split(os.sep)
+            if parts == ['users.csv']:
+                with open(path, 'rb') as f:
+                    names = _read_names(f.read())
+            elif name.lower().endswith(IMAGE_EXTENSIONS):
+                items.append((_user_id(parts), '/'.join(parts), path))
+    return items, names
+
+
+def read_zip(source):
+    """(items, names) of a zip file (path or file object); items carry the image bytes"""
+    items, names = [], {}
+    with zipfile.ZipFile(source) as archive:
+        members = [m for m in archive.namelist() if not m.endswith('/') and '__MACOSX' not in m]
+        # Drop a single top-level folder wrapping everything, as zipping a folder produces
+        tops = {m.split('/')[0] for m in members}
+        strip = len(tops) == 1 and all('/' in m for m in members)
+        for member in sorted(members):
+            parts = member.split('/')[1:] if strip else member.split('/')
+            if parts == ['users.csv']:
+                names = _read_names(archive.read(member))
+            elif member.lower().endswith(IMAGE_EXTENSIONS):
+                items.append((_user_id(parts), member, archive.read(member)))
+    return items, names
+
+
+def read_source(source):
+    if os.path.isdir(source):
+        return read_directory(source)
+    return read_zip(source)
+
+
+def _init_worker(detector_kind, max_width, decode_min_width):
+    global _detector, _decode_min_width
+    _detector = create_detector(detector_kind, max_width=max_width)
+    _decode_min_width = decode_min_width
+
+
+def encode_item(item):
+    """Pool task: detect and encode the first face of one photo
+
+    Returns (user_id, source, encoding, JPEG bytes of the face crop, error).
+    """
+    import face_recognition
+    user_id, source, data = item
+    try:
+        if not user_id or user_id.startswith('.'):
+            return user_id, source, None, None, "Invalid user id"
+        if isinstance(data, bytes):
+            image, _ = decode_image(data, _decode_min_width)
+        else:
+            image, _ = read_image(data, _decode_min_width)
+        if image is None:
+            return user_id, source, None, None, "Failed to read image"
+
+        face_locations = _detector.detect(image)
+        if not face_locations:
+            return user_id, source, None, None, "No face detected in the image"
+
+        encoding = face_recognition.face_encodings(image, face_locations[:1])[0]
+        top, right, bottom, left = face_locations[0]
+        crop = cv2.imencode('.jpg', to_bgr(image[top:bottom, left:right]))[1].tobytes()
+        return user_id, source, np.asarray(encoding, dtype=np.float32), crop, None
+    except Exception as e:
+        return user_id, source, None, None, str(e)
+
+
+def encode_items(items, processes=None, detector_kind='hog', max_width=640, chunksize=4, decode_min_width=0):
+    """Encode all items on a process pool
+
+    Returns (user_ids, encodings, crops, failures): one encoding per user
+    (their first photo that encodes), every face crop as (user_id, JPEG
+    bytes), and failures as {"file", "userId", "error"} dicts.
+    """
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(processes, initializer=_init_worker, initargs=(detector_kind, max_width, decode_min_width)) as pool:
+        results = pool.map(encode_item, items, chunksize=chunksize)
+
+    encodings, crops, failures = {}, [], []
+    for user_id, source, encoding, crop, error in results:
+        if error:
+            failures.append({"file": source, "userId": user_id, "error": error})
+            continue
+        encodings.setdefault(user_id, encoding)
+        crops.append((user_id, crop))
+    user_ids = list(encodings)
+    matrix = np.array([encodings[u] for u in user_ids], dtype=np.float32).reshape(-1, ENCODING_DIM)
+    return user_ids, matrix, crops, failures
+
+
+def save_crops(data_dir, crops):
+    """Write face crops as training data: <user>/<user>_face.jpg, then _face_1.jpg, ..."""
+    counts = {}
+    for user_id, crop in crops:
+        user_data_dir = os.path.join(data_dir, user_id)
+        os.makedirs(user_data_dir, exist_ok=True)
+        n = counts.get(user_id, 0)
+        counts[user_id] = n + 1
+        name = f"{user_id}_face.jpg" if n == 0 else f"{user_id}_face_{n}.jpg"
+        with open(os.path.join(user_data_dir, name), 'wb') as f:
+            f.write(crop)
+
+
+def save_results(path, user_ids, encodings, names, failures):
+    np.savez(path, user_ids=np.array(user_ids, dtype=str), encodings=encodings,
+             names=json.dumps(names), failures=json.dumps(failures))
+
+
+def load_results(path):
+    """(user_ids, encodings, names, failures) saved by save_results"""
+    with np.load(path) as results:
+        return (results['user_ids'].tolist(), results['encodings'],
+                json.loads(str(results['names'])), json.loads(str(results['failures'])))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('source', help='Directory or zip file of photos')
+    parser.add_argument('--processes', type=int, default=None, help='Pool size (default: CPU count)')
+    parser.add_argument('--output', help='Save results to this .npz instead of writing the encoding store')
+    parser.add_argument('--data-dir', default=os.path.join(BACKEND_DIR, 'data'))
+    parser.add_argument('--encodings-dir', default=os.path.join(BACKEND_DIR, 'encodings'))
+    parser.add_argument('--users-db', default=os.environ.get('USERS_DB', os.environ.get(
+        'ATTENDANCE_DB', os.path.join(BACKEND_DIR, 'attendance.db'))), help='Registered users database (as app.py)')
+    parser.add_argument('--detector', default=os.environ.get('FACE_DETECTOR', 'hog'))
+    parser.add_argument('--max-width', type=int, default=int(os.environ.get('FACE_DETECT_MAX_WIDTH', 640)))
+    parser.add_argument('--decode-min-width', type=int, default=int(os.environ.get('DECODE_MIN_WIDTH', 1280)),
+                        help='Decode JPEGs at reduced resolution down to this width (0 = full resolution)')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    items, names = read_source(args.source)
+    user_ids, encodings, crops, failures = encode_items(items, args.processes, args.detector, args.max_width,
+                                                    decode_min_width=args.decode_min_width)
+    save_crops(args.data_dir, crops)
+
+    if args.output:
+        save_results(args.output, user_ids, encodings, names, failures)
+    else:
+        from encoding_store import EncodingStore
+        from user_store import UserStore
+        EncodingStore(args.encodings_dir).append_many(user_ids, encodings)
+        # Register the users with their names, as the /api/register/bulk endpoint does
+        UserStore(args.users_db).put_many([
+            (user_id, names.get(user_id, user_id), os.path.join(args.data_dir, user_id, f"{user_id}_face.jpg"))
+            for user_id in user_ids
+        ])
+
+    elapsed = time.perf_counter() - start
+    for failure in failures:
+        print(f"FAILED {failure['file']}: {failure['error']}", file=sys.stderr)
+    print(json.dumps({
+        "images": len(items),
+        "enrolled": len(user_ids),
+        "failed": len(failures),
+        "seconds": elapsed,
+        "enrolmentsPerSecond": len(user_ids) / elapsed if elapsed else 0.0
+    }))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,288 @@
+import os
+import struct
+import zlib
+import pickle
+from contextlib import contextmanager
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process deployments only
+    fcntl = None
+
+from gallery import ENCODING_DIM
+
+# gallery.bin layout:
+#   header    magic, version, dim, count, offset of the id table (64 bytes)
+#   matrix    count x dim little-endian float32, starting at HEADER_SIZE
+#   id table  count x (uint16 length + utf-8 user id)
+# gallery.log holds appended records since the last compaction:
+#   op (1 = add, 2 = remove), id length, crc32 of the payload, then the
+#   utf-8 user id followed by dim float32 values for adds
+MAGIC = b'FGAL'
+VERSION = 1
+HEADER = struct.Struct('<4sHHQQ')
+HEADER_SIZE = 64
+RECORD = struct.Struct('<BHI')
+OP_ADD = 1
+OP_REMOVE = 2
+
+
+def _fsync_dir(directory):
+    if hasattr(os, 'O_DIRECTORY'):
+        fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+class EncodingStore:
+    """Consolidated on-disk gallery: a memory-mappable matrix plus an append log
+
+    Several processes (gunicorn workers) can share one store: appends and
+    compactions take an exclusive lock on `<name>.lock`, and readers follow
+    the log with `read_log(offset)`, reloading when `generation()` changes.
+    """
+
+    def __init__(self, directory, dim=ENCODING_DIM, name='gallery'):
+        self.directory = directory
+        self.dim = dim
+        self.main_path = os.path.join(directory, f'{name}.bin')
+        self.log_path = os.path.join(directory, f'{name}.log')
+        self.lock_path = os.path.join(directory, f'{name}.lock')
+        self.log_records = 0
+        self._log_end = None
+        self._log_generation = None
+
+    def exists(self):
+        return os.path.exists(self.main_path) or os.path.exists(self.log_path)
+
+    def generation(self):
+        """Identity of the compacted file, which changes whenever it is rewritten"""
+        try:
+            stat = os.stat(self.main_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def log_size(self):
+        try:
+            return os.path.getsize(self.log_path)
+        except FileNotFoundError:
+            return 0
+
+    @contextmanager
+    def _locked(self):
+        """Exclusive lock against writers in other processes"""
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.lock_path, 'a') as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def load_main(self):
+        """(user_ids, matrix) of the compacted file alone, the matrix as a read-only memmap"""
+        return self._read_main()
+
+    def _read_main(self):
+        """Memory-map the compacted matrix and read its id table"""
+        if not os.path.exists(self.main_path):
+            return [], np.empty((0, self.dim), dtype=np.float32)
+
+        with open(self.main_path, 'rb') as f:
+            magic, version, dim, count, ids_offset = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{self.main_path} is not a version {VERSION} gallery file")
+            if dim != self.dim:
+                raise ValueError(f"{self.main_path} holds {dim}-d encodings, expected {self.dim}")
+            f.seek(ids_offset)
+            table = f.read()
+
+        ids = []
+        pos = 0
+        for _ in range(count):
+            (length,) = struct.unpack_from('<H', table, pos)
+            ids.append(table[pos + 2:pos + 2 + length].decode('utf-8'))
+            pos += 2 + length
+
+        if count == 0:
+            return ids, np.empty((0, self.dim), dtype=np.float32)
+        matrix = np.memmap(self.main_path, dtype='<f4', mode='r', offset=HEADER_SIZE, shape=(count, dim))
+        return ids, matrix
+
+    def read_log(self, offset=0):
+        """Yield (op, user_id, encoding, end_offset) for every intact log record after `offset`
+
+        Reading stops at the first torn or corrupted record, which is what
+        a crash in the middle of an append leaves behind.
+        """
+        if not os.path.exists(self.log_path):
+            return
+        with open(self.log_path, 'rb') as f:
+            f.seek(offset)
+            data = f.read()
+
+        vector_size = 4 * self.dim
+        pos = 0
+        while pos + RECORD.size <= len(data):
+            op, id_length, crc = RECORD.unpack_from(data, pos)
+            payload_size = id_length + (vector_size if op == OP_ADD else 0)
+            start = pos + RECORD.size
+            payload = data[start:start + payload_size]
+            if op not in (OP_ADD, OP_REMOVE) or len(payload) < payload_size or zlib.crc32(payload) != crc:
+                break
+            user_id = payload[:id_length].decode('utf-8')
+            encoding = None
+            if op == OP_ADD:
+                encoding = np.frombuffer(payload, dtype='<f4', offset=id_length, count=self.dim)
+            pos = start + payload_size
+            yield op, user_id, encoding, offset + pos
+
+    def load(self):
+        """Return (user_ids, matrix) with the log applied on top of the compacted file
+
+        When the log is empty the matrix is a read-only memmap of the file,
+        so nothing is read until rows are actually touched.
+        """
+        self._log_generation = self.generation()
+        ids, matrix = self._read_main()
+
+        added = {}
+        removed = set()
+        self.log_records = 0
+        self._log_end = 0
+        for op, user_id, encoding, end in self.read_log():
+            if op == OP_ADD:
+                added[user_id] = encoding
+                removed.discard(user_id)
+            else:
+                added.pop(user_id, None)
+                removed.add(user_id)
+            self.log_records += 1
+            self._log_end = end
+
+        if not added and not removed:
+            return ids, matrix
+
+        keep = [i for i, user_id in enumerate(ids) if user_id not in removed and user_id not in added]
+        merged_ids = [ids[i] for i in keep] + list(added)
+        merged = np.empty((len(merged_ids), self.dim), dtype=np.float32)
+        merged[:len(keep)] = matrix[keep]
+        if added:
+            merged[len(keep):] = np.stack(list(added.values()))
+        return merged_ids, merged
+
+    def _log_offset(self):
+        """Offset after the last intact log record
+
+        The log is scanned once per process; later calls only scan what
+        other processes appended since, or all of it after a compaction.
+        """
+        generation = self.generation()
+        if self._log_end is None or generation != self._log_generation or self.log_size() < self._log_end:
+            self._log_end = 0
+            self.log_records = 0
+        for _, _, _, end in self.read_log(self._log_end):
+            self._log_end = end
+            self.log_records += 1
+        self._log_generation = generation
+        return self._log_end
+
+    def _write_log(self, records):
+        os.makedirs(self.directory, exist_ok=True)
+        with self._locked():
+            offset = self._log_offset()
+            mode = 'r+b' if os.path.exists(self.log_path) else 'wb'
+            with open(self.log_path, mode) as f:
+                # Drop any torn record left by a crash before appending
+                f.seek(offset)
+                f.truncate()
+                f.write(b''.join(records))
+                f.flush()
+                os.fsync(f.fileno())
+                self._log_end = f.tell()
+            self.log_records += len(records)
+
+    def _record(self, op, user_id, encoding=None):
+        payload = user_id.encode('utf-8')
+        if op == OP_ADD:
+            payload += np.asarray(encoding, dtype='<f4').reshape(self.dim).tobytes()
+        return RECORD.pack(op, len(user_id.encode('utf-8')), zlib.crc32(payload)) + payload
+
+    def append(self, user_id, encoding):
+        """Durably record the encoding of a user"""
+        self._write_log([self._record(OP_ADD, user_id, encoding)])
+
+    def append_many(self, user_ids, encodings):
+        """Durably record several encodings with a single write and fsync"""
+        self._write_log([self._record(OP_ADD, user_id, encoding)
+                         for user_id, encoding in zip(user_ids, encodings)])
+
+    def remove(self, user_id):
+        self._write_log([self._record(OP_REMOVE, user_id)])
+
+    def write(self, user_ids, matrix):
+        """Atomically replace the compacted file with the given gallery"""
+        os.makedirs(self.directory, exist_ok=True)
+        matrix = np.ascontiguousarray(matrix, dtype='<f4').reshape(-1, self.dim)
+        table = b''.join(struct.pack('<H', len(b)) + b
+                         for b in (user_id.encode('utf-8') for user_id in user_ids))
+        ids_offset = HEADER_SIZE + matrix.nbytes
+
+        tmp_path = self.main_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, self.dim, len(user_ids), ids_offset).ljust(HEADER_SIZE, b'\0'))
+            f.write(matrix.tobytes())
+            f.write(table)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.main_path)
+        _fsync_dir(self.directory)
+
+    def compact(self):
+        """Fold the log into the compacted file
+
+        The new file is written aside and renamed over the old one before
+        the log is truncated, so a crash at any point leaves either the old
+        state or a state the log still replays onto idempotently.
+        """
+        with self._locked():
+            user_ids, matrix = self.load()
+            self.write(user_ids, matrix)
+            if os.path.exists(self.log_path):
+                with open(self.log_path, 'r+b') as f:
+                    f.truncate(0)
+                    os.fsync(f.fileno())
+            self.log_records = 0
+            self._log_end = 0
+            self._log_generation = self.generation()
+        return len(user_ids)
+
+    def migrate_pickles(self, pickle_dir):
+        """One-shot import of legacy `<user_id>.pkl` encoding files
+
+        Returns the number of encodings imported, 0 if another process
+        already created the store.
+        """
+        with self._locked():
+            if self.exists():
+                return 0
+            user_ids, encodings = [], []
+            for encoding_file in sorted(os.listdir(pickle_dir)):
+                if not encoding_file.endswith('.pkl'):
+                    continue
+                user_id = encoding_file.split('.')[0]
+                try:
+                    with open(os.path.join(pickle_dir, encoding_file), 'rb') as f:
+                        encodings.append(np.asarray(pickle.load(f), dtype=np.float32))
+                    user_ids.append(user_id)
+                except Exception as e:
+                    print(f"Error migrating encoding for {user_id}: {e}")
+            self.write(user_ids, np.array(encodings, dtype=np.float32).reshape(-1, self.dim))
+        return len(user_ids)
@@ -0,0 +1,364 @@
+import os
+import threading
+import numpy as np
+
+from gallery import FaceGallery, ENCODING_DIM
+
+INDEX_KINDS = ('flat', 'ivf')
+
+
+def _save_npz(path, **arrays):
+    """Write arrays to `path` atomically"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_path, path)
+
+
+class FlatIndex(FaceGallery):
+    """Exact index: brute-force scan over the whole gallery matrix"""
+
+    kind = 'flat'
+
+    def save(self, path):
+        _save_npz(
+            path,
+            kind=np.array(self.kind),
+            ids=np.array(self.ids, dtype=str),
+            matrix=self.matrix
+        )
+
+    @classmethod
+    def from_arrays(cls, arrays, **options):
+        matrix = arrays['matrix']
+        index = cls(dim=matrix.shape[1], capacity=max(len(matrix), 1024))
+        index.add_many(arrays['ids'].tolist(), matrix)
+        return index
+
+
+def _nearest_centroids(vectors, centroids, chunk=65536):
+    """Index of the closest centroid for every row of `vectors`"""
+    centroid_norms = np.einsum('ij,ij->i', centroids, centroids)
+    labels = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), chunk):
+        block = vectors[start:start + chunk]
+        # |c|^2 - 2 v.c is enough to rank centroids for a fixed v
+        scores = centroid_norms - 2.0 * (block @ centroids.T)
+        labels[start:start + chunk] = np.argmin(scores, axis=1)
+    return labels
+
+
+def kmeans(vectors, k, iterations=20, sample_size=None, seed=0):
+    """Plain Lloyd's k-means, used to train the IVF coarse quantizer"""
+    rng = np.random.default_rng(seed)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if sample_size and len(vectors) > sample_size:
+        vectors = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+
+    centroids = vectors[rng.choice(len(vectors), k, replace=False)].copy()
+    for _ in range(iterations):
+        labels = _nearest_centroids(vectors, centroids)
+        counts = np.bincount(labels, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, vectors)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+        # Re-seed empty clusters from random points
+        empty = np.flatnonzero(~filled)
+        if len(empty):
+            centroids[empty] = vectors[rng.choice(len(vectors), len(empty), replace=False)]
+    return centroids
+
+
+class IVFIndex:
+    """Approximate index: inverted lists over a k-means coarse quantizer
+
+    Every encoding is stored in the list of its nearest centroid and a
+    query only scans the `nprobe` lists closest to it. Until the gallery
+    reaches `train_threshold` entries the index is untrained and behaves
+    like a single flat list.
+    """
+
+    kind = 'ivf'
+
+    def __init__(self, dim=ENCODING_DIM, nlist=None, nprobe=8, train_threshold=10000):
+        self.dim = dim
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_threshold = train_threshold
+        self.centroids = None
+        self.trained_size = 0
+        self._lists = [FaceGallery(dim=dim)]
+        self._assignments = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._assignments)
+
+    def __contains__(self, user_id):
+        return user_id in self._assignments
+
+    @property
+    def is_trained(self):
+        return self.centroids is not None
+
+    def get(self, user_id):
+        list_no = self._assignments.get(user_id)
+        if list_no is None:
+            return None
+        return self._lists[list_no].get(user_id)
+
+    def _assign(self, encodings):
+        if not self.is_trained:
+            return np.zeros(len(encodings), dtype=np.int64)
+        return _nearest_centroids(encodings, self.centroids)
+
+    def add(self, user_id, encoding):
+        encoding = np.asarray(encoding, dtype=np.float32).reshape(1, self.dim)
+        with self._lock:
+            self.remove(user_id)
+            list_no = int(self._assign(encoding)[0])
+            self._lists[list_no].add(user_id, encoding[0])
+            self._assignments[user_id] = list_no
+            self._maybe_train()
+
+    def add_many(self, user_ids, encodings):
+        user_ids = list(user_ids)
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, self.dim)
+        with self._lock:
+            for user_id in user_ids:
+                self.remove(user_id)
+            labels = self._assign(encodings)
+            for list_no in np.unique(labels):
+                rows = np.flatnonzero(labels == list_no)
+                self._lists[list_no].add_many([user_ids[i] for i in rows], encodings[rows])
+                for i in rows:
+                    self._assignments[user_ids[i]] = int(list_no)
+            self._maybe_train()
+
+    def remove(self, user_id):
+        with self._lock:
+            list_no = self._assignments.pop(user_id, None)
+            if list_no is None:
+                return False
+            return self._lists[list_no].remove(user_id)
+
+    def _maybe_train(self):
+        size = len(self)
+        if not self.is_trained:
+            if size >= self.train_threshold:
+                self.train()
+        elif size >= 4 * self.trained_size:
+            # The gallery outgrew its quantizer, lists are getting too long
+            self.train()
+
+    def _all_vectors(self):
+        ids = np.concatenate([lst.ids for lst in self._lists])
+        matrix = np.concatenate([lst.matrix for lst in self._lists]).reshape(-1, self.dim)
+        return ids.tolist(), matrix
+
+    def train(self, centroids=None):
+        """Fit the coarse quantizer and redistribute every stored encoding"""
+        with self._lock:
+            ids, matrix = self._all_vectors()
+            if centroids is None:
+                nlist = self.nlist or max(1, int(4 * np.sqrt(len(ids))))
+                nlist = min(nlist, len(ids))
+                centroids = kmeans(matrix, nlist, sample_size=256 * nlist)
+            self.centroids = np.asarray(centroids, dtype=np.float32)
+            self.trained_size = max(len(ids), 1)
+            self._lists = [FaceGallery(dim=self.dim, capacity=16) for _ in range(len(self.centroids))]
+            self._assignments = {}
+            if ids:
+                self.add_many(ids, matrix)
+
+    def save_quantizer(self, path):
+        """Persist only the trained centroids, the vectors live in the encoding store"""
+        _save_npz(path, centroids=self.centroids, trained_size=np.array(self.trained_size))
+
+    def load_quantizer(self, path):
+        """Reuse centroids from `save_quantizer` instead of re-running k-means"""
+        with np.load(path, allow_pickle=False) as data:
+            centroids, trained_size = data['centroids'], int(data['trained_size'])
+        if centroids.shape[1] != self.dim:
+            raise ValueError(f"Quantizer in {path} is {centroids.shape[1]}-d, expected {self.dim}")
+        self.train(centroids)
+        self.trained_size = trained_size
+
+    def match(self, encoding, tolerance=0.6, k=5):
+        query = np.asarray(encoding, dtype=np.float32).reshape(self.dim)
+        with self._lock:
+            if self.is_trained:
+                probe = np.argsort(np.linalg.norm(self.centroids - query, axis=1))[:self.nprobe]
+            else:
+                probe = [0]
+
+            candidate_ids, candidate_distances = [], []
+            for list_no in probe:
+                lst = self._lists[list_no]
+                if len(lst):
+                    candidate_ids.append(lst.ids)
+                    candidate_distances.append(lst.distances(query))
+            if not candidate_ids:
+                return {"user": None, "distance": None, "top_k": [], "margin": None}
+
+            ids = np.concatenate(candidate_ids)
+            distances = np.concatenate(candidate_distances)
+            order = np.argsort(distances)[:k]
+            best_distance = float(distances[order[0]])
+            margin = float(distances[order[1]] - best_distance) if len(order) > 1 else None
+
+            return {
+                "user": ids[order[0]] if best_distance <= tolerance else None,
+                "distance": best_distance,
+                "top_k": [(ids[i], float(distances[i])) for i in order],
+                "margin": margin
+            }
+
+    def match_many(self, encodings, tolerance=0.6, k=5):
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, self.dim)
+        with self._lock:
+            return [self.match(encoding, tolerance, k) for encoding in encodings]
+
+    def save(self, path):
+        ids, matrix = self._all_vectors()
+        arrays = {
+            "kind": np.array(self.kind),
+            "ids": np.array(ids, dtype=str),
+            "matrix": matrix,
+            "params": np.array([self.nlist or 0, self.nprobe, self.train_threshold])
+        }
+        if self.is_trained:
+            arrays["centroids"] = self.centroids
+        _save_npz(path, **arrays)
+
+    @classmethod
+    def from_arrays(cls, arrays, **options):
+        nlist, nprobe, train_threshold = (int(v) for v in arrays['params'])
+        params = {"nlist": nlist or None, "nprobe": nprobe, "train_threshold": train_threshold}
+        params.update(options)
+        matrix = arrays['matrix']
+        index = cls(dim=matrix.shape[1], **params)
+        if 'centroids' in arrays:
+            index.centroids = arrays['centroids']
+            index.trained_size = len(matrix)
+            index._lists = [FaceGallery(dim=index.dim, capacity=16) for _ in range(len(index.centroids))]
+        index.add_many(arrays['ids'].tolist(), matrix)
+        return index
+
+
+class OverlayIndex:
+    """Exact index over a read-only base gallery plus a private overlay of later changes
+
+    The base is a FlatIndex over the memory-mapped store file and is never
+    written to, so its pages stay shared between worker processes. Users
+    added or replaced afterwards go to a small overlay FlatIndex, and base
+    rows that were removed or replaced are masked out of every search.
+    """
+
+    kind = 'flat'
+
+    def __init__(self, base):
+        self.dim = base.dim
+        self.base = base
+        self.overlay = FlatIndex(dim=self.dim, capacity=64)
+        self._masked = np.zeros(len(base), dtype=bool)
+        self._masked_count = 0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.base) - self._masked_count + len(self.overlay)
+
+    def __contains__(self, user_id):
+        return user_id in self.overlay or self._base_row(user_id) is not None
+
+    def _base_row(self, user_id):
+        row = self.base._rows.get(user_id)
+        if row is None or self._masked[row]:
+            return None
+        return row
+
+    def _mask(self, user_id):
+        row = self._base_row(user_id)
+        if row is not None:
+            self._masked[row] = True
+            self._masked_count += 1
+
+    def get(self, user_id):
+        encoding = self.overlay.get(user_id)
+        if encoding is None and self._base_row(user_id) is not None:
+            encoding = self.base.get(user_id)
+        return encoding
+
+    def add(self, user_id, encoding):
+        with self._lock:
+            self._mask(user_id)
+            self.overlay.add(user_id, encoding)
+
+    def add_many(self, user_ids, encodings):
+        user_ids = list(user_ids)
+        with self._lock:
+            for user_id in user_ids:
+                self._mask(user_id)
+            self.overlay.add_many(user_ids, encodings)
+
+    def remove(self, user_id):
+        with self._lock:
+            found = self._base_row(user_id) is not None
+            self._mask(user_id)
+            return self.overlay.remove(user_id) or found
+
+    def match(self, encoding, tolerance=0.6, k=5):
+        return self.match_many([encoding], tolerance, k)[0]
+
+    def match_many(self, encodings, tolerance=0.6, k=5):
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, self.dim)
+        with self._lock:
+            if len(self) == 0:
+                return [{"user": None, "distance": None, "top_k": [], "margin": None}
+                        for _ in range(len(encodings))]
+
+            parts = []
+            if len(self.base) > self._masked_count:
+                distances = self.base.distances_many(encodings)
+                if self._masked_count:
+                    distances[:, self._masked] = np.inf
+                parts.append((self.base, distances))
+            if len(self.overlay):
+                parts.append((self.overlay, self.overlay.distances_many(encodings)))
+
+            results = []
+            for i in range(len(encodings)):
+                # Merge the top k of each part; masked rows are at infinity
+                top_k = []
+                for gallery, distances in parts:
+                    top_k.extend(gallery._best_matches(distances[i], tolerance, k)["top_k"])
+                top_k = sorted((c for c in top_k if np.isfinite(c[1])), key=lambda c: c[1])[:k]
+                best_id, best_distance = top_k[0]
+                results.append({
+                    "user": best_id if best_distance <= tolerance else None,
+                    "distance": best_distance,
+                    "top_k": top_k,
+                    "margin": top_k[1][1] - best_distance if len(top_k) > 1 else None
+                })
+            return results
+
+
+_INDEX_CLASSES = {cls.kind: cls for cls in (FlatIndex, IVFIndex)}
+
+
+def create_index(kind='flat', **options):
+    """Create an empty index of the given kind ('flat' or 'ivf')"""
+    if kind not in _INDEX_CLASSES:
+        raise ValueError(f"Unknown index kind '{kind}', expected one of {INDEX_KINDS}")
+    return _INDEX_CLASSES[kind](**options)
+
+
+def load_index(path, **options):
+    """Load an index written by `save`"""
+    with np.load(path, allow_pickle=False) as data:
+        arrays = {name: data[name] for name in data.files}
+    kind = str(arrays['kind'])
+    if kind not in _INDEX_CLASSES:
+        raise ValueError(f"Unknown index kind '{kind}' in {path}")
+    return _INDEX_CLASSES[kind].from_arrays(arrays, **options)
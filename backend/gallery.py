@@ -0,0 +1,167 @@
+import threading
+import numpy as np
+
+ENCODING_DIM = 128
+
+
+class FaceGallery:
+    """Enrolled face encodings kept as one contiguous float32 matrix
+
+    Registration and recognition run on different request threads, so
+    every change and every match holds the gallery's lock: a match never
+    sees a half-grown matrix or a row count ahead of its rows.
+    """
+
+    def __init__(self, dim=ENCODING_DIM, capacity=1024):
+        self.dim = dim
+        self._matrix = np.empty((capacity, dim), dtype=np.float32)
+        self._sq_norms = np.empty(capacity, dtype=np.float32)
+        self._ids = np.empty(capacity, dtype=object)
+        self._rows = {}
+        self._size = 0
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_matrix(cls, user_ids, matrix):
+        """Wrap an existing (N, dim) float32 matrix, e.g. a read-only memmap,
+        without copying it; the first insert moves it into a growable buffer"""
+        gallery = cls(dim=matrix.shape[1], capacity=0)
+        gallery._matrix = matrix
+        gallery._sq_norms = np.einsum('ij,ij->i', matrix, matrix).astype(np.float32)
+        gallery._ids = np.array(user_ids, dtype=object).reshape(len(user_ids))
+        gallery._rows = {user_id: i for i, user_id in enumerate(user_ids)}
+        gallery._size = len(user_ids)
+        return gallery
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, user_id):
+        return user_id in self._rows
+
+    @property
+    def matrix(self):
+        """View of the occupied rows of the gallery matrix"""
+        return self._matrix[:self._size]
+
+    @property
+    def ids(self):
+        """View of the user ids, aligned with the rows of `matrix`"""
+        return self._ids[:self._size]
+
+    def get(self, user_id):
+        """Return the stored encoding of a user, or None"""
+        row = self._rows.get(user_id)
+        if row is None:
+            return None
+        return self._matrix[row]
+
+    def _grow(self, min_capacity):
+        capacity = max(min_capacity, 2 * len(self._matrix), 1)
+        matrix = np.empty((capacity, self.dim), dtype=np.float32)
+        matrix[:self._size] = self._matrix[:self._size]
+        sq_norms = np.empty(capacity, dtype=np.float32)
+        sq_norms[:self._size] = self._sq_norms[:self._size]
+        ids = np.empty(capacity, dtype=object)
+        ids[:self._size] = self._ids[:self._size]
+        self._matrix, self._sq_norms, self._ids = matrix, sq_norms, ids
+
+    def add(self, user_id, encoding):
+        """Insert or replace the encoding of a user in place"""
+        encoding = np.asarray(encoding, dtype=np.float32).reshape(self.dim)
+        with self._lock:
+            row = self._rows.get(user_id)
+            if not self._matrix.flags.writeable:
+                self._grow(len(self._matrix))
+            if row is None:
+                if self._size == len(self._matrix):
+                    self._grow(self._size + 1)
+                row = self._size
+                self._rows[user_id] = row
+                self._ids[row] = user_id
+                self._size += 1
+            self._matrix[row] = encoding
+            self._sq_norms[row] = np.dot(encoding, encoding)
+            return row
+
+    def add_many(self, user_ids, encodings):
+        """Insert or replace several encodings at once"""
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, self.dim)
+        with self._lock:
+            if self._size + len(encodings) > len(self._matrix) or not self._matrix.flags.writeable:
+                self._grow(self._size + len(encodings))
+            for user_id, encoding in zip(user_ids, encodings):
+                self.add(user_id, encoding)
+
+    def remove(self, user_id):
+        """Remove a user by moving the last row into its slot"""
+        with self._lock:
+            row = self._rows.pop(user_id, None)
+            if row is None:
+                return False
+            last = self._size - 1
+            if not self._matrix.flags.writeable:
+                self._grow(len(self._matrix))
+            if row != last:
+                self._matrix[row] = self._matrix[last]
+                self._sq_norms[row] = self._sq_norms[last]
+                moved_id = self._ids[last]
+                self._ids[row] = moved_id
+                self._rows[moved_id] = row
+            self._ids[last] = None
+            self._size = last
+            return True
+
+    def distances(self, encoding):
+        """Euclidean distance from one encoding to every enrolled face"""
+        return self.distances_many(encoding)[0]
+
+    def distances_many(self, encodings):
+        """(M, N) Euclidean distances from M encodings to every enrolled face"""
+        queries = np.asarray(encodings, dtype=np.float32).reshape(-1, self.dim)
+        with self._lock:
+            # |a - b|^2 = |a|^2 - 2 a.b + |b|^2, with |a|^2 cached per row
+            squared = (self._sq_norms[:self._size]
+                       - 2.0 * (queries @ self.matrix.T)
+                       + np.einsum('ij,ij->i', queries, queries)[:, None])
+        return np.sqrt(np.maximum(squared, 0.0))
+
+    def _best_matches(self, distances, tolerance, k):
+        k = min(k, self._size)
+        if k < self._size:
+            candidates = np.argpartition(distances, k - 1)[:k]
+        else:
+            candidates = np.arange(self._size)
+        candidates = candidates[np.argsort(distances[candidates])]
+
+        best = candidates[0]
+        best_distance = float(distances[best])
+        margin = float(distances[candidates[1]] - best_distance) if k > 1 else None
+        top_k = [(self._ids[i], float(distances[i])) for i in candidates]
+
+        return {
+            "user": self._ids[best] if best_distance <= tolerance else None,
+            "distance": best_distance,
+            "top_k": top_k,
+            "margin": margin
+        }
+
+    def match(self, encoding, tolerance=0.6, k=5):
+        """Find the closest enrolled faces to an encoding
+
+        Returns a dict with the best user (None when no face is within
+        `tolerance`), its distance, the top-k candidates and the margin
+        between the best and second-best distance.
+        """
+        return self.match_many([encoding], tolerance, k)[0]
+
+    def match_many(self, encodings, tolerance=0.6, k=5):
+        """`match` for several encodings with a single distance computation"""
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, self.dim)
+        with self._lock:
+            if self._size == 0:
+                return [{"user": None, "distance": None, "top_k": [], "margin": None}
+                        for _ in range(len(encodings))]
+
+            distances = self.distances_many(encodings)
+            return [self._best_matches(row, tolerance, k) for row in distances]
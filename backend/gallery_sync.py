@@ -0,0 +1,70 @@
+"""Keep a worker's in-memory gallery in step with enrolments made by other workers
+
+Every worker appends its enrolments to the shared EncodingStore log. Before
+matching, a worker calls `GallerySync.poll`, which costs two stat calls when
+nothing changed and otherwise applies only the records appended since its
+last poll. A compaction rewrites the store file, after which the worker
+reloads the whole gallery instead.
+"""
+import os
+import time
+import threading
+
+from encoding_store import OP_ADD
+
+
+class GallerySync:
+    def __init__(self, store, interval=0.0, on_lag=None):
+        self.store = store
+        self.interval = interval
+        self.on_lag = on_lag
+        self.generation = None
+        self.offset = 0
+        self.applied = 0
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def reset(self, generation, offset=0):
+        """Mark the index as loaded from the store file `generation` plus the log up to `offset`"""
+        self.generation = generation
+        self.offset = offset
+        self._checked = 0.0
+
+    def poll(self, index, reload):
+        """Apply new log records to `index`, or call `reload()` if the store was compacted
+
+        Returns the number of records applied (-1 after a reload).
+        """
+        now = time.monotonic()
+        if now - self._checked < self.interval:
+            return 0
+        self._checked = now
+        if self.store.generation() == self.generation and self.store.log_size() == self.offset:
+            return 0
+
+        with self._lock:
+            compacted = self.store.generation() != self.generation or self.store.log_size() < self.offset
+            if not compacted:
+                return self._apply(index)
+        # Outside the lock: reloading resets and polls this object again
+        reload()
+        return -1
+
+    def _apply(self, index):
+        try:
+            written = os.path.getmtime(self.store.log_path)
+        except FileNotFoundError:
+            return 0
+        applied = 0
+        for op, user_id, encoding, end in self.store.read_log(self.offset):
+            if op == OP_ADD:
+                index.add(user_id, encoding)
+            else:
+                index.remove(user_id)
+            self.offset = end
+            applied += 1
+        self.applied += applied
+        if applied and self.on_lag:
+            # Time since the last of these records was written
+            self.on_lag(max(time.time() - written, 0.0))
+        return applied
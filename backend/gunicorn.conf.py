@@ -0,0 +1,24 @@
+# gunicorn -c gunicorn.conf.py app:app
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('GUNICORN_WORKERS', 2))
+timeout = 120
+
+# Workers share the gallery and each other's enrolments (see MULTI_WORKER in model_integration.py)
+os.environ.setdefault('MULTI_WORKER', 'true' if workers > 1 else 'false')
+# Load the face_recognition models in the master so workers share them
+PRELOAD_MODELS = os.environ.get('GUNICORN_PRELOAD_MODELS', 'true').lower() == 'true'
+
+
+def on_starting(server):
+    if PRELOAD_MODELS:
+        from startup import preload_shared
+        server.log.info(f"Preloaded shared models in {preload_shared()} ms")
+
+
+def post_worker_init(worker):
+    """Load and warm up the models before this worker starts accepting requests"""
+    from startup import warmup
+    state = warmup()
+    worker.log.info(f"Worker {worker.pid} warm: {state.timings}")
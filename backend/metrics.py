@@ -0,0 +1,231 @@
+"""In-process metrics in the Prometheus text format, served by /metrics
+
+Counters and histograms are plain Python objects updated under a lock, so
+recording a sample costs a few microseconds against a recognition's tens of
+milliseconds, and stays on in production (benchmarks/bench_metrics.py).
+`span(stage)` times one stage of the recognition pipeline into the
+`face_attendance_stage_seconds` histogram. Values are per process: under
+gunicorn each worker reports its own (see the `pid` label).
+"""
+import os
+import time
+import bisect
+import threading
+
+# Latency buckets in seconds, from 0.5 ms to 10 s
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if len(labels) != len(self.labels):
+            raise ValueError(f"{self.name} expects labels {self.labels}, got {tuple(labels)}")
+        return tuple([labels[name] for name in self.labels])
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+
+
+class Gauge(Metric):
+    """A value set by the code, or read from `fn` at scrape time
+
+    `fn` returns a number, or a dict of label value tuples to numbers.
+    """
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labels=(), fn=None):
+        super().__init__(name, documentation, labels)
+        self.fn = fn
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def samples(self):
+        if self.fn is not None:
+            values = self.fn()
+            values = values.items() if isinstance(values, dict) else [((), values)]
+        else:
+            with self._lock:
+                values = list(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        self._observe(self._key(labels), value)
+
+    def _observe(self, key, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket (not cumulative) counts, with a last slot for +Inf, and the sum
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][i] += 1
+            state[1] += value
+
+    def count(self, **labels):
+        state = self._values.get(self._key(labels))
+        return sum(state[0]) if state else 0
+
+    def totals(self):
+        """{label values: (count, sum)} of every series"""
+        with self._lock:
+            return {key: (sum(counts), total) for key, (counts, total) in self._values.items()}
+
+    def samples(self):
+        with self._lock:
+            values = [(key, (list(counts), total)) for key, (counts, total) in self._values.items()]
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                labels = _format_labels(self.labels, key, [('le', _format_value(bound))])
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labels=()):
+        return self.register(Counter(name, documentation, labels))
+
+    def gauge(self, name, documentation, labels=(), fn=None):
+        return self.register(Gauge(name, documentation, labels, fn))
+
+    def histogram(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format (version 0.0.4)"""
+        return '\n'.join(metric.render() for metric in self._metrics.values()) + '\n'
+
+
+registry = Registry()
+
+STAGE_SECONDS = registry.histogram(
+    'face_attendance_stage_seconds', 'Time spent in each stage of the recognition pipeline', ('stage',))
+REQUEST_SECONDS = registry.histogram(
+    'face_attendance_http_request_seconds', 'HTTP request latency', ('endpoint', 'method'))
+REQUESTS = registry.counter(
+    'face_attendance_http_requests_total', 'HTTP requests served', ('endpoint', 'method', 'status'))
+RECOGNITIONS = registry.counter(
+    'face_attendance_recognitions_total', 'Faces recognized, by path and outcome', ('path', 'result'))
+ENROLMENTS = registry.counter(
+    'face_attendance_enrolments_total', 'Users enrolled', ('source',))
+ATTENDANCE_WRITES = registry.counter(
+    'face_attendance_attendance_writes_total', 'Attendance records written', ('event',))
+MODEL_LOAD_SECONDS = registry.gauge(
+    'face_attendance_model_load_seconds', 'Duration of the last load of each model', ('model',))
+SHED_REQUESTS = registry.counter(
+    'face_attendance_shed_requests_total', 'Requests refused with 503 because the worker queue was full',
+    ('endpoint',))
+GALLERY_SYNC_LAG_SECONDS = registry.histogram(
+    'face_attendance_gallery_sync_lag_seconds',
+    'Delay between another worker writing an enrolment and this worker applying it', ('gallery',),
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 60.0))
+registry.gauge('face_attendance_process_info', 'Process serving these metrics', ('pid',),
+               fn=lambda: {(os.getpid(),): 1})
+
+
+def _resident_memory():
+    """RSS and PSS (shared pages split between the processes mapping them) of this process"""
+    values = {}
+    for path, fields in (('/proc/self/status', {'VmRSS:': 'rss'}), ('/proc/self/smaps_rollup', {'Pss:': 'pss'})):
+        try:
+            with open(path) as f:
+                for line in f:
+                    parts = line.split()
+                    if parts and parts[0] in fields:
+                        values[(fields[parts[0]],)] = int(parts[1]) * 1024
+        except OSError:
+            pass
+    return values
+
+
+registry.gauge('face_attendance_process_memory_bytes', 'Resident memory of this process', ('kind',),
+               fn=_resident_memory)
+
+
+class _Span:
+    __slots__ = ('key', 'start')
+
+    def __init__(self, stage):
+        self.key = (stage,)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        STAGE_SECONDS._observe(self.key, time.perf_counter() - self.start)
+        return False
+
+
+def span(stage):
+    """Context manager timing one pipeline stage into face_attendance_stage_seconds"""
+    return _Span(stage)
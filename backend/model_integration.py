@@ -1,165 +1,690 @@
 import os
 import sys
+import time
+import shutil
+import threading
 import cv2
 import numpy as np
-import pickle
 
 # Add parent directory to path to import the model
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from models.face_model import FaceRecognitionModel
+from models.face_model import FaceRecognitionModel, MODEL_MODES, INFERENCE_BACKENDS
+from models.face_detectors import create_detector
+from models.preprocessing import read_image, to_bgr, scale_box
+from face_index import FlatIndex, OverlayIndex, create_index
+from encoding_store import EncodingStore
+from gallery_sync import GallerySync
+from startup import startup_state
+from batching import MicroBatcher
+from metrics import span, RECOGNITIONS, ENROLMENTS, MODEL_LOAD_SECONDS, GALLERY_SYNC_LAG_SECONDS
+
+# TensorFlow is only imported when the deep learning path is enabled
+ENABLE_DEEP_LEARNING = os.environ.get('ENABLE_DEEP_LEARNING', 'true').lower() == 'true'
+
+# Deep learning path: 'softmax' (classifier head, retrained per new user) or
+# 'embedding' (frozen VGG16 features matched by nearest neighbour, no training)
+DEEP_LEARNING_MODE = os.environ.get('DEEP_LEARNING_MODE', 'softmax')
+if DEEP_LEARNING_MODE not in MODEL_MODES:
+    raise ValueError(f"Unknown DEEP_LEARNING_MODE '{DEEP_LEARNING_MODE}', expected one of {MODEL_MODES}")
+# Size of the pooled VGG16 features, and the minimum cosine similarity to accept a match
+EMBEDDING_DIM = 512
+EMBEDDING_MIN_SIMILARITY = float(os.environ.get('EMBEDDING_MIN_SIMILARITY', 0.7))
+
+# Runtime serving the trained softmax model: 'keras' (SavedModel) or 'tflite'
+# (quantized export, TFLITE_QUANTIZATION: float32, float16 or int8 calibrated
+# on the training crops); the export is made when training saves the model
+INFERENCE_BACKEND = os.environ.get('INFERENCE_BACKEND', 'keras')
+if INFERENCE_BACKEND not in INFERENCE_BACKENDS:
+    raise ValueError(f"Unknown INFERENCE_BACKEND '{INFERENCE_BACKEND}', expected one of {INFERENCE_BACKENDS}")
+TFLITE_QUANTIZATION = os.environ.get('TFLITE_QUANTIZATION', 'int8')
+
+# Gallery index backend: 'flat' (exact) or 'ivf' (approximate)
+FACE_INDEX = os.environ.get('FACE_INDEX', 'flat')
+FACE_INDEX_OPTIONS = {
+    'ivf': {
+        'nlist': int(os.environ.get('FACE_INDEX_NLIST', 0)) or None,
+        'nprobe': int(os.environ.get('FACE_INDEX_NPROBE', 8)),
+        'train_threshold': int(os.environ.get('FACE_INDEX_TRAIN_THRESHOLD', 10000))
+    }
+}
+
+# Face detector shared by both recognition paths: 'hog', 'haar' or 'dnn'.
+# Frames wider than FACE_DETECT_MAX_WIDTH are downscaled for detection only.
+FACE_DETECTOR = os.environ.get('FACE_DETECTOR', 'hog')
+FACE_DETECT_MAX_WIDTH = int(os.environ.get('FACE_DETECT_MAX_WIDTH', 640))
+# JPEG frames are decoded at 1/2, 1/4 or 1/8 scale when they stay at least
+# DECODE_MIN_WIDTH pixels wide (0 = always at full resolution)
+DECODE_MIN_WIDTH = int(os.environ.get('DECODE_MIN_WIDTH', 1280))
+
+# Coalesce faces from concurrent requests into shared matching/predict batches
+ENABLE_MICRO_BATCHING = os.environ.get('ENABLE_MICRO_BATCHING', 'false').lower() == 'true'
+MICRO_BATCH_SIZE = int(os.environ.get('MICRO_BATCH_SIZE', 32))
+MICRO_BATCH_WAIT_MS = float(os.environ.get('MICRO_BATCH_WAIT_MS', 5))
+
+# Fold the encoding store's append log into its main file past this many records
+COMPACT_LOG_RECORDS = 1000
+
+# Several gunicorn workers serving one backend (set by gunicorn.conf.py when
+# GUNICORN_WORKERS > 1): galleries are read-only memmaps of the store shared
+# by all workers, and each worker applies the enrolments others append to the
+# store's log before matching (at most every GALLERY_SYNC_INTERVAL seconds,
+# 0 = before every match). A model trained by one worker is picked up by the
+# others within MODEL_SYNC_INTERVAL seconds.
+MULTI_WORKER = os.environ.get('MULTI_WORKER', 'false').lower() == 'true'
+GALLERY_SYNC_INTERVAL = float(os.environ.get('GALLERY_SYNC_INTERVAL', 0))
+MODEL_SYNC_INTERVAL = float(os.environ.get('MODEL_SYNC_INTERVAL', 5))
+
+def _remove_path(path):
+    """Delete a file or a directory (a SavedModel) if it exists"""
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.exists(path):
+        os.remove(path)
 
 class FaceRecognitionService:
-    def __init__(self):
+    def __init__(self, encodings_dir=None, data_dir=None):
         self.model_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'models')
         self.model_path = os.path.join(self.model_dir, 'face_recognition_model')
-        self.encodings_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'encodings')
-        self.data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+        # Other directories than the backend's own are used by the benchmark suite
+        self.encodings_dir = encodings_dir or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'encodings')
+        self.data_dir = data_dir or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+        self.quantizer_path = os.path.join(self.encodings_dir, 'ivf_quantizer.npz')
         
         # Create necessary directories
         os.makedirs(self.model_dir, exist_ok=True)
         os.makedirs(self.encodings_dir, exist_ok=True)
         os.makedirs(self.data_dir, exist_ok=True)
         
-        # Dictionary to store user face encodings
-        self.user_encodings = {}
-        self.load_encodings()
+        self.detector = create_detector(FACE_DETECTOR, max_width=FACE_DETECT_MAX_WIDTH)
         
-        # Initialize the model (if available)
-        if os.path.exists(self.model_path):
-            try:
-                self.model = FaceRecognitionModel(model_path=self.model_path)
-                print("Loaded existing face recognition model.")
-            except Exception as e:
-                print(f"Error loading model: {e}")
-                self.model = None
-        else:
-            self.model = None
+        # Gallery index holding all user face encodings, backed by the store
+        self.store = EncodingStore(self.encodings_dir)
+        self.gallery = create_index(FACE_INDEX, **FACE_INDEX_OPTIONS.get(FACE_INDEX, {}))
+        on_lag = lambda seconds: GALLERY_SYNC_LAG_SECONDS.observe(seconds, gallery='encodings')
+        self.gallery_sync = GallerySync(self.store, GALLERY_SYNC_INTERVAL, on_lag=on_lag)
+        with startup_state.timed('encodings_load'):
+            self.load_encodings()
+        
+        # Deep learning embeddings of enrolled users, used in embedding mode
+        self.embedding_store = EncodingStore(self.encodings_dir, dim=EMBEDDING_DIM, name='embeddings')
+        self.embedding_gallery = FlatIndex(dim=EMBEDDING_DIM)
+        on_lag = lambda seconds: GALLERY_SYNC_LAG_SECONDS.observe(seconds, gallery='embeddings')
+        self.embedding_sync = GallerySync(self.embedding_store, GALLERY_SYNC_INTERVAL, on_lag=on_lag)
+        if ENABLE_DEEP_LEARNING and DEEP_LEARNING_MODE == 'embedding':
+            with startup_state.timed('embeddings_load'):
+                self.load_embeddings()
+        
+        # The deep learning model is loaded on first use or by startup.warmup,
+        # and replaced as a whole by install_model when a training job finishes
+        self.deep_learning_mode = DEEP_LEARNING_MODE
+        self.model = None
+        self._model_loaded = False
+        self._model_lock = threading.Lock()
+        self._model_generation = None
+        self._model_checked = 0.0
+        
+        self.match_batcher = None
+        self.predict_batcher = None
+        if ENABLE_MICRO_BATCHING:
+            self.match_batcher = MicroBatcher(
+                lambda encodings: self.gallery.match_many(encodings, tolerance=0.6),
+                MICRO_BATCH_SIZE, MICRO_BATCH_WAIT_MS / 1000.0, name='match-batcher')
+            self.predict_batcher = MicroBatcher(
+                self._predict_grouped,
+                MICRO_BATCH_SIZE, MICRO_BATCH_WAIT_MS / 1000.0, name='predict-batcher')
+    
+    def get_model(self):
+        """Return the deep learning model, loading it (and TensorFlow) on first call"""
+        if self._model_loaded:
+            if MULTI_WORKER:
+                self._check_model_update()
+            return self.model
+        with self._model_lock:
+            if not self._model_loaded:
+                start = time.perf_counter()
+                if ENABLE_DEEP_LEARNING and DEEP_LEARNING_MODE == 'embedding':
+                    try:
+                        self.model = FaceRecognitionModel(mode='embedding', detector=self.detector)
+                        print("Loaded face embedding model.")
+                    except Exception as e:
+                        print(f"Error loading embedding model: {e}")
+                        self.model = None
+                elif ENABLE_DEEP_LEARNING and os.path.exists(self.model_path):
+                    try:
+                        if INFERENCE_BACKEND == 'tflite' and not os.path.exists(self.model_path + '.tflite'):
+                            self.export_model()
+                        self._model_generation = self._saved_model_generation()
+                        self.model = FaceRecognitionModel(model_path=self.model_path, detector=self.detector,
+                                                          backend=INFERENCE_BACKEND)
+                        print(f"Loaded existing face recognition model ({INFERENCE_BACKEND}).")
+                    except Exception as e:
+                        print(f"Error loading model: {e}")
+                        self.model = None
+                if self.model is not None:
+                    MODEL_LOAD_SECONDS.set(time.perf_counter() - start, model=self.model.mode)
+                self._model_loaded = True
+        return self.model
+    
+    def _saved_model_generation(self):
+        """Identity of the saved model file served by this backend, None if there is none"""
+        path = self.model_path + '.tflite' if INFERENCE_BACKEND == 'tflite' else self.model_path
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+    
+    def _check_model_update(self):
+        """Load the saved softmax model again if another worker installed a new one"""
+        now = time.monotonic()
+        if DEEP_LEARNING_MODE != 'softmax' or now - self._model_checked < MODEL_SYNC_INTERVAL:
+            return
+        self._model_checked = now
+        generation = self._saved_model_generation()
+        if generation is None or generation == self._model_generation:
+            return
+        try:
+            start = time.perf_counter()
+            model = FaceRecognitionModel(model_path=self.model_path, detector=self.detector, backend=INFERENCE_BACKEND)
+            model.warmup()
+            MODEL_LOAD_SECONDS.set(time.perf_counter() - start, model=model.mode)
+        except Exception as e:
+            # Possibly caught in the middle of the other worker's file swap; retried on the next check
+            print(f"Error reloading updated model: {e}")
+            return
+        with self._model_lock:
+            self.model = model
+            self._model_generation = generation
+        print("Loaded the model installed by another worker")
+    
+    def _load_shared(self, store, sync, build):
+        """Index over the store's memory-mapped file with its log applied on top (multi-worker mode)
+        
+        The log is applied through `sync`, which then keeps following it.
+        """
+        while True:
+            generation = store.generation()
+            user_ids, matrix = store.load_main()
+            index = build(user_ids, matrix)
+            sync.reset(generation)
+            # -1: the file was rewritten by a compaction meanwhile, start over
+            applied = sync.poll(index, reload=lambda: None)
+            if applied >= 0:
+                return index, applied
     
     def load_encodings(self):
         """Load all saved face encodings"""
-        if not os.path.exists(self.encodings_dir):
+        if not self.store.exists():
+            if any(f.endswith('.pkl') for f in os.listdir(self.encodings_dir)):
+                count = self.store.migrate_pickles(self.encodings_dir)
+                print(f"Migrated {count} pickled encodings to {self.store.main_path}")
+        
+        if MULTI_WORKER:
+            if FACE_INDEX == 'flat':
+                build = lambda user_ids, matrix: OverlayIndex(FlatIndex.from_matrix(user_ids, matrix))
+            else:
+                build = self._build_index
+            try:
+                self.gallery, applied = self._load_shared(self.store, self.gallery_sync, build)
+                if applied >= COMPACT_LOG_RECORDS:
+                    self.store.compact()
+                    self.gallery, _ = self._load_shared(self.store, self.gallery_sync, build)
+            except Exception as e:
+                print(f"Error loading encodings: {e}")
+                return
+            print(f"Loaded {len(self.gallery)} encodings into the shared {FACE_INDEX} index")
             return
         
-        encoding_files = [f for f in os.listdir(self.encodings_dir) if f.endswith('.pkl')]
-        for encoding_file in encoding_files:
-            user_id = encoding_file.split('.')[0]
-            encoding_path = os.path.join(self.encodings_dir, encoding_file)
-            
+        try:
+            user_ids, matrix = self.store.load()
+            if self.store.log_records >= COMPACT_LOG_RECORDS:
+                self.store.compact()
+                user_ids, matrix = self.store.load()
+        except Exception as e:
+            print(f"Error loading encodings: {e}")
+            return
+        
+        self.gallery = self._build_index(user_ids, matrix)
+        print(f"Loaded {len(user_ids)} encodings into the {FACE_INDEX} index")
+    
+    def export_model(self, quantization=TFLITE_QUANTIZATION):
+        """Export the saved Keras model to TFLite, calibrated on the training crops"""
+        model = FaceRecognitionModel(model_path=self.model_path, detector=self.detector)
+        size = model.export_tflite(self.model_path + '.tflite', quantization, calibration_dir=self.data_dir)
+        print(f"Exported the model to TFLite ({quantization}, {size / 1e6:.1f} MB)")
+        return size
+    
+    def load_embeddings(self):
+        """Load the enrolled deep learning embeddings"""
+        if MULTI_WORKER:
+            build = lambda user_ids, matrix: OverlayIndex(FlatIndex.from_matrix(user_ids, matrix))
             try:
-                with open(encoding_path, 'rb') as f:
-                    encoding = pickle.load(f)
-                self.user_encodings[user_id] = encoding
-                print(f"Loaded encoding for user: {user_id}")
+                self.embedding_gallery, applied = self._load_shared(self.embedding_store, self.embedding_sync, build)
+                if applied >= COMPACT_LOG_RECORDS:
+                    self.embedding_store.compact()
+                    self.embedding_gallery, _ = self._load_shared(self.embedding_store, self.embedding_sync, build)
             except Exception as e:
-                print(f"Error loading encoding for {user_id}: {e}")
+                print(f"Error loading embeddings: {e}")
+                return
+            print(f"Loaded {len(self.embedding_gallery)} face embeddings into the shared index")
+            return
+        
+        try:
+            user_ids, matrix = self.embedding_store.load()
+            if self.embedding_store.log_records >= COMPACT_LOG_RECORDS:
+                self.embedding_store.compact()
+                user_ids, matrix = self.embedding_store.load()
+        except Exception as e:
+            print(f"Error loading embeddings: {e}")
+            return
+        
+        self.embedding_gallery = FlatIndex.from_matrix(user_ids, matrix)
+        print(f"Loaded {len(user_ids)} face embeddings")
+    
+    def _build_index(self, user_ids, matrix):
+        """Build the configured gallery index over the stored encodings"""
+        if FACE_INDEX == 'flat':
+            # Matches straight off the memory-mapped store without a copy
+            return FlatIndex.from_matrix(user_ids, matrix)
+        
+        index = create_index(FACE_INDEX, **FACE_INDEX_OPTIONS.get(FACE_INDEX, {}))
+        saved_size = None
+        if os.path.exists(self.quantizer_path):
+            try:
+                index.load_quantizer(self.quantizer_path)
+                saved_size = index.trained_size
+            except Exception as e:
+                print(f"Error loading index quantizer: {e}")
+        index.add_many(user_ids, matrix)
+        if index.is_trained and index.trained_size != saved_size:
+            index.save_quantizer(self.quantizer_path)
+        return index
+    
+    def _load_image(self, image, scale=1.0):
+        """Accept either an image path or an already decoded RGB array, returns (image, scale)
+        
+        `scale` maps the image's coordinates back to the original frame's:
+        paths are decoded at reduced resolution when large enough, and an
+        array decoded that way is passed with its scale.
+        """
+        if isinstance(image, np.ndarray):
+            return image, scale
+        with span('decode'):
+            return read_image(image, DECODE_MIN_WIDTH)
+    
+    def sync_galleries(self):
+        """Apply the enrolments other workers appended to the shared stores (multi-worker mode)"""
+        if not MULTI_WORKER:
+            return
+        with span('gallery_sync'):
+            self.gallery_sync.poll(self.gallery, self.load_encodings)
+            if ENABLE_DEEP_LEARNING and DEEP_LEARNING_MODE == 'embedding':
+                self.embedding_sync.poll(self.embedding_gallery, self.load_embeddings)
+    
+    def match_encodings(self, encodings):
+        """Match encodings against the gallery, sharing a batch with concurrent requests if enabled"""
+        self.sync_galleries()
+        with span('match'):
+            if self.match_batcher:
+                return self.match_batcher.submit(encodings)
+            return self.gallery.match_many(encodings, tolerance=0.6)
+    
+    def _predict_grouped(self, items):
+        """Batch function of the predict batcher: (model, crop) items, one predict call per model
+        
+        Items name their model so a batch straddling a model swap still gets
+        each face predicted by the model its request started with.
+        """
+        groups = {}
+        for i, (model, _) in enumerate(items):
+            groups.setdefault(id(model), (model, []))[1].append(i)
+        results = [None] * len(items)
+        for model, indices in groups.values():
+            predictions = model.predict_batch(np.stack([items[i][1] for i in indices]))
+            for i, prediction in zip(indices, predictions):
+                results[i] = prediction
+        return results
     
-    def register_user(self, user_id, image_path):
+    def _predict_faces(self, batch, model):
+        """Run the deep learning model, sharing a batch with concurrent requests if enabled"""
+        if self.predict_batcher:
+            return np.stack(self.predict_batcher.submit([(model, crop) for crop in batch]))
+        return model.predict_batch(batch)
+    
+    def enrol_embedding(self, user_id, image, face):
+        """Enrol a user for the embedding model with one forward pass over their face (x, y, w, h)"""
+        model = self.get_model()
+        batch = model.preprocess_faces(image, [face])
+        embedding = model.embed_faces(batch, predict_fn=lambda batch: self._predict_faces(batch, model))[0]
+        self.embedding_store.append(user_id, embedding)
+        self.embedding_gallery.add(user_id, embedding)
+    
+    def _recognize_deep(self, model, image):
+        """Every face detected by the given deep learning model in either mode, with an id of None if unknown"""
+        predict_fn = lambda batch: self._predict_faces(batch, model)
+        if model.mode == 'embedding':
+            self.sync_galleries()
+            return model.recognize_face(image, EMBEDDING_MIN_SIMILARITY,
+                                        predict_fn=predict_fn, gallery=self.embedding_gallery, span=span)
+        return model.recognize_face(image, predict_fn=predict_fn, span=span)
+    
+    def register_user(self, user_id, image):
         """Register a new user with the face recognition system"""
         # Read and process the image
-        image = cv2.imread(image_path)
+        image, _ = self._load_image(image)
         if image is None:
             return {"success": False, "error": "Failed to read image"}
         
         # Use face_recognition library for quick encoding
         import face_recognition
-        face_locations = face_recognition.face_locations(image)
+        with span('detect'):
+            face_locations = self.detector.detect(image)
         
         if not face_locations:
             return {"success": False, "error": "No face detected in the image"}
         
         # Get encoding for the first face found
-        face_encoding = face_recognition.face_encodings(image, face_locations)[0]
+        with span('encode'):
+            face_encoding = face_recognition.face_encodings(image, face_locations[:1])[0]
         
-        # Save encoding to file
-        encoding_file = os.path.join(self.encodings_dir, f"{user_id}.pkl")
-        with open(encoding_file, 'wb') as f:
-            pickle.dump(face_encoding, f)
+        # Append encoding to the gallery store
+        with span('store_append'):
+            self.store.append(user_id, face_encoding)
         
         # Store in memory
-        self.user_encodings[user_id] = face_encoding
+        self.gallery.add(user_id, face_encoding)
+        
+        # In embedding mode the deep learning path needs no retraining either
+        face_top, face_right, face_bottom, face_left = face_locations[0]
+        if ENABLE_DEEP_LEARNING and DEEP_LEARNING_MODE == 'embedding' and self.get_model():
+            self.enrol_embedding(user_id, image, (face_left, face_top, face_right - face_left, face_bottom - face_top))
         
         # Organize training data for deep learning model (optional)
         user_data_dir = os.path.join(self.data_dir, user_id)
         os.makedirs(user_data_dir, exist_ok=True)
         
         # Save face image for training
-        face_top, face_right, face_bottom, face_left = face_locations[0]
         face_img = image[face_top:face_bottom, face_left:face_right]
-        cv2.imwrite(os.path.join(user_data_dir, f"{user_id}_face.jpg"), face_img)
+        cv2.imwrite(os.path.join(user_data_dir, f"{user_id}_face.jpg"), to_bgr(face_img))
+        ENROLMENTS.inc(source='single')
         
         return {"success": True, "message": f"User {user_id} registered successfully"}
     
-    def recognize_face(self, image_path, use_deep_learning=False):
-        """Recognize a face in an image"""
+    def register_many(self, user_ids, encodings):
+        """Enrol precomputed encodings (e.g. from bulk_enrol) with one batched store append
+        
+        In embedding mode the users' saved face crops are embedded too.
+        """
+        with span('store_append'):
+            self.store.append_many(user_ids, encodings)
+        self.gallery.add_many(user_ids, encodings)
+        ENROLMENTS.inc(len(user_ids), source='bulk')
+        
+        if ENABLE_DEEP_LEARNING and DEEP_LEARNING_MODE == 'embedding' and self.get_model():
+            model = self.get_model()
+            crops = [read_image(os.path.join(self.data_dir, user_id, f"{user_id}_face.jpg"))[0] for user_id in user_ids]
+            enrolled = [(user_id, crop) for user_id, crop in zip(user_ids, crops) if crop is not None]
+            for start in range(0, len(enrolled), 32):
+                chunk = enrolled[start:start + 32]
+                batch = model.preprocess_crops(crop for _, crop in chunk)
+                embeddings = model.embed_faces(batch)
+                self.embedding_store.append_many([user_id for user_id, _ in chunk], embeddings)
+                self.embedding_gallery.add_many([user_id for user_id, _ in chunk], embeddings)
+        
+        return {"success": True, "message": f"Registered {len(user_ids)} users"}
+    
+    def recognize_face(self, image, use_deep_learning=False):
+        """Recognize a face in an image (path or decoded RGB array)"""
         # Read the image
-        image = cv2.imread(image_path)
+        image, _ = self._load_image(image)
         if image is None:
             return {"success": False, "error": "Failed to read image"}
         
         # If deep learning model is available and requested, use it
-        if use_deep_learning and self.model:
-            results = self.model.recognize_face(image)
-            if results:
+        # Hold on to one model for the whole request, even if a new one is installed meanwhile
+        model = self.get_model() if use_deep_learning else None
+        if model:
+            results = self._recognize_deep(model, image)
+            if not results:
+                RECOGNITIONS.inc(path='deep', result='no_face')
+                return {"success": False, "error": "No face detected in the image"}
+            recognized = [result for result in results if result['id'] is not None]
+            RECOGNITIONS.inc(path='deep', result='recognized' if recognized else 'unknown')
+            if recognized:
                 return {
                     "success": True,
                     "recognized": True,
-                    "user": results[0]['id'],
-                    "confidence": results[0]['confidence']
+                    "user": recognized[0]['id'],
+                    "confidence": recognized[0]['confidence']
                 }
             else:
                 return {"success": True, "recognized": False}
         
         # Otherwise use face_recognition library
         import face_recognition
-        face_locations = face_recognition.face_locations(image)
+        with span('detect'):
+            face_locations = self.detector.detect(image)
         
         if not face_locations:
+            RECOGNITIONS.inc(path='encoding', result='no_face')
             return {"success": False, "error": "No face detected in the image"}
         
         # Get encoding for the face
-        face_encoding = face_recognition.face_encodings(image, face_locations)[0]
-        
-        # Compare with registered faces
-        for user_id, stored_encoding in self.user_encodings.items():
-            # Compare faces
-            match = face_recognition.compare_faces([stored_encoding], face_encoding, tolerance=0.6)[0]
-            if match:
-                distance = face_recognition.face_distance([stored_encoding], face_encoding)[0]
-                confidence = 1.0 - float(distance)
-                
-                return {
-                    "success": True,
-                    "recognized": True,
-                    "user": user_id,
-                    "confidence": confidence
-                }
+        with span('encode'):
+            face_encoding = face_recognition.face_encodings(image, face_locations[:1])[0]
+        
+        # Compare with all registered faces at once and keep the closest
+        match = self.match_encodings([face_encoding])[0]
+        RECOGNITIONS.inc(path='encoding', result='recognized' if match["user"] is not None else 'unknown')
+        if match["user"] is not None:
+            return {
+                "success": True,
+                "recognized": True,
+                "user": match["user"],
+                "confidence": 1.0 - match["distance"],
+                "margin": match["margin"],
+                "candidates": [
+                    {"user": user_id, "distance": distance}
+                    for user_id, distance in match["top_k"]
+                ]
+            }
         
         return {"success": True, "recognized": False}
     
-    def train_model(self, force_retrain=False):
-        """Train or update the deep learning model"""
+    def recognize_faces(self, image, use_deep_learning=False, scale=1.0):
+        """Recognize every face in an image in one batch
+        
+        Boxes are in the original frame's coordinates: pass the `scale` of
+        an array decoded at reduced resolution (see models.preprocessing).
+        """
+        image, scale = self._load_image(image, scale)
+        if image is None:
+            return {"success": False, "error": "Failed to read image"}
+        
+        # The deep learning model already predicts all detected faces in one batch
+        # Hold on to one model for the whole request, even if a new one is installed meanwhile
+        model = self.get_model() if use_deep_learning else None
+        if model:
+            results = self._recognize_deep(model, image)
+            if not results:
+                RECOGNITIONS.inc(path='deep', result='no_face')
+                return {"success": False, "error": "No face detected in the image"}
+            recognized = sum(result['id'] is not None for result in results)
+            RECOGNITIONS.inc(recognized, path='deep', result='recognized')
+            RECOGNITIONS.inc(len(results) - recognized, path='deep', result='unknown')
+            
+            faces = []
+            for result in results:
+                face = {"recognized": result['id'] is not None, "box": scale_box(result['box'], scale)}
+                if result['id'] is not None:
+                    face["user"] = result['id']
+                    face["confidence"] = result['confidence']
+                faces.append(face)
+            return {"success": True, "faces": faces}
+        
+        import face_recognition
+        with span('detect'):
+            face_locations = self.detector.detect(image)
+        
+        if not face_locations:
+            RECOGNITIONS.inc(path='encoding', result='no_face')
+            return {"success": False, "error": "No face detected in the image"}
+        
+        # Encode all faces in one call, then match them with one distance computation
+        with span('encode'):
+            face_encodings = face_recognition.face_encodings(image, face_locations)
+        matches = self.match_encodings(face_encodings)
+        recognized = sum(match["user"] is not None for match in matches)
+        RECOGNITIONS.inc(recognized, path='encoding', result='recognized')
+        RECOGNITIONS.inc(len(matches) - recognized, path='encoding', result='unknown')
+        
+        faces = []
+        for (top, right, bottom, left), match in zip(face_locations, matches):
+            face = {
+                "recognized": match["user"] is not None,
+                "box": scale_box([int(left), int(top), int(right - left), int(bottom - top)], scale)
+            }
+            if match["user"] is not None:
+                face["user"] = match["user"]
+                face["confidence"] = 1.0 - match["distance"]
+            faces.append(face)
+        
+        return {"success": True, "faces": faces}
+    
+    def user_count(self):
+        """Number of users with training data, i.e. of classes of the softmax model"""
+        return len([d for d in os.listdir(self.data_dir) if os.path.isdir(os.path.join(self.data_dir, d))])
+    
+    def check_training(self, incremental=False):
+        """Return why the model cannot be trained right now, or None"""
+        if not ENABLE_DEEP_LEARNING:
+            return "Deep learning is disabled (ENABLE_DEEP_LEARNING=false)"
+        
+        if DEEP_LEARNING_MODE == 'embedding':
+            return None
+        
         # Check if we have enough users/data
-        if len(os.listdir(self.data_dir)) < 2:
-            return {"success": False, "error": "Need at least 2 users to train the model"}
+        if self.user_count() < 2:
+            return "Need at least 2 users to train the model"
+        if incremental and not os.path.exists(self.model_path):
+            return "Incremental training needs a trained model; train the full model first"
+        return None
+    
+    def install_model(self, path):
+        """Load a newly trained model saved at `path`, make it the saved model and start serving it
+        
+        The new model is loaded and warmed up first, then swapped in with a
+        single assignment: requests already running finish on the old model.
+        """
+        start = time.perf_counter()
+        model = FaceRecognitionModel(model_path=path, detector=self.detector, backend=INFERENCE_BACKEND)
+        model.warmup()
+        MODEL_LOAD_SECONDS.set(time.perf_counter() - start, model=model.mode)
+        
+        # Replace the saved model (and its class mapping and TFLite export);
+        # the old one is only deleted once the new one is in place
+        previous = self.model_path + '.previous'
+        suffixes = ('', '_classes.pkl', '.tflite')
+        for suffix in suffixes:
+            _remove_path(previous + suffix)
+            if os.path.exists(path + suffix):
+                if os.path.exists(self.model_path + suffix):
+                    os.replace(self.model_path + suffix, previous + suffix)
+                os.replace(path + suffix, self.model_path + suffix)
+        model.model_path = self.model_path
+        
+        with self._model_lock:
+            self.model = model
+            self._model_loaded = True
+            self._model_generation = self._saved_model_generation()
+        
+        for suffix in suffixes:
+            _remove_path(previous + suffix)
+        print(f"Installed newly trained model from {path}")
+        return model
+    
+    def train_model(self, force_retrain=False, incremental=False):
+        """Train or update the deep learning model in this process
+        
+        With `incremental`, only users missing from the saved model are
+        added (see FaceRecognitionModel.update) instead of retraining the
+        whole network. Blocks for the whole run; the API queues a
+        training_jobs.TrainingJobManager job instead.
+        """
+        error = self.check_training(incremental)
+        if error:
+            return {"success": False, "error": error}
         
-        # Initialize model
-        num_classes = len(os.listdir(self.data_dir))
-        if self.model is None or force_retrain:
-            self.model = FaceRecognitionModel(num_classes=num_classes)
+        if DEEP_LEARNING_MODE == 'embedding':
+            return self.rebuild_embeddings()
+        
+        # Initialize model, from a copy of the saved one so the serving model is never modified
+        if force_retrain or not os.path.exists(self.model_path):
+            model = FaceRecognitionModel(num_classes=self.user_count(), detector=self.detector)
+        else:
+            model = FaceRecognitionModel(model_path=self.model_path, detector=self.detector)
         
         try:
-            # Train the model
-            self.model.train(self.data_dir, epochs=15, batch_size=8)
-            
-            # Fine-tune the model
-            self.model.fine_tune(self.data_dir, epochs=5, batch_size=8)
+            if incremental and not force_retrain:
+                added = model.update(self.data_dir, epochs=5, batch_size=8)
+                message = f"Added {len(added)} users to the model"
+            else:
+                # Train the model
+                model.train(self.data_dir, epochs=15, batch_size=8)
+                
+                # Fine-tune the model
+                model.fine_tune(self.data_dir, epochs=5, batch_size=8)
+                message = "Model trained successfully"
             
             # Save the model
-            self.model.save_model(self.model_path)
+            tflite = TFLITE_QUANTIZATION if INFERENCE_BACKEND == 'tflite' else None
+            model.save_model(self.model_path, tflite=tflite, calibration_dir=self.data_dir)
+            if tflite:
+                model = FaceRecognitionModel(model_path=self.model_path, detector=self.detector, backend='tflite')
+            
+            with self._model_lock:
+                self.model = model
+                self._model_loaded = True
+                self._model_generation = self._saved_model_generation()
             
-            return {"success": True, "message": "Model trained successfully"}
+            return {"success": True, "message": message}
         except Exception as e:
             return {"success": False, "error": f"Training failed: {str(e)}"}
 
+    def rebuild_embeddings(self):
+        """Re-embed every user's saved face crops, e.g. for users enrolled before embedding mode
+        
+        Nothing is trained: each user's crops are embedded in one batch and
+        their mean (re-normalized) becomes the user's embedding.
+        """
+        model = self.get_model()
+        if model is None:
+            return {"success": False, "error": "Embedding model could not be loaded"}
+        
+        try:
+            user_ids, embeddings = [], []
+            for user_id in sorted(os.listdir(self.data_dir)):
+                user_data_dir = os.path.join(self.data_dir, user_id)
+                if not os.path.isdir(user_data_dir):
+                    continue
+                crops = [read_image(os.path.join(user_data_dir, f))[0] for f in sorted(os.listdir(user_data_dir))]
+                crops = [crop for crop in crops if crop is not None]
+                if not crops:
+                    continue
+                batch = model.preprocess_crops(crops)
+                embedding = model.embed_faces(batch).mean(axis=0)
+                user_ids.append(user_id)
+                embeddings.append(embedding / max(np.linalg.norm(embedding), 1e-12))
+            
+            matrix = np.array(embeddings, dtype=np.float32).reshape(-1, EMBEDDING_DIM)
+            # Appended after the existing records, so they win when the log is folded in
+            self.embedding_store.append_many(user_ids, matrix)
+            self.embedding_store.compact()
+            self.load_embeddings()
+            
+            return {"success": True, "message": f"Embedded {len(user_ids)} users, no training needed"}
+        except Exception as e:
+            return {"success": False, "error": f"Embedding failed: {str(e)}"}
+
 # Singleton instance
 face_service = FaceRecognitionService() 
\ No newline at end of file
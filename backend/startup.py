@@ -0,0 +1,91 @@
+import gc
+import time
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+
+class StartupState:
+    """Readiness flag and load timings of this worker, served by /api/health"""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.ready = False
+        self.error = None
+        self.timings = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def timed(self, name):
+        """Record how long a startup step took, in milliseconds"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = round((time.perf_counter() - start) * 1000, 1)
+
+    def to_dict(self):
+        return {
+            "ready": self.ready,
+            "error": self.error,
+            "uptime": round(time.time() - self.started_at, 1),
+            "timings": dict(self.timings)
+        }
+
+
+startup_state = StartupState()
+
+
+def warmup(service=None):
+    """Preload every model this worker serves and run a dummy inference on each
+
+    Safe to call more than once; only the first call does any work. Call it
+    before the worker accepts traffic (gunicorn post_worker_init, or before
+    app.run) so the first real request does not pay for model loading.
+    """
+    with startup_state._lock:
+        if startup_state.ready:
+            return startup_state
+        try:
+            if service is None:
+                from model_integration import face_service as service
+
+            with startup_state.timed('face_recognition_import'):
+                import face_recognition
+
+            with startup_state.timed('face_recognition_warmup'):
+                dummy = np.zeros((96, 96, 3), dtype=np.uint8)
+                face_recognition.face_locations(dummy)
+                face_recognition.face_encodings(dummy, [(8, 88, 88, 8)])
+
+            with startup_state.timed('deep_learning_load'):
+                model = service.get_model()
+
+            if model is not None:
+                with startup_state.timed('deep_learning_warmup'):
+                    model.warmup()
+
+            startup_state.ready = True
+        except Exception as e:
+            startup_state.error = str(e)
+            print(f"Warmup failed: {e}")
+    return startup_state
+
+
+def preload_shared():
+    """Load the read-only models every worker needs in the gunicorn master, before it forks
+
+    The dlib detector, landmark and face encoding models behind
+    face_recognition are loaded once and their pages are shared
+    copy-on-write by every worker. TensorFlow is not fork-safe, so the deep
+    learning model is still loaded by each worker (a TFLite export is
+    memory-mapped, so its weights are shared through the page cache anyway).
+    """
+    start = time.perf_counter()
+    import cv2  # noqa: F401
+    import face_recognition
+    face_recognition.face_encodings(np.zeros((96, 96, 3), dtype=np.uint8), [(8, 88, 88, 8)])
+    # Keep the collector from touching (and so copying) every preloaded object in the workers
+    gc.freeze()
+    return round((time.perf_counter() - start) * 1000, 1)
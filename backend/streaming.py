@@ -0,0 +1,159 @@
+import re
+import time
+
+from tracking import FaceTracker
+from metrics import span
+from models.preprocessing import decode_image, scale_box
+
+JPEG_START = b'\xff\xd8'
+JPEG_END = b'\xff\xd9'
+# Markers without a length field: TEM and the restart markers
+STANDALONE_MARKERS = frozenset([0x01] + list(range(0xD0, 0xD8)))
+# The first marker after entropy-coded data: 0xFF not followed by a stuffed
+# zero, a restart marker or another fill byte
+SCAN_MARKER = re.compile(b'\xff[^\x00\xd0-\xd7\xff]')
+
+
+class FrameTooLarge(ValueError):
+    pass
+
+
+def _jpeg_end(buffer, pos, in_scan=False):
+    """Walk the segments of the JPEG at the start of `buffer` from `pos`
+
+    Returns (end, pos, in_scan): `end` is the offset just past the
+    end-of-image marker, None while the frame is incomplete, in which case
+    `pos` and `in_scan` say where to resume once more data has arrived.
+    Segments are skipped by their length, so an FFD9 inside an embedded
+    EXIF/JFIF thumbnail does not end the frame. Data that does not parse as
+    JPEG segments ends at its first FFD9.
+    """
+    while True:
+        if in_scan:
+            # Entropy-coded data runs until the next marker
+            match = SCAN_MARKER.search(buffer, pos)
+            if match is None:
+                # Keep a trailing 0xFF, its marker byte may be in the next chunk
+                return None, max(pos, len(buffer) - 1), True
+            pos, in_scan = match.start(), False
+        if pos + 2 > len(buffer):
+            return None, pos, False
+        if buffer[pos] != 0xFF:
+            end = buffer.find(JPEG_END, pos)
+            return (end + 2 if end >= 0 else None), pos, False
+        marker = buffer[pos + 1]
+        if marker == 0xFF:
+            # Fill byte before a marker
+            pos += 1
+        elif marker == 0xD9:
+            return pos + 2, pos, False
+        elif marker in STANDALONE_MARKERS:
+            pos += 2
+        else:
+            if pos + 4 > len(buffer):
+                return None, pos, False
+            segment_end = pos + 2 + int.from_bytes(buffer[pos + 2:pos + 4], 'big')
+            if segment_end > len(buffer):
+                return None, pos, False
+            pos, in_scan = segment_end, marker == 0xDA
+
+
+def iter_jpeg_frames(stream, chunk_size=65536, max_frame_size=8 * 1024 * 1024):
+    """Split a continuous MJPEG byte stream into JPEG frames
+
+    Works on raw concatenated JPEGs as well as multipart/x-mixed-replace
+    bodies, since everything between an end-of-image and the next
+    start-of-image marker (boundaries, part headers) is skipped. Raises
+    FrameTooLarge once a frame grows past `max_frame_size`; frames before
+    it have been yielded.
+    """
+    buffer = b''
+    pos = None
+    in_scan = False
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            return
+        buffer += chunk
+        while True:
+            if pos is None:
+                start = buffer.find(JPEG_START)
+                if start < 0:
+                    buffer = buffer[-1:]
+                    break
+                buffer = buffer[start:]
+                pos, in_scan = 2, False
+            end, pos, in_scan = _jpeg_end(buffer, pos, in_scan)
+            if end is None:
+                if len(buffer) > max_frame_size:
+                    raise FrameTooLarge("MJPEG frame exceeds the maximum frame size")
+                break
+            yield buffer[:end]
+            buffer = buffer[end:]
+            pos = None
+
+
+class StreamSession:
+    """Recognition over a continuous camera stream
+
+    Faces are tracked across frames and only new tracks, or tracks due for
+    re-verification, are encoded and matched against the gallery. JPEG
+    frames at least twice `decode_min_width` wide are decoded at reduced
+    resolution; boxes are reported in the original frame's coordinates.
+    """
+
+    def __init__(self, service, on_recognized=None, reverify_interval=2.0, decode_min_width=0):
+        self.service = service
+        self.decode_min_width = decode_min_width
+        self.on_recognized = on_recognized
+        self.tracker = FaceTracker(reverify_interval=reverify_interval)
+        self.frames = 0
+        self.faces_seen = 0
+        self.encode_calls = 0
+        self.started = time.monotonic()
+
+    def process_frame(self, image, now=None, scale=1.0):
+        """Track and recognize the faces of one decoded RGB frame (`scale`: see decode_image)"""
+        import face_recognition
+        now = time.monotonic() if now is None else now
+        self.frames += 1
+
+        with span('detect'):
+            boxes = self.service.detector.detect(image)
+        self.faces_seen += len(boxes)
+        stale = self.tracker.update(boxes, now)
+
+        if stale:
+            self.encode_calls += len(stale)
+            with span('encode'):
+                encodings = face_recognition.face_encodings(image, [track.box for track in stale])
+            for track, match in zip(stale, self.service.match_encodings(encodings)):
+                newly_recognized = match["user"] is not None and match["user"] != track.user
+                track.user = match["user"]
+                track.confidence = 1.0 - match["distance"] if match["user"] is not None else None
+                track.last_verified = now
+                if newly_recognized and self.on_recognized:
+                    self.on_recognized(track.user, track.confidence)
+
+        faces = [track.to_dict() for track in self.tracker.visible()]
+        if scale != 1.0:
+            for face in faces:
+                face["box"] = scale_box(face["box"], scale)
+        return {"frame": self.frames, "faces": faces}
+
+    def process_jpeg(self, data, now=None):
+        with span('decode'):
+            image, scale = decode_image(data, self.decode_min_width)
+        if image is None:
+            return {"frame": self.frames, "error": "Failed to decode frame"}
+        return self.process_frame(image, now, scale)
+
+    def stats(self):
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        return {
+            "frames": self.frames,
+            "fps": self.frames / elapsed,
+            "encodeCalls": self.encode_calls,
+            "encodesSaved": self.faces_seen - self.encode_calls,
+            "encodesSavedPerMinute": (self.faces_seen - self.encode_calls) * 60.0 / elapsed
+        }
@@ -0,0 +1,91 @@
+import itertools
+
+
+def iou(a, b):
+    """Intersection over union of two (top, right, bottom, left) boxes"""
+    top, bottom = max(a[0], b[0]), min(a[2], b[2])
+    left, right = max(a[3], b[3]), min(a[1], b[1])
+    if bottom <= top or right <= left:
+        return 0.0
+    intersection = (bottom - top) * (right - left)
+    area_a = (a[2] - a[0]) * (a[1] - a[3])
+    area_b = (b[2] - b[0]) * (b[1] - b[3])
+    return intersection / float(area_a + area_b - intersection)
+
+
+class Track:
+    """A face followed across frames, with the identity of its last encode"""
+
+    def __init__(self, track_id, box, now):
+        self.id = track_id
+        self.box = box
+        self.user = None
+        self.confidence = None
+        self.first_seen = now
+        self.last_verified = None
+        self.missed = 0
+
+    def to_dict(self):
+        top, right, bottom, left = self.box
+        return {
+            "trackId": self.id,
+            "recognized": self.user is not None,
+            "userId": self.user,
+            "confidence": self.confidence,
+            "box": [int(left), int(top), int(right - left), int(bottom - top)]
+        }
+
+
+class FaceTracker:
+    """Greedy IOU tracker over detector boxes
+
+    `update` associates the boxes of a new frame with existing tracks and
+    returns the tracks that need a (re-)encode: new tracks, and tracks not
+    verified for `reverify_interval` seconds. Tracks missing for more than
+    `max_missed` frames are dropped.
+    """
+
+    def __init__(self, iou_threshold=0.3, max_missed=5, reverify_interval=2.0):
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.reverify_interval = reverify_interval
+        self.tracks = []
+        self._ids = itertools.count(1)
+
+    def update(self, boxes, now):
+        pairs = sorted(
+            ((iou(track.box, box), t, b)
+             for t, track in enumerate(self.tracks)
+             for b, box in enumerate(boxes)),
+            reverse=True
+        )
+        matched_tracks, matched_boxes = set(), set()
+        for overlap, t, b in pairs:
+            if overlap < self.iou_threshold:
+                break
+            if t in matched_tracks or b in matched_boxes:
+                continue
+            self.tracks[t].box = boxes[b]
+            self.tracks[t].missed = 0
+            matched_tracks.add(t)
+            matched_boxes.add(b)
+
+        for t, track in enumerate(self.tracks):
+            if t not in matched_tracks:
+                track.missed += 1
+        self.tracks = [track for track in self.tracks if track.missed <= self.max_missed]
+
+        for b, box in enumerate(boxes):
+            if b not in matched_boxes:
+                self.tracks.append(Track(next(self._ids), box, now))
+
+        return [
+            track for track in self.tracks
+            if track.missed == 0 and (
+                track.last_verified is None
+                or now - track.last_verified >= self.reverify_interval
+            )
+        ]
+
+    def visible(self):
+        return [track for track in self.tracks if track.missed == 0]
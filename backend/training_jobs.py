@@ -0,0 +1,493 @@
+"""Background training jobs for the deep learning model
+
+Training runs in a separate Python process (this file run as a script), so
+the serving process keeps its CPU time, its request threads and its
+current model while a job runs. The worker reports progress as JSON lines
+on stdout; once it has saved the new model, the serving process loads and
+warms it up and swaps it into the FaceRecognitionService.
+
+Jobs are recorded in SQLite, so every gunicorn worker can report and cancel
+a job queued by another one, and an exclusive file lock lets only one
+process at a time train and install a model.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import queue
+import shutil
+import signal
+import sqlite3
+import argparse
+import threading
+import subprocess
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process deployments only
+    fcntl = None
+
+JOB_STATUSES = ('queued', 'running', 'succeeded', 'failed', 'cancelled')
+DONE_STATUSES = ('succeeded', 'failed', 'cancelled')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS training_jobs (
+    job_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    owner_pid INTEGER NOT NULL,
+    pid INTEGER,
+    state TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_training_jobs_created ON training_jobs (created_at);
+"""
+
+
+class TrainingJob:
+    """State of one training job, as reported to clients"""
+
+    def __init__(self, force_retrain=False, incremental=False):
+        self.id = uuid.uuid4().hex
+        self.force_retrain = force_retrain
+        self.incremental = incremental
+        self.status = 'queued'
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.phase = None
+        self.epoch = 0
+        self.epochs = 0
+        self.completed_epochs = 0
+        self.total_epochs = 0
+        self.loss = None
+        self.accuracy = None
+        self.eta = None
+        self.message = None
+        self.error = None
+        self.process = None
+        self._training_started = None
+        self._progress = 0.0
+
+    @property
+    def done(self):
+        return self.status in DONE_STATUSES
+
+    def on_event(self, event):
+        """Apply a progress event from the worker"""
+        if event["event"] == 'started':
+            self._training_started = time.monotonic()
+            self.total_epochs = event["totalEpochs"]
+        elif event["event"] == 'epoch':
+            self.phase = event["phase"]
+            self.epoch = event["epoch"]
+            self.epochs = event["epochs"]
+            self.loss = event.get("loss")
+            self.accuracy = event.get("accuracy")
+            self.completed_epochs += 1
+            elapsed = time.monotonic() - self._training_started
+            remaining = max(self.total_epochs - self.completed_epochs, 0)
+            self.eta = elapsed / self.completed_epochs * remaining
+        elif event["event"] == 'saved':
+            self.message = event.get("message")
+        elif event["event"] == 'error':
+            self.error = event["error"]
+
+    def to_dict(self):
+        return {
+            "jobId": self.id,
+            "status": self.status,
+            "forceRetrain": self.force_retrain,
+            "incremental": self.incremental,
+            "createdAt": self.created,
+            "startedAt": self.started,
+            "finishedAt": self.finished,
+            "phase": self.phase,
+            "epoch": self.epoch,
+            "epochs": self.epochs,
+            "progress": self.completed_epochs / self.total_epochs if self.total_epochs else self._progress,
+            "loss": self.loss,
+            "accuracy": self.accuracy,
+            "etaSeconds": self.eta,
+            "message": self.message,
+            "error": self.error
+        }
+
+    @classmethod
+    def from_dict(cls, state):
+        """A job as recorded by `to_dict`, e.g. one run by another worker"""
+        job = cls(state["forceRetrain"], state["incremental"])
+        job.id = state["jobId"]
+        job.status = state["status"]
+        job.created = state["createdAt"]
+        job.started = state["startedAt"]
+        job.finished = state["finishedAt"]
+        job.phase = state["phase"]
+        job.epoch = state["epoch"]
+        job.epochs = state["epochs"]
+        job.loss = state["loss"]
+        job.accuracy = state["accuracy"]
+        job.eta = state["etaSeconds"]
+        job.message = state["message"]
+        job.error = state["error"]
+        job._progress = state["progress"]
+        return job
+
+
+def _remove_model(path):
+    """Delete a saved model (a SavedModel directory or a single file), its class mapping and TFLite export"""
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.exists(path):
+        os.remove(path)
+    for suffix in ('_classes.pkl', '.tflite'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class TrainingJobStore:
+    """Training jobs in SQLite (WAL), shared by every worker process
+
+    A job's row holds its latest `to_dict` state, the pid of the worker
+    that runs it and, while it trains, the pid of its training process. A
+    cancelled job stays cancelled: later updates from its worker are
+    ignored.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self):
+        """One connection per thread, as sqlite3 connections are not shareable"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def save(self, job, pid=None):
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                'INSERT INTO training_jobs (job_id, status, created_at, owner_pid, pid, state) '
+                'VALUES (?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (job_id) DO UPDATE SET status = excluded.status, pid = excluded.pid, '
+                'state = excluded.state WHERE training_jobs.status != \'cancelled\'',
+                (job.id, job.status, job.created, os.getpid(), pid, json.dumps(job.to_dict()))
+            )
+
+    def get(self, job_id):
+        row = self._connection().execute('SELECT state FROM training_jobs WHERE job_id = ?', (job_id,)).fetchone()
+        return TrainingJob.from_dict(json.loads(row[0])) if row else None
+
+    def status(self, job_id):
+        row = self._connection().execute('SELECT status FROM training_jobs WHERE job_id = ?', (job_id,)).fetchone()
+        return row[0] if row else None
+
+    def all(self):
+        rows = self._connection().execute('SELECT state FROM training_jobs ORDER BY created_at DESC').fetchall()
+        return [TrainingJob.from_dict(json.loads(row[0])) for row in rows]
+
+    def cancel(self, job):
+        """Mark a job cancelled; returns the pid of its training process, if it has one"""
+        conn = self._connection()
+        with conn:
+            pid = conn.execute('SELECT pid FROM training_jobs WHERE job_id = ?', (job.id,)).fetchone()
+            conn.execute(
+                'UPDATE training_jobs SET status = ?, pid = NULL, state = ? WHERE job_id = ?',
+                (job.status, json.dumps(job.to_dict()), job.id)
+            )
+        return pid[0] if pid else None
+
+    def prune(self, keep):
+        """Delete all but the `keep` most recent finished jobs"""
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                f"DELETE FROM training_jobs WHERE job_id IN (SELECT job_id FROM training_jobs "
+                f"WHERE status IN ({','.join('?' * len(DONE_STATUSES))}) ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                DONE_STATUSES + (keep,)
+            )
+
+    def fail_orphans(self):
+        """Fail the unfinished jobs of worker processes that are gone, e.g. after a restart"""
+        rows = self._connection().execute(
+            "SELECT job_id, owner_pid FROM training_jobs WHERE status IN ('queued', 'running')"
+        ).fetchall()
+        for job_id, owner_pid in rows:
+            if owner_pid == os.getpid() or _pid_alive(owner_pid):
+                continue
+            job = self.get(job_id)
+            job.status = 'failed'
+            job.finished = time.time()
+            job.error = "The server process running this job stopped"
+            self.save(job)
+
+
+class TrainingJobManager:
+    """Queue of training jobs, run one at a time by a background thread
+
+    Jobs that train the softmax classifier run in a worker process; in
+    embedding mode a job only re-embeds the saved face crops, which runs
+    in the serving process without any training. Job state lives in a
+    TrainingJobStore at `db_path`, shared by every worker; a job runs in
+    the worker it was submitted to, once it holds the training lock.
+    """
+
+    def __init__(self, service, db_path, epochs=15, fine_tune_epochs=5, batch_size=8, history=50, tflite=None):
+        self.service = service
+        self.store = TrainingJobStore(db_path)
+        self.lock_path = os.path.join(service.model_dir, '.training.lock')
+        self.tflite = tflite
+        self.epochs = epochs
+        self.fine_tune_epochs = fine_tune_epochs
+        self.batch_size = batch_size
+        self.history = history
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self.store.fail_orphans()
+        self._runner = threading.Thread(target=self._run, name='training-jobs', daemon=True)
+        self._runner.start()
+
+    def submit(self, force_retrain=False, incremental=False):
+        """Queue a training job; returns {"success", "job"} or {"success": False, "error"}
+
+        An `incremental` job only adds the users missing from the saved
+        model, on their images plus a replay sample of the others.
+        """
+        incremental = incremental and not force_retrain
+        error = self.service.check_training(incremental)
+        if error:
+            return {"success": False, "error": error}
+
+        job = TrainingJob(force_retrain, incremental)
+        with self._lock:
+            self._jobs[job.id] = job
+        self.store.save(job)
+        self.store.prune(self.history)
+        self._queue.put(job)
+        return {"success": True, "job": job}
+
+    def get(self, job_id):
+        return self.store.get(job_id)
+
+    def jobs(self):
+        return self.store.all()
+
+    def cancel(self, job_id):
+        """Cancel a queued job, or stop the training process of a running one, whichever worker runs it"""
+        job = self._jobs.get(job_id) or self.store.get(job_id)
+        if job is None:
+            return {"success": False, "error": "Unknown job"}
+        if job.done:
+            return {"success": False, "error": f"Job already {job.status}"}
+
+        job.status = 'cancelled'
+        job.finished = time.time()
+        pid = self.store.cancel(job)
+        if job.process is not None:
+            job.process.terminate()
+        elif pid is not None:
+            # Trained on behalf of another worker; its runner sees the job cancelled
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        return {"success": True, "job": job}
+
+    def _cancelled(self, job):
+        """Whether the job was cancelled, possibly through another worker"""
+        if job.status == 'running' and self.store.status(job.id) == 'cancelled':
+            job.status = 'cancelled'
+        return job.status == 'cancelled'
+
+    @contextmanager
+    def _training_lock(self):
+        """Exclusive lock against training and installing in other worker processes"""
+        if fcntl is None:
+            yield
+            return
+        with open(self.lock_path, 'a') as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            try:
+                with self._training_lock():
+                    if job.status != 'queued' or self.store.status(job.id) != 'queued':
+                        continue
+                    job.status = 'running'
+                    job.started = time.time()
+                    self.store.save(job)
+                    try:
+                        if self.service.deep_learning_mode == 'embedding':
+                            self._run_embedding(job)
+                        else:
+                            self._run_training(job)
+                    except Exception as e:
+                        if job.status == 'running':
+                            job.status = 'failed'
+                            job.error = str(e)
+                    if not job.finished:
+                        job.finished = time.time()
+                    self.store.save(job)
+            finally:
+                with self._lock:
+                    self._jobs.pop(job.id, None)
+
+    def _run_embedding(self, job):
+        job.phase = 'embed'
+        self.store.save(job)
+        result = self.service.rebuild_embeddings()
+        if self._cancelled(job):
+            return
+        if result["success"]:
+            job.status = 'succeeded'
+            job.message = result["message"]
+        else:
+            job.status = 'failed'
+            job.error = result["error"]
+
+    def _run_training(self, job):
+        output = os.path.join(self.service.model_dir, f'.training-{job.id}')
+        command = [
+            sys.executable, os.path.abspath(__file__),
+            '--data-dir', self.service.data_dir,
+            '--output', output,
+            '--epochs', str(self.epochs),
+            '--fine-tune-epochs', str(self.fine_tune_epochs),
+            '--batch-size', str(self.batch_size)
+        ]
+        if not job.force_retrain and os.path.exists(self.service.model_path):
+            command += ['--base-model', self.service.model_path]
+        if job.incremental:
+            command += ['--incremental']
+        if self.tflite:
+            command += ['--tflite', self.tflite]
+
+        try:
+            job.process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+            self.store.save(job, pid=job.process.pid)
+            if self._cancelled(job):
+                job.process.terminate()
+            saved = False
+            for line in job.process.stdout:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue
+                job.on_event(event)
+                self.store.save(job, pid=job.process.pid)
+                saved = saved or event["event"] == 'saved'
+            returncode = job.process.wait()
+
+            if self._cancelled(job) or job.status != 'running':
+                return
+            if not saved or returncode != 0:
+                job.status = 'failed'
+                job.error = job.error or f"Training process exited with code {returncode}"
+                return
+
+            # Only swap once the new model is loaded and warmed up
+            job.phase = 'install'
+            self.store.save(job)
+            self.service.install_model(output)
+            job.status = 'succeeded'
+            job.message = job.message or "Model trained successfully"
+        finally:
+            job.process = None
+            _remove_model(output)
+
+
+def _train(args):
+    """Worker process: train, fine-tune and save a model, reporting progress as JSON lines"""
+    events = sys.stdout
+    # Keras progress bars go to stderr so stdout only carries events
+    sys.stdout = sys.stderr
+
+    def emit(**event):
+        events.write(json.dumps(event) + '\n')
+        events.flush()
+
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    try:
+        from models.face_model import FaceRecognitionModel, _keras
+        keras = _keras()
+
+        class ProgressCallback(keras.callbacks.Callback):
+            def __init__(self, phase, epochs):
+                super().__init__()
+                self.phase = phase
+                self.epochs = epochs
+
+            def on_epoch_end(self, epoch, logs=None):
+                logs = logs or {}
+                emit(event='epoch', phase=self.phase, epoch=epoch + 1, epochs=self.epochs,
+                     loss=float(logs['loss']) if 'loss' in logs else None,
+                     accuracy=float(logs['accuracy']) if 'accuracy' in logs else None)
+
+        num_classes = len([d for d in os.listdir(args.data_dir) if os.path.isdir(os.path.join(args.data_dir, d))])
+        if args.base_model:
+            model = FaceRecognitionModel(model_path=args.base_model)
+        else:
+            model = FaceRecognitionModel(num_classes=num_classes)
+
+        if args.incremental:
+            if not args.base_model:
+                raise ValueError("Incremental training needs a base model")
+            # Only new users are learned; reuses the fine-tuning epoch budget
+            emit(event='started', totalEpochs=args.fine_tune_epochs)
+            added = model.update(args.data_dir, epochs=args.fine_tune_epochs, batch_size=args.batch_size,
+                                 callbacks=[ProgressCallback('update', args.fine_tune_epochs)])
+            message = f"Added {len(added)} users to the model"
+        else:
+            emit(event='started', totalEpochs=args.epochs + args.fine_tune_epochs)
+            model.train(args.data_dir, epochs=args.epochs, batch_size=args.batch_size,
+                        callbacks=[ProgressCallback('train', args.epochs)])
+            model.fine_tune(args.data_dir, epochs=args.fine_tune_epochs, batch_size=args.batch_size,
+                            callbacks=[ProgressCallback('fine_tune', args.fine_tune_epochs)])
+            message = "Model trained successfully"
+        model.save_model(args.output, tflite=args.tflite, calibration_dir=args.data_dir)
+        emit(event='saved', path=args.output, message=message)
+    except Exception as e:
+        emit(event='error', error=f"Training failed: {str(e)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Train the face recognition model (training job worker)')
+    parser.add_argument('--data-dir', required=True)
+    parser.add_argument('--output', required=True)
+    parser.add_argument('--base-model')
+    parser.add_argument('--incremental', action='store_true')
+    parser.add_argument('--tflite', help='Also export to TFLite: float32, float16 or int8')
+    parser.add_argument('--epochs', type=int, default=15)
+    parser.add_argument('--fine-tune-epochs', type=int, default=5)
+    parser.add_argument('--batch-size', type=int, default=8)
+    sys.exit(_train(parser.parse_args()))
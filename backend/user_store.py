@@ -0,0 +1,86 @@
+import os
+import sqlite3
+import datetime
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    photo TEXT,
+    registered_at TEXT NOT NULL
+);
+"""
+
+
+class UserStore:
+    """Registered users (id, display name, photo) in SQLite (WAL)
+
+    Kept in the database rather than in process memory, so every gunicorn
+    worker sees a registration as soon as it is committed, and users
+    survive a restart.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self):
+        """One connection per thread, as sqlite3 connections are not shareable"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def put(self, user_id, name, photo=None):
+        self.put_many([(user_id, name, photo)])
+
+    def put_many(self, users):
+        """Insert or update (user_id, name, photo) tuples in one transaction"""
+        now = datetime.datetime.now().isoformat()
+        conn = self._connection()
+        with conn:
+            conn.executemany(
+                'INSERT INTO users (user_id, name, photo, registered_at) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT (user_id) DO UPDATE SET name = excluded.name, photo = excluded.photo',
+                [(user_id, name, photo, now) for user_id, name, photo in users]
+            )
+
+    def get(self, user_id):
+        row = self._connection().execute(
+            'SELECT user_id, name, photo FROM users WHERE user_id = ?', (user_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {"userId": row["user_id"], "name": row["name"], "photo": row["photo"]}
+
+    def name(self, user_id):
+        """Display name of a user, their id if unknown"""
+        row = self._connection().execute('SELECT name FROM users WHERE user_id = ?', (user_id,)).fetchone()
+        return row[0] if row else user_id
+
+    def names(self, user_ids):
+        """{user_id: name} of the known users among `user_ids`"""
+        user_ids = list(user_ids)
+        if not user_ids:
+            return {}
+        rows = self._connection().execute(
+            f"SELECT user_id, name FROM users WHERE user_id IN ({','.join('?' * len(user_ids))})", user_ids
+        ).fetchall()
+        return {row[0]: row[1] for row in rows}
+
+    def all(self):
+        rows = self._connection().execute('SELECT user_id, name FROM users ORDER BY registered_at, user_id').fetchall()
+        return [{"userId": row[0], "name": row[1]} for row in rows]
+
+    def count(self):
+        return self._connection().execute('SELECT COUNT(*) FROM users').fetchone()[0]
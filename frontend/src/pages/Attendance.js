@@ -15,30 +15,44 @@ import {
 } from '@mui/material';
 import { DataGrid } from '@mui/x-data-grid';
 import { Search as SearchIcon, Refresh as RefreshIcon } from '@mui/icons-material';
-import { getAttendanceRecords } from '../utils/api';
+import { getAttendanceRecords, getAttendanceStats } from '../utils/api';
 
 const Attendance = () => {
   const [records, setRecords] = useState([]);
+  const [total, setTotal] = useState(0);
+  const [stats, setStats] = useState(null);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
   const [searchTerm, setSearchTerm] = useState('');
-  const [filteredRecords, setFilteredRecords] = useState([]);
+  const [userFilter, setUserFilter] = useState('');
+  const [paginationModel, setPaginationModel] = useState({ page: 0, pageSize: 10 });
 
   const fetchAttendanceRecords = async () => {
     try {
       setLoading(true);
       setError(null);
-      const data = await getAttendanceRecords();
+      
+      // Only the page on screen is fetched; the server pages and filters the records
+      const [data, statsData] = await Promise.all([
+        getAttendanceRecords({
+          page: paginationModel.page + 1,
+          pageSize: paginationModel.pageSize,
+          userId: userFilter || undefined,
+        }),
+        getAttendanceStats(1)
+      ]);
       
       // Add unique id to each record for DataGrid
-      const recordsWithId = data.map((record, index) => ({
+      const offset = paginationModel.page * paginationModel.pageSize;
+      const recordsWithId = data.records.map((record, index) => ({
         ...record,
-        id: index,
+        id: offset + index,
         recordTime: new Date(record.timestamp),
       }));
       
       setRecords(recordsWithId);
-      setFilteredRecords(recordsWithId);
+      setTotal(data.total);
+      setStats(statsData);
     } catch (error) {
       console.error('Error fetching attendance records:', error);
       setError('Failed to load attendance records. Please try again later.');
@@ -49,20 +63,20 @@ const Attendance = () => {
 
   useEffect(() => {
     fetchAttendanceRecords();
-  }, []);
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, [paginationModel, userFilter]);
 
   useEffect(() => {
-    if (searchTerm.trim() === '') {
-      setFilteredRecords(records);
-    } else {
-      const term = searchTerm.toLowerCase();
-      const filtered = records.filter(record => 
-        record.userId?.toLowerCase().includes(term) || 
-        record.name?.toLowerCase().includes(term)
-      );
-      setFilteredRecords(filtered);
-    }
-  }, [searchTerm, records]);
+    // Filter on the server once typing pauses, starting again from the first page
+    const timer = setTimeout(() => {
+      const filter = searchTerm.trim();
+      if (filter !== userFilter) {
+        setUserFilter(filter);
+        setPaginationModel(model => ({ ...model, page: 0 }));
+      }
+    }, 400);
+    return () => clearTimeout(timer);
+  }, [searchTerm, userFilter]);
 
   const handleRefresh = () => {
     fetchAttendanceRecords();
@@ -80,14 +94,16 @@ const Attendance = () => {
     }).format(date);
   };
 
+  // Records come newest first from the server, which sorts across all pages
   const columns = [
-    { field: 'userId', headerName: 'User ID', flex: 1, minWidth: 120 },
-    { field: 'name', headerName: 'Name', flex: 1.5, minWidth: 150 },
+    { field: 'userId', headerName: 'User ID', flex: 1, minWidth: 120, sortable: false },
+    { field: 'name', headerName: 'Name', flex: 1.5, minWidth: 150, sortable: false },
     { 
       field: 'timestamp', 
       headerName: 'Date & Time', 
       flex: 1.5, 
       minWidth: 180,
+      sortable: false,
       valueGetter: (params) => params.row.timestamp,
       renderCell: (params) => formatDate(params.value)
     },
@@ -96,6 +112,7 @@ const Attendance = () => {
       headerName: 'Confidence', 
       flex: 1, 
       minWidth: 120,
+      sortable: false,
       renderCell: (params) => {
         const value = params.value || 0;
         const percentage = (value * 100).toFixed(2);
@@ -118,14 +135,10 @@ const Attendance = () => {
     },
   ];
 
-  // Calculate dashboard statistics
-  const totalRecords = filteredRecords.length;
-  const uniqueUsers = new Set(filteredRecords.map(r => r.userId)).size;
-  const todayStart = new Date();
-  todayStart.setHours(0, 0, 0, 0);
-  const todayRecords = filteredRecords.filter(r => 
-    new Date(r.timestamp) >= todayStart
-  ).length;
+  // Record count of the current filter; today's and unique attendance come from the server aggregates
+  const totalRecords = total;
+  const todayRecords = stats ? stats.today : 0;
+  const uniqueUsers = stats ? stats.uniqueAttendees : 0;
 
   return (
     <Box sx={{ py: 2 }}>
@@ -180,7 +193,7 @@ const Attendance = () => {
           
           <Box sx={{ display: 'flex', gap: 2, width: { xs: '100%', sm: 'auto' }, mt: { xs: 2, sm: 0 } }}>
             <TextField
-              placeholder="Search by name or ID"
+              placeholder="Filter by user ID"
               size="small"
               value={searchTerm}
               onChange={e => setSearchTerm(e.target.value)}
@@ -209,18 +222,14 @@ const Attendance = () => {
         ) : (
           <Box sx={{ height: 400, width: '100%' }}>
             <DataGrid
-              rows={filteredRecords}
+              rows={records}
               columns={columns}
               loading={loading}
               pagination
-              initialState={{
-                pagination: {
-                  paginationModel: { pageSize: 10 },
-                },
-                sorting: {
-                  sortModel: [{ field: 'timestamp', sort: 'desc' }],
-                },
-              }}
+              paginationMode="server"
+              rowCount={total}
+              paginationModel={paginationModel}
+              onPaginationModelChange={setPaginationModel}
               pageSizeOptions={[5, 10, 25, 50]}
             />
           </Box>
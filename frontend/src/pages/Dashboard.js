@@ -19,7 +19,7 @@ import {
   EventAvailable as EventAvailableIcon,
   EmojiPeople as EmojiPeopleIcon,
 } from '@mui/icons-material';
-import { getUsers, getAttendanceRecords } from '../utils/api';
+import { getUsers, getAttendanceStats } from '../utils/api';
 import { 
   Chart as ChartJS, 
   CategoryScale, 
@@ -48,21 +48,21 @@ const Dashboard = () => {
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
   const [users, setUsers] = useState([]);
-  const [attendanceRecords, setAttendanceRecords] = useState([]);
+  const [stats, setStats] = useState(null);
 
   const fetchDashboardData = async () => {
     try {
       setLoading(true);
       setError(null);
       
-      // Fetch both users and attendance records in parallel
-      const [usersData, attendanceData] = await Promise.all([
+      // Fetch users and server-side attendance aggregates in parallel
+      const [usersData, statsData] = await Promise.all([
         getUsers(),
-        getAttendanceRecords()
+        getAttendanceStats(7)
       ]);
       
       setUsers(usersData);
-      setAttendanceRecords(attendanceData);
+      setStats(statsData);
     } catch (error) {
       console.error('Error fetching dashboard data:', error);
       setError('Failed to load dashboard data. Please try again later.');
@@ -75,67 +75,23 @@ const Dashboard = () => {
     fetchDashboardData();
   }, []);
 
-  // Get today's attendance
-  const getTodayAttendance = () => {
-    const today = new Date();
-    today.setHours(0, 0, 0, 0);
-    
-    return attendanceRecords.filter(record => {
-      const recordDate = new Date(record.timestamp);
-      return recordDate >= today;
-    });
-  };
-
   // Get last 7 days attendance data
   const getLast7DaysData = () => {
-    const dates = [];
-    const counts = [];
-    
-    // Create an array of the last 7 days
-    for (let i = 6; i >= 0; i--) {
-      const date = new Date();
-      date.setDate(date.getDate() - i);
-      date.setHours(0, 0, 0, 0);
-      
-      const dateStr = date.toLocaleDateString('en-US', { weekday: 'short', month: 'short', day: 'numeric' });
-      dates.push(dateStr);
-      
-      // Count records for this day
-      const count = attendanceRecords.filter(record => {
-        const recordDate = new Date(record.timestamp);
-        return recordDate >= date && recordDate < new Date(date.getTime() + 24 * 60 * 60 * 1000);
-      }).length;
-      
-      counts.push(count);
-    }
+    const perDay = stats ? stats.perDay : [];
+    const dates = perDay.map(({ date }) => {
+      const [year, month, day] = date.split('-').map(Number);
+      return new Date(year, month - 1, day).toLocaleDateString('en-US', { weekday: 'short', month: 'short', day: 'numeric' });
+    });
+    const counts = perDay.map(({ count }) => count);
     
     return { dates, counts };
   };
 
-  // Get user distribution data
+  // Get user distribution data (top 5 users by attendance count)
   const getUserDistributionData = () => {
-    const userAttendanceCounts = {};
-    
-    // Count attendance records for each user
-    attendanceRecords.forEach(record => {
-      if (userAttendanceCounts[record.userId]) {
-        userAttendanceCounts[record.userId]++;
-      } else {
-        userAttendanceCounts[record.userId] = 1;
-      }
-    });
-    
-    // Get the top 5 users by attendance count
-    const topUsers = Object.entries(userAttendanceCounts)
-      .sort((a, b) => b[1] - a[1])
-      .slice(0, 5);
-    
-    const labels = topUsers.map(([userId]) => {
-      const user = users.find(u => u.userId === userId);
-      return user ? user.name : userId;
-    });
-    
-    const data = topUsers.map(([_, count]) => count);
+    const perUser = stats ? stats.perUser : [];
+    const labels = perUser.map(({ userId, name }) => name || userId);
+    const data = perUser.map(({ count }) => count);
     
     return { labels, data };
   };
@@ -146,9 +102,9 @@ const Dashboard = () => {
 
   // Calculate statistics
   const totalUsers = users.length;
-  const totalRecords = attendanceRecords.length;
-  const todayRecords = getTodayAttendance().length;
-  const uniqueAttendees = new Set(attendanceRecords.map(record => record.userId)).size;
+  const totalRecords = stats ? stats.total : 0;
+  const todayRecords = stats ? stats.today : 0;
+  const uniqueAttendees = stats ? stats.uniqueAttendees : 0;
 
   const barChartData = {
     labels: last7DaysData.dates,
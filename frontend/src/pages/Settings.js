@@ -1,4 +1,4 @@
-import React, { useState } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import {
   Box,
   Button,
@@ -13,6 +13,7 @@ import {
   Typography,
   Alert,
   CircularProgress,
+  LinearProgress,
   Snackbar,
   List,
   ListItem,
@@ -25,43 +26,101 @@ import {
   CheckCircle as CheckCircleIcon,
   Info as InfoIcon,
 } from '@mui/icons-material';
-import { trainModel } from '../utils/api';
+import { trainModel, getTrainingJob, cancelTrainingJob } from '../utils/api';
+
+const POLL_INTERVAL_MS = 2000;
 
 const Settings = () => {
   const [forceRetrain, setForceRetrain] = useState(false);
+  const [incremental, setIncremental] = useState(false);
   const [loading, setLoading] = useState(false);
   const [success, setSuccess] = useState(false);
   const [error, setError] = useState(null);
+  const [job, setJob] = useState(null);
+  const pollRef = useRef(null);
   const [snackbar, setSnackbar] = useState({
     open: false,
     message: '',
     severity: 'success'
   });
 
+  const stopPolling = () => {
+    if (pollRef.current) {
+      clearInterval(pollRef.current);
+      pollRef.current = null;
+    }
+  };
+
+  useEffect(() => stopPolling, []);
+
+  const handleJobUpdate = (updated) => {
+    setJob(updated);
+    if (updated.status === 'queued' || updated.status === 'running') {
+      return;
+    }
+    
+    stopPolling();
+    setLoading(false);
+    if (updated.status === 'succeeded') {
+      setSuccess(true);
+      setSnackbar({
+        open: true,
+        message: updated.message || 'Model trained successfully!',
+        severity: 'success'
+      });
+    } else if (updated.status === 'failed') {
+      setError(updated.error || 'Failed to train model. Please try again.');
+      setSnackbar({
+        open: true,
+        message: updated.error || 'Failed to train model. Please try again.',
+        severity: 'error'
+      });
+    }
+  };
+
   const handleTrainModel = async () => {
     try {
       setLoading(true);
       setError(null);
       setSuccess(false);
       
-      const result = await trainModel(forceRetrain);
+      const result = await trainModel(forceRetrain, incremental);
+      setJob(result.job);
       
-      setSuccess(true);
-      setSnackbar({
-        open: true,
-        message: result.message || 'Model trained successfully!',
-        severity: 'success'
-      });
+      // Training runs in the background; poll the job until it is done
+      stopPolling();
+      pollRef.current = setInterval(async () => {
+        try {
+          handleJobUpdate(await getTrainingJob(result.jobId));
+        } catch (error) {
+          console.error('Error polling training job:', error);
+        }
+      }, POLL_INTERVAL_MS);
     } catch (error) {
       console.error('Error training model:', error);
+      setLoading(false);
       setError(error.error || 'Failed to train model. Please try again.');
       setSnackbar({
         open: true,
         message: error.error || 'Failed to train model. Please try again.',
         severity: 'error'
       });
-    } finally {
-      setLoading(false);
+    }
+  };
+
+  const handleCancelTraining = async () => {
+    if (!job) {
+      return;
+    }
+    try {
+      handleJobUpdate(await cancelTrainingJob(job.jobId));
+      setSnackbar({
+        open: true,
+        message: 'Training cancelled',
+        severity: 'info'
+      });
+    } catch (error) {
+      console.error('Error cancelling training:', error);
     }
   };
 
@@ -110,6 +169,17 @@ const Settings = () => {
                 label="Force retraining (discard previous model)"
               />
               
+              <FormControlLabel
+                control={
+                  <Checkbox
+                    checked={incremental && !forceRetrain}
+                    onChange={(e) => setIncremental(e.target.checked)}
+                    disabled={loading || forceRetrain}
+                  />
+                }
+                label="Only add new users (incremental, much faster)"
+              />
+              
               <Box sx={{ mt: 3, display: 'flex', justifyContent: 'center' }}>
                 <Button
                   variant="contained"
@@ -122,8 +192,36 @@ const Settings = () => {
                 >
                   {loading ? 'Training...' : 'Train Model'}
                 </Button>
+                {loading && job && (
+                  <Button
+                    variant="outlined"
+                    color="secondary"
+                    size="large"
+                    onClick={handleCancelTraining}
+                    sx={{ py: 1.5, px: 4, ml: 2 }}
+                  >
+                    Cancel
+                  </Button>
+                )}
               </Box>
               
+              {loading && job && (
+                <Box sx={{ mt: 3 }}>
+                  <LinearProgress
+                    variant={job.status === 'running' && job.progress > 0 ? 'determinate' : 'indeterminate'}
+                    value={job.progress * 100}
+                  />
+                  <Typography variant="body2" color="textSecondary" sx={{ mt: 1 }}>
+                    {job.status === 'queued' && 'Waiting for an earlier training job...'}
+                    {job.status === 'running' && job.epoch > 0 &&
+                      `${job.phase === 'fine_tune' ? 'Fine-tuning' : 'Training'}: epoch ${job.epoch}/${job.epochs}` +
+                      (job.loss !== null ? `, loss ${job.loss.toFixed(4)}` : '') +
+                      (job.etaSeconds !== null ? `, about ${Math.ceil(job.etaSeconds / 60)} min left` : '')}
+                    {job.status === 'running' && job.epoch === 0 && 'Preparing training...'}
+                  </Typography>
+                </Box>
+              )}
+              
               {success && (
                 <Alert severity="success" sx={{ mt: 3 }}>
                   <Typography variant="body2">
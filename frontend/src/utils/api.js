@@ -40,7 +40,7 @@ export const registerUser = async (userId, name, imageData) => {
 };
 
 // Recognize a face
-export const recognizeFace = async (imageData, useDeepLearning = false) => {
+export const recognizeFace = async (imageData, useDeepLearning = false, multiFace = false) => {
   try {
     const formData = new FormData();
     
@@ -48,6 +48,7 @@ export const recognizeFace = async (imageData, useDeepLearning = false) => {
     const imageFile = dataURLtoFile(imageData, 'recognition.jpg');
     formData.append('file', imageFile);
     formData.append('useDeepLearning', useDeepLearning.toString());
+    formData.append('multiFace', multiFace.toString());
     
     const response = await axios.post(`${API_URL}/recognize`, formData, {
       headers: {
@@ -62,17 +63,29 @@ export const recognizeFace = async (imageData, useDeepLearning = false) => {
   }
 };
 
-// Get all attendance records
-export const getAttendanceRecords = async () => {
+// Get one page of attendance records, newest first ({ page, pageSize, userId, start, end }),
+// with the total number of matching records
+export const getAttendanceRecords = async (params = {}) => {
   try {
-    const response = await axios.get(`${API_URL}/attendance`);
-    return response.data.records;
+    const response = await axios.get(`${API_URL}/attendance`, { params });
+    return { records: response.data.records, total: response.data.total };
   } catch (error) {
     console.error('Error fetching attendance records:', error);
     throw error.response?.data || error.message;
   }
 };
 
+// Get dashboard aggregates computed by the server
+export const getAttendanceStats = async (days = 7) => {
+  try {
+    const response = await axios.get(`${API_URL}/attendance/stats`, { params: { days } });
+    return response.data;
+  } catch (error) {
+    console.error('Error fetching attendance stats:', error);
+    throw error.response?.data || error.message;
+  }
+};
+
 // Get all users
 export const getUsers = async () => {
   try {
@@ -84,15 +97,38 @@ export const getUsers = async () => {
   }
 };
 
-// Train the model
-export const trainModel = async (forceRetrain = false) => {
+// Queue a model training job; the response carries its jobId
+export const trainModel = async (forceRetrain = false, incremental = false) => {
   try {
     const response = await axios.post(`${API_URL}/train-model`, {
-      forceRetrain
+      forceRetrain,
+      incremental
     });
     return response.data;
   } catch (error) {
     console.error('Error training model:', error);
     throw error.response?.data || error.message;
   }
-}; 
\ No newline at end of file
+}; 
+
+// Get the status and progress of a training job
+export const getTrainingJob = async (jobId) => {
+  try {
+    const response = await axios.get(`${API_URL}/train-model/jobs/${jobId}`);
+    return response.data.job;
+  } catch (error) {
+    console.error('Error fetching training job:', error);
+    throw error.response?.data || error.message;
+  }
+};
+
+// Cancel a queued or running training job
+export const cancelTrainingJob = async (jobId) => {
+  try {
+    const response = await axios.post(`${API_URL}/train-model/jobs/${jobId}/cancel`);
+    return response.data.job;
+  } catch (error) {
+    console.error('Error cancelling training job:', error);
+    throw error.response?.data || error.message;
+  }
+};
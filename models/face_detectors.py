@@ -0,0 +1,129 @@
+import os
+import cv2
+import numpy as np
+
+DETECTOR_KINDS = ('hog', 'haar', 'dnn')
+
+DNN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'face_detector')
+DNN_PROTOTXT = os.path.join(DNN_DIR, 'deploy.prototxt')
+DNN_WEIGHTS = os.path.join(DNN_DIR, 'res10_300x300_ssd_iter_140000.caffemodel')
+
+
+def to_xywh(box):
+    """(top, right, bottom, left) -> (x, y, w, h)"""
+    top, right, bottom, left = box
+    return (left, top, right - left, bottom - top)
+
+
+class FaceDetector:
+    """Base detector: runs on a downscaled copy and maps boxes back to full resolution
+
+    Images are RGB, as decoded by models.preprocessing. Subclasses
+    implement `_detect(image)`, returning (top, right, bottom,
+    left) boxes in the coordinates of the image they are given. Frames
+    wider than `max_width` are shrunk before detection; boxes returned by
+    `detect` are always in the coordinates of the original frame.
+    """
+
+    kind = None
+
+    def __init__(self, max_width=640):
+        self.max_width = max_width
+
+    def detect(self, image):
+        height, width = image.shape[:2]
+        scale = 1.0
+        small = image
+        if self.max_width and width > self.max_width:
+            scale = self.max_width / float(width)
+            small = cv2.resize(image, (self.max_width, int(round(height * scale))),
+                               interpolation=cv2.INTER_AREA)
+
+        boxes = []
+        for top, right, bottom, left in self._detect(small):
+            top, right, bottom, left = (int(round(v / scale)) for v in (top, right, bottom, left))
+            top, left = max(top, 0), max(left, 0)
+            bottom, right = min(bottom, height), min(right, width)
+            if bottom > top and right > left:
+                boxes.append((top, right, bottom, left))
+        return boxes
+
+    def _detect(self, image):
+        raise NotImplementedError
+
+
+class HOGDetector(FaceDetector):
+    """dlib HOG detector from the face_recognition library"""
+
+    kind = 'hog'
+
+    def __init__(self, max_width=640, upsample=1):
+        super().__init__(max_width)
+        self.upsample = upsample
+
+    def _detect(self, image):
+        import face_recognition
+        return face_recognition.face_locations(image, number_of_times_to_upsample=self.upsample, model='hog')
+
+
+class HaarDetector(FaceDetector):
+    """OpenCV Haar cascade"""
+
+    kind = 'haar'
+
+    def __init__(self, max_width=640, scale_factor=1.1, min_neighbors=5, min_size=(30, 30)):
+        super().__init__(max_width)
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self.min_size = min_size
+        self.cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+
+    def _detect(self, image):
+        gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+        faces = self.cascade.detectMultiScale(
+            gray,
+            scaleFactor=self.scale_factor,
+            minNeighbors=self.min_neighbors,
+            minSize=self.min_size
+        )
+        return [(y, x + w, y + h, x) for x, y, w, h in faces]
+
+
+class DNNDetector(FaceDetector):
+    """OpenCV DNN ResNet-10 SSD face detector, run on the CPU
+
+    Needs the Caffe model files, by default in models/face_detector/
+    (deploy.prototxt and res10_300x300_ssd_iter_140000.caffemodel).
+    """
+
+    kind = 'dnn'
+
+    def __init__(self, max_width=640, confidence=0.5, prototxt=DNN_PROTOTXT, weights=DNN_WEIGHTS):
+        super().__init__(max_width)
+        for path in (prototxt, weights):
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"DNN face detector file not found: {path}")
+        self.confidence = confidence
+        self.net = cv2.dnn.readNetFromCaffe(prototxt, weights)
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+
+    def _detect(self, image):
+        height, width = image.shape[:2]
+        # The Caffe model takes BGR: swap channels, the mean is in the model's order
+        blob = cv2.dnn.blobFromImage(image, 1.0, (300, 300), (104.0, 177.0, 123.0), swapRB=True)
+        self.net.setInput(blob)
+        detections = self.net.forward()[0, 0]
+        detections = detections[detections[:, 2] >= self.confidence]
+        boxes = detections[:, 3:7] * np.array([width, height, width, height])
+        return [(int(y1), int(x2), int(y2), int(x1)) for x1, y1, x2, y2 in boxes]
+
+
+_DETECTOR_CLASSES = {cls.kind: cls for cls in (HOGDetector, HaarDetector, DNNDetector)}
+
+
+def create_detector(kind='hog', **options):
+    """Create a face detector of the given kind ('hog', 'haar' or 'dnn')"""
+    if kind not in _DETECTOR_CLASSES:
+        raise ValueError(f"Unknown detector kind '{kind}', expected one of {DETECTOR_KINDS}")
+    return _DETECTOR_CLASSES[kind](**options)
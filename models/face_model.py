@@ -1,29 +1,72 @@
 import os
 import numpy as np
-import tensorflow as tf
-from tensorflow.keras.applications import VGG16
-from tensorflow.keras.layers import Dense, Flatten, GlobalAveragePooling2D
-from tensorflow.keras.models import Model, load_model
-from tensorflow.keras.optimizers import Adam
-from tensorflow.keras.preprocessing.image import ImageDataGenerator
-import cv2
 import pickle
+from contextlib import nullcontext
+
+from models.face_detectors import HaarDetector, to_xywh
+from models.preprocessing import FaceBatchBuffer, read_image
+from models.training_data import DatasetCache, BatchLoader
+from models.tflite_backend import TFLiteModel, export_tflite
+
+MODEL_MODES = ('softmax', 'embedding')
+# Inference runtimes for a saved softmax model: the Keras model itself, or its
+# TFLite export (`<model_path>.tflite`, see save_model/export_tflite)
+INFERENCE_BACKENDS = ('keras', 'tflite')
+
+def _keras():
+    """Import TensorFlow/Keras on first use, so importing this module stays cheap"""
+    from tensorflow import keras
+    return keras
 
 class FaceRecognitionModel:
-    def __init__(self, model_path=None, num_classes=None):
+    """VGG16-based face recognition
+    
+    In 'softmax' mode a classifier head over the registered users is trained
+    on top of the frozen backbone. In 'embedding' mode the frozen backbone
+    plus average pooling is used as a feature extractor instead: faces are
+    enrolled by storing their embeddings and recognized by nearest
+    neighbour, so a new user never requires retraining.
+    
+    With backend='tflite' a saved model is served from its TFLite export
+    instead of the Keras model; it can then only be used for inference.
+    """
+    
+    def __init__(self, model_path=None, num_classes=None, detector=None, mode='softmax', backend='keras'):
+        if mode not in MODEL_MODES:
+            raise ValueError(f"Unknown model mode '{mode}', expected one of {MODEL_MODES}")
+        if backend not in INFERENCE_BACKENDS:
+            raise ValueError(f"Unknown inference backend '{backend}', expected one of {INFERENCE_BACKENDS}")
         self.model_path = model_path
         self.num_classes = num_classes
+        self.mode = mode
+        self.backend = backend
         self.model = None
-        self.face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+        self.classes = {}
+        self.class_indices = {}
+        self._detector = detector
         self.input_shape = (224, 224, 3)
+        self.batch_buffer = FaceBatchBuffer(self.input_shape)
         
-        if model_path and os.path.exists(model_path):
+        if mode == 'embedding':
+            self.build_feature_extractor()
+        elif model_path and os.path.exists(model_path):
             self.load_model()
         elif num_classes:
             self.build_model(num_classes)
     
+    @property
+    def detector(self):
+        """Face detector, a Haar cascade unless one was passed in; built on first use"""
+        if self._detector is None:
+            self._detector = HaarDetector()
+        return self._detector
+    
     def build_model(self, num_classes):
         """Build a deep learning model based on VGG16 for face recognition"""
+        keras = _keras()
+        VGG16 = keras.applications.VGG16
+        Dense, GlobalAveragePooling2D = keras.layers.Dense, keras.layers.GlobalAveragePooling2D
+        
         # Use VGG16 as the base model
         base_model = VGG16(weights='imagenet', include_top=False, input_shape=self.input_shape)
         
@@ -39,77 +82,196 @@ class FaceRecognitionModel:
         predictions = Dense(num_classes, activation='softmax')(x)
         
         # Create the model
-        self.model = Model(inputs=base_model.input, outputs=predictions)
+        self.model = keras.models.Model(inputs=base_model.input, outputs=predictions)
         
         # Compile the model
         self.model.compile(
-            optimizer=Adam(0.0001),
+            optimizer=keras.optimizers.Adam(0.0001),
             loss='categorical_crossentropy',
             metrics=['accuracy']
         )
         
         return self.model
     
-    def train(self, train_dir, validation_dir=None, epochs=10, batch_size=32):
-        """Train the model with images from the specified directory"""
+    def build_feature_extractor(self):
+        """Build the frozen VGG16 backbone with global average pooling as an embedding model"""
+        keras = _keras()
+        
+        base_model = keras.applications.VGG16(
+            weights='imagenet', include_top=False, input_shape=self.input_shape, pooling='avg'
+        )
+        base_model.trainable = False
+        
+        self.model = base_model
+        self.embedding_dim = int(base_model.output_shape[-1])
+        return self.model
+    
+    def load_dataset(self, data_dir, cache_dir=None):
+        """Decoded training images of `data_dir`, cached in `cache_dir` (default `<data_dir>_cache`)"""
+        if not cache_dir:
+            cache_dir = os.path.normpath(data_dir) + '_cache'
+        return DatasetCache(data_dir, cache_dir, (self.input_shape[1], self.input_shape[0])).load()
+    
+    def train(self, train_dir, validation_dir=None, epochs=10, batch_size=32, callbacks=None, cache_dir=None):
+        """Train the model with images from the specified directory
+        
+        Images are decoded and resized once into a DatasetCache, and batches
+        are augmented and prefetched by background threads during training.
+        """
         if not self.model:
             raise ValueError("Model not initialized. Call build_model first.")
         
-        # Data augmentation for training
-        train_datagen = ImageDataGenerator(
-            rescale=1.0/255,
-            rotation_range=20,
-            width_shift_range=0.2,
-            height_shift_range=0.2,
-            shear_range=0.2,
-            zoom_range=0.2,
-            horizontal_flip=True,
-            fill_mode='nearest'
-        )
+        dataset = self.load_dataset(train_dir, cache_dir)
+        if len(dataset) == 0:
+            raise ValueError(f"No training images found in {train_dir}")
+        
+        # A model that already has classes keeps their indices; users added since get new outputs
+        if not self.class_indices:
+            self.class_indices = dict(dataset.class_indices)
+            self.classes = {v: k for k, v in self.class_indices.items()}
+        else:
+            new_classes = [name for name in sorted(dataset.class_indices) if name not in self.class_indices]
+            if new_classes:
+                self.extend_classes(new_classes, dataset)
+                self.model.compile(
+                    optimizer=_keras().optimizers.Adam(0.0001),
+                    loss='categorical_crossentropy',
+                    metrics=['accuracy']
+                )
         
-        # Validation data should only be rescaled
-        validation_datagen = ImageDataGenerator(rescale=1.0/255)
+        # Random rotation, shift, shear, zoom and flips for training; validation is only rescaled
+        train_loader = BatchLoader(dataset, batch_size, augment=True,
+                                   label_map=self._label_map(dataset), num_classes=len(self.classes))
+        validation_loader = None
+        try:
+            if validation_dir:
+                validation_data = self.load_dataset(validation_dir)
+                validation_loader = BatchLoader(validation_data, batch_size, augment=False, shuffle=False,
+                                                label_map=self._label_map(validation_data),
+                                                num_classes=len(self.classes))
+                
+                # Train the model
+                self.model.fit(
+                    (batch for batch in train_loader),
+                    steps_per_epoch=train_loader.steps_per_epoch,
+                    epochs=epochs,
+                    validation_data=(batch for batch in validation_loader),
+                    validation_steps=validation_loader.steps_per_epoch,
+                    callbacks=callbacks
+                )
+            else:
+                # Train without validation
+                self.model.fit(
+                    (batch for batch in train_loader),
+                    steps_per_epoch=train_loader.steps_per_epoch,
+                    epochs=epochs,
+                    callbacks=callbacks
+                )
+        finally:
+            train_loader.close()
+            if validation_loader:
+                validation_loader.close()
         
-        # Create data generators
-        train_generator = train_datagen.flow_from_directory(
-            train_dir,
-            target_size=(self.input_shape[0], self.input_shape[1]),
-            batch_size=batch_size,
-            class_mode='categorical'
+        return self.model
+    
+    def _label_map(self, dataset):
+        """Model class index of each dataset label"""
+        unknown = [name for name in dataset.class_indices if name not in self.class_indices]
+        if unknown:
+            raise ValueError(f"Classes {unknown} are not in the model; add them with update().")
+        names = sorted(dataset.class_indices, key=dataset.class_indices.get)
+        return np.array([self.class_indices[name] for name in names], dtype=np.intp)
+    
+    def extend_classes(self, new_classes, dataset=None):
+        """Widen the softmax head with outputs for `new_classes`, keeping the existing ones
+        
+        The weights of existing classes are copied over unchanged. When
+        `dataset` is given, the weights of each new class are imprinted
+        from the mean penultimate features of its images, scaled like the
+        existing ones, so the update starts close to a good solution.
+        """
+        keras = _keras()
+        old_head = self.model.layers[-1]
+        kernel, bias = old_head.get_weights()
+        features_layer = self.model.layers[-2]
+        
+        new_kernel = np.random.default_rng(0).normal(0.0, kernel.std(), (kernel.shape[0], len(new_classes)))
+        if dataset is not None:
+            extractor = keras.models.Model(inputs=self.model.input, outputs=features_layer.output)
+            scale = np.linalg.norm(kernel, axis=0).mean()
+            for i, name in enumerate(new_classes):
+                rows = np.flatnonzero(dataset.labels == dataset.class_indices[name])
+                if len(rows) == 0:
+                    continue
+                batch = dataset.images[rows].astype(np.float32) * (1.0 / 255)
+                mean = extractor.predict(batch, batch_size=32).mean(axis=0)
+                new_kernel[:, i] = mean / max(np.linalg.norm(mean), 1e-12) * scale
+        
+        head = keras.layers.Dense(len(self.classes) + len(new_classes), activation='softmax')
+        outputs = head(features_layer.output)
+        head.set_weights([
+            np.concatenate([kernel, new_kernel.astype(kernel.dtype)], axis=1),
+            np.concatenate([bias, np.full(len(new_classes), bias.mean(), dtype=bias.dtype)])
+        ])
+        self.model = keras.models.Model(inputs=self.model.input, outputs=outputs)
+        
+        for name in new_classes:
+            self.class_indices[name] = len(self.classes)
+            self.classes[len(self.classes)] = name
+        self.num_classes = len(self.classes)
+        return self.model
+    
+    def update(self, train_dir, epochs=5, batch_size=32, replay_per_class=5, callbacks=None, cache_dir=None, seed=None):
+        """Incrementally add the classes of `train_dir` the model does not know yet
+        
+        Instead of retraining from scratch, the head is extended with the
+        new classes and only the dense layers are trained, on every image
+        of the new classes plus a replay sample of `replay_per_class`
+        images of each existing class so they are not forgotten. Returns
+        the names of the added classes.
+        """
+        if not self.model or not self.class_indices:
+            raise ValueError("Incremental update needs a trained model. Call train first.")
+        
+        dataset = self.load_dataset(train_dir, cache_dir)
+        new_classes = [name for name in sorted(dataset.class_indices) if name not in self.class_indices]
+        if not new_classes:
+            return []
+        self.extend_classes(new_classes, dataset)
+        
+        rng = np.random.default_rng(seed)
+        indices = []
+        for name, label in dataset.class_indices.items():
+            rows = np.flatnonzero(dataset.labels == label)
+            if name not in new_classes:
+                rows = rng.choice(rows, min(replay_per_class, len(rows)), replace=False)
+            indices.append(rows)
+        
+        # Only the classifier layers learn; the backbone stays frozen
+        keras = _keras()
+        for layer in self.model.layers:
+            layer.trainable = isinstance(layer, keras.layers.Dense)
+        self.model.compile(
+            optimizer=keras.optimizers.Adam(0.0001),
+            loss='categorical_crossentropy',
+            metrics=['accuracy']
         )
         
-        validation_generator = None
-        if validation_dir:
-            validation_generator = validation_datagen.flow_from_directory(
-                validation_dir,
-                target_size=(self.input_shape[0], self.input_shape[1]),
-                batch_size=batch_size,
-                class_mode='categorical'
-            )
-            
-            # Train the model
+        loader = BatchLoader(dataset, batch_size, augment=True, seed=seed, indices=np.concatenate(indices),
+                             label_map=self._label_map(dataset), num_classes=len(self.classes))
+        try:
             self.model.fit(
-                train_generator,
-                steps_per_epoch=train_generator.samples // batch_size,
+                (batch for batch in loader),
+                steps_per_epoch=loader.steps_per_epoch,
                 epochs=epochs,
-                validation_data=validation_generator,
-                validation_steps=validation_generator.samples // batch_size
-            )
-        else:
-            # Train without validation
-            self.model.fit(
-                train_generator,
-                steps_per_epoch=train_generator.samples // batch_size,
-                epochs=epochs
+                callbacks=callbacks
             )
+        finally:
+            loader.close()
         
-        # Save the class indices for later use
-        self.class_indices = train_generator.class_indices
-        self.classes = {v: k for k, v in self.class_indices.items()}
-        
-        return self.model
+        return new_classes
     
-    def fine_tune(self, train_dir, validation_dir=None, epochs=5, batch_size=32):
+    def fine_tune(self, train_dir, validation_dir=None, epochs=5, batch_size=32, callbacks=None):
         """Fine-tune the model by unfreezing some layers"""
         if not self.model:
             raise ValueError("Model not initialized. Call build_model first.")
@@ -121,16 +283,20 @@ class FaceRecognitionModel:
         
         # Recompile the model with a lower learning rate
         self.model.compile(
-            optimizer=Adam(0.00001),  # Lower learning rate
+            optimizer=_keras().optimizers.Adam(0.00001),  # Lower learning rate
             loss='categorical_crossentropy',
             metrics=['accuracy']
         )
         
-        # Use the same data generators as in the train method
-        return self.train(train_dir, validation_dir, epochs, batch_size)
+        # Reuses the dataset cache built by the train method, nothing is decoded again
+        return self.train(train_dir, validation_dir, epochs, batch_size, callbacks)
     
-    def save_model(self, filepath=None):
-        """Save the model and class mappings"""
+    def save_model(self, filepath=None, tflite=None, calibration_dir=None):
+        """Save the model and class mappings
+        
+        With `tflite` ('float32', 'float16' or 'int8') the model is also
+        exported to `<filepath>.tflite` for the TFLite inference backend.
+        """
         if not self.model:
             raise ValueError("No model to save.")
         
@@ -147,8 +313,31 @@ class FaceRecognitionModel:
         with open(filepath + '_classes.pkl', 'wb') as f:
             pickle.dump(self.classes, f)
         
+        if tflite:
+            self.export_tflite(filepath + '.tflite', tflite, calibration_dir)
+        
         return filepath
     
+    def export_tflite(self, filepath, quantization='float16', calibration_dir=None, calibration_samples=200):
+        """Export the Keras model to TFLite, int8 quantization being calibrated on face crops
+        
+        Calibration uses up to `calibration_samples` images of
+        `calibration_dir` (a training data directory), preprocessed like
+        the training data. Returns the size of the exported file in bytes.
+        """
+        if not self.model or isinstance(self.model, TFLiteModel):
+            raise ValueError("Exporting needs the Keras model. Load it with backend='keras'.")
+        
+        calibration_images = None
+        if quantization == 'int8':
+            if not calibration_dir:
+                raise ValueError("int8 quantization needs a calibration_dir of face crops.")
+            dataset = self.load_dataset(calibration_dir)
+            rows = np.random.default_rng(0).permutation(len(dataset))[:calibration_samples]
+            calibration_images = dataset.images[np.sort(rows)].astype(np.float32) * (1.0 / 255)
+        
+        return export_tflite(self.model, filepath, quantization, calibration_images)
+    
     def load_model(self, filepath=None):
         """Load a saved model and class mappings"""
         if not filepath:
@@ -157,8 +346,14 @@ class FaceRecognitionModel:
         if not filepath:
             raise ValueError("No path specified to load the model from.")
         
-        # Load the Keras model
-        self.model = load_model(filepath)
+        # Load the Keras model, or only its TFLite export
+        if self.backend == 'tflite':
+            tflite_path = filepath + '.tflite'
+            if not os.path.exists(tflite_path):
+                raise FileNotFoundError(f"No TFLite export of the model at {tflite_path}")
+            self.model = TFLiteModel(tflite_path)
+        else:
+            self.model = _keras().models.load_model(filepath)
         
         # Load the class mappings
         class_file = filepath + '_classes.pkl'
@@ -170,63 +365,137 @@ class FaceRecognitionModel:
         
         return self.model
     
+    def warmup(self):
+        """Run one dummy inference so the first real request does not pay graph setup"""
+        if self.model is not None:
+            self.model.predict(np.zeros((1,) + self.input_shape, dtype=np.float32), batch_size=1)
+        self.detector.detect(np.zeros((64, 64, 3), dtype=np.uint8))
+    
     def detect_faces(self, image):
-        """Detect faces in an image using OpenCV"""
+        """Detect faces in an RGB image (or image path), returned as (x, y, w, h) boxes"""
         if isinstance(image, str):
-            img = cv2.imread(image)
+            img, _ = read_image(image)
         else:
-            img = image.copy()
-        
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        faces = self.face_cascade.detectMultiScale(
-            gray,
-            scaleFactor=1.1,
-            minNeighbors=5,
-            minSize=(30, 30)
-        )
+            img = image  # Only read from, no copy needed
+        
+        faces = [to_xywh(box) for box in self.detector.detect(img)]
         
         return faces, img
     
     def preprocess_face(self, image, face):
-        """Extract and preprocess a face for the model"""
-        x, y, w, h = face
-        face_img = image[y:y+h, x:x+w]
-        face_img = cv2.resize(face_img, (self.input_shape[0], self.input_shape[1]))
-        face_img = face_img / 255.0  # Normalize
-        face_img = np.expand_dims(face_img, axis=0)  # Add batch dimension
-        return face_img
-    
-    def recognize_face(self, image, confidence_threshold=0.7):
-        """Recognize faces in an image"""
+        """Extract and preprocess a face for the model, as a batch of one"""
+        return self.preprocess_faces(image, [face]).copy()
+    
+    def preprocess_faces(self, image, faces):
+        """Extract and preprocess all faces of an RGB image into a single model batch
+        
+        The batch is this thread's reused buffer (see FaceBatchBuffer):
+        predict it before preprocessing the next one.
+        """
+        return self.batch_buffer.fill(image[y:y+h, x:x+w] for x, y, w, h in faces)
+    
+    def preprocess_crops(self, crops):
+        """Preprocess whole RGB face crops into a single model batch (this thread's buffer)"""
+        return self.batch_buffer.fill(crops)
+    
+    def predict_batch(self, batch):
+        """Run the model on a stacked batch of preprocessed faces"""
         if not self.model:
             raise ValueError("Model not loaded. Call load_model first.")
+        return self.model.predict(batch, batch_size=len(batch))
+    
+    def embed_faces(self, batch, predict_fn=None):
+        """L2-normalized embeddings of a batch of preprocessed faces"""
+        if self.mode != 'embedding':
+            raise ValueError("Embeddings are only available in 'embedding' mode.")
+        features = np.asarray((predict_fn or self.predict_batch)(batch), dtype=np.float32)
+        norms = np.linalg.norm(features, axis=1, keepdims=True)
+        return features / np.maximum(norms, 1e-12)
+    
+    def decode_predictions(self, faces, predictions, confidence_threshold=0.7):
+        """Turn per-face class probabilities into recognition results, one per face
         
-        # Detect faces
-        faces, img = self.detect_faces(image)
-        
+        Faces below `confidence_threshold` are kept with an 'id' of None.
+        """
         results = []
-        for face in faces:
-            # Preprocess the face
-            face_img = self.preprocess_face(img, face)
+        for face, face_predictions in zip(faces, predictions):
+            max_index = np.argmax(face_predictions)
+            confidence = face_predictions[max_index]
             
-            # Make prediction
-            predictions = self.model.predict(face_img)[0]
-            max_index = np.argmax(predictions)
-            confidence = predictions[max_index]
-            
-            if confidence >= confidence_threshold:
-                person_id = self.classes[max_index]
-                x, y, w, h = face
-                results.append({
-                    'id': person_id,
-                    'confidence': float(confidence),
-                    'box': [int(x), int(y), int(w), int(h)]
-                })
+            x, y, w, h = face
+            results.append({
+                'id': self.classes[max_index] if confidence >= confidence_threshold else None,
+                'confidence': float(confidence),
+                'box': [int(x), int(y), int(w), int(h)]
+            })
+        
+        return results
+    
+    def decode_matches(self, faces, matches):
+        """Turn nearest-neighbour gallery matches of face embeddings into recognition results, one per face
+        
+        Embeddings are unit length, so the cosine similarity reported as the
+        confidence is 1 - distance^2 / 2. Faces without a match within the
+        tolerance are kept with an 'id' of None (and no confidence if the
+        gallery is empty).
+        """
+        results = []
+        for face, match in zip(faces, matches):
+            x, y, w, h = face
+            results.append({
+                'id': match["user"],
+                'confidence': float(1.0 - match["distance"] ** 2 / 2.0) if match["distance"] is not None else None,
+                'box': [int(x), int(y), int(w), int(h)]
+            })
         
         return results
+    
+    def recognize_face(self, image, confidence_threshold=0.7, predict_fn=None, gallery=None, span=None):
+        """Recognize faces in an image: one {id, confidence, box} per detected face, id None if unknown
+        
+        `predict_fn` can replace `predict_batch`, e.g. to share a batch with
+        other requests. In 'embedding' mode `gallery` (anything with
+        `match_many`, such as a FaceGallery of enrolled embeddings) is
+        searched instead of a classifier, and `confidence_threshold` is the
+        minimum cosine similarity. `span(stage)`, if given, returns a context
+        manager timing each stage (detect, preprocess, predict, match).
+        """
+        if not self.model:
+            raise ValueError("Model not loaded. Call load_model first.")
+        if self.mode == 'embedding' and gallery is None:
+            raise ValueError("A gallery of enrolled embeddings is required in 'embedding' mode.")
+        
+        span = span or (lambda stage: nullcontext())
+        
+        # Detect faces
+        with span('detect'):
+            faces, img = self.detect_faces(image)
+        if len(faces) == 0:
+            return []
+        
+        # Predict every face of the frame in one batch
+        with span('preprocess'):
+            batch = self.preprocess_faces(img, faces)
+        if self.mode == 'embedding':
+            with span('predict'):
+                embeddings = self.embed_faces(batch, predict_fn)
+            tolerance = float(np.sqrt(2.0 - 2.0 * confidence_threshold))
+            with span('match'):
+                matches = gallery.match_many(embeddings, tolerance=tolerance)
+            return self.decode_matches(faces, matches)
+        
+        with span('predict'):
+            predictions = (predict_fn or self.predict_batch)(batch)
+        return self.decode_predictions(faces, predictions, confidence_threshold)
 
 # Example usage:
 # model = FaceRecognitionModel(num_classes=10)
 # model.train('path/to/training/data', 'path/to/validation/data')
 # model.save_model('path/to/save/model')
-# results = model.recognize_face('path/to/image.jpg') 
\ No newline at end of file
+# results = model.recognize_face('path/to/image.jpg')
+#
+# Embedding mode, no training:
+# model = FaceRecognitionModel(mode='embedding')
+# faces, img = model.detect_faces('path/to/user.jpg')
+# gallery.add('user', model.embed_faces(model.preprocess_faces(img, faces[:1]))[0])
+# results = model.recognize_face('path/to/image.jpg', gallery=gallery) 
\ No newline at end of file
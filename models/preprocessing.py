@@ -0,0 +1,141 @@
+"""Frame decoding and face crop normalization shared by the recognition paths
+
+Frames are decoded once, straight into RGB: the colour order face_recognition
+expects and the one the deep model's training crops are cached in, so no
+later stage converts the whole frame again. JPEGs much wider than needed are
+decoded at 1/2, 1/4 or 1/8 scale by libjpeg itself (IMREAD_REDUCED_*), which
+skips most of the decoding work; `decode_image` returns that scale so boxes
+can be mapped back to the original frame.
+"""
+import threading
+import numpy as np
+import cv2
+
+JPEG_START = b'\xff\xd8'
+# Start-of-frame markers, the ones holding the image size (C4, C8 and CC are not)
+SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+# Markers without a length field: TEM and the restart markers
+STANDALONE_MARKERS = frozenset([0x01] + list(range(0xD0, 0xD8)))
+REDUCED_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8
+}
+# OpenCV 4.10+ decodes straight into RGB; older versions decode BGR and convert
+IMREAD_COLOR_RGB = getattr(cv2, 'IMREAD_COLOR_RGB', None)
+if IMREAD_COLOR_RGB is not None:
+    REDUCED_FLAGS = {factor: (flag & ~cv2.IMREAD_COLOR) | IMREAD_COLOR_RGB for factor, flag in REDUCED_FLAGS.items()}
+
+
+def jpeg_size(data):
+    """(width, height) read from a JPEG's frame header, None for other formats"""
+    if data[:2] != JPEG_START:
+        return None
+    i = 2
+    while i + 4 <= len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:
+            # Fill byte before a marker
+            i += 1
+            continue
+        if marker in STANDALONE_MARKERS:
+            i += 2
+            continue
+        if marker in SOF_MARKERS:
+            if i + 9 > len(data):
+                return None
+            height = int.from_bytes(data[i + 5:i + 7], 'big')
+            width = int.from_bytes(data[i + 7:i + 9], 'big')
+            return width, height
+        if marker == 0xDA:
+            # Start of scan without a frame header
+            return None
+        i += 2 + int.from_bytes(data[i + 2:i + 4], 'big')
+    return None
+
+
+def reduction(width, min_width):
+    """Largest libjpeg scale down (8, 4, 2 or 1) keeping a frame at least `min_width` wide"""
+    if min_width:
+        for factor in (8, 4, 2):
+            if width // factor >= min_width:
+                return factor
+    return 1
+
+
+def decode_image(data, min_width=0):
+    """Decode image bytes into an RGB array, returns (image, scale)
+
+    JPEGs are decoded at reduced resolution when they stay at least
+    `min_width` wide (0 = always full resolution). `scale` is the original
+    width over the decoded one: multiply coordinates by it to map them back
+    to the original image. The image is None if the data cannot be decoded.
+    """
+    if not data:
+        return None, 1.0
+    size = jpeg_size(data) if min_width else None
+    factor = reduction(size[0], min_width) if size else 1
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), REDUCED_FLAGS[factor])
+    if image is None:
+        return None, 1.0
+    if IMREAD_COLOR_RGB is None:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    scale = size[0] / float(image.shape[1]) if factor > 1 else 1.0
+    return image, scale
+
+
+def read_image(path, min_width=0):
+    """`decode_image` of a file, (None, 1.0) if it is missing or not an image"""
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None, 1.0
+    return decode_image(data, min_width)
+
+
+def to_bgr(image):
+    """BGR copy of an RGB image (crop), for cv2.imwrite and cv2.imencode"""
+    return cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+
+
+def scale_box(box, scale):
+    """An (x, y, w, h) box of a reduced decode in the original image's coordinates"""
+    if scale == 1.0:
+        return box
+    return [int(round(v * scale)) for v in box]
+
+
+class FaceBatchBuffer:
+    """Preallocated float32 model input batches, one per thread
+
+    `fill` resizes face crops into a reused uint8 buffer and normalizes them
+    in place into a reused float32 batch, so preprocessing a frame allocates
+    nothing once the buffer has grown to its largest batch. The returned
+    batch is a view of the calling thread's buffer: it stays valid until the
+    same thread fills the next batch (a request predicts its batch before).
+    """
+
+    def __init__(self, input_shape):
+        self.input_shape = tuple(input_shape)
+        self._local = threading.local()
+
+    def _buffers(self, count):
+        batch = getattr(self._local, 'batch', None)
+        if batch is None or len(batch) < count:
+            batch = self._local.batch = np.empty((max(count, 1),) + self.input_shape, dtype=np.float32)
+            self._local.resized = np.empty(self.input_shape, dtype=np.uint8)
+        return batch, self._local.resized
+
+    def fill(self, crops):
+        """Resize and scale uint8 RGB face crops to [0, 1] into one float32 batch"""
+        crops = list(crops)
+        batch, resized = self._buffers(len(crops))
+        height, width = self.input_shape[:2]
+        for crop, target in zip(crops, batch):
+            cv2.resize(crop, (width, height), dst=resized)
+            np.multiply(resized, 1.0 / 255, out=target, casting='unsafe')
+        return batch[:len(crops)]
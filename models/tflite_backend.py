@@ -0,0 +1,84 @@
+import os
+import threading
+import numpy as np
+
+QUANTIZATIONS = ('float32', 'float16', 'int8')
+
+
+def _interpreter_class():
+    """The TFLite interpreter, from the slim tflite_runtime package when installed"""
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        import tensorflow as tf
+        Interpreter = tf.lite.Interpreter
+    return Interpreter
+
+
+def export_tflite(keras_model, path, quantization='float16', calibration_images=None):
+    """Convert a Keras model into a TFLite flatbuffer at `path`; returns its size in bytes
+
+    quantization:
+      float32  no quantization, only the TFLite graph optimizations
+      float16  weights stored as float16 (half the size, float32 compute)
+      int8     weights and activations in int8, calibrated on
+               `calibration_images`, a (n, h, w, 3) float32 array of
+               preprocessed inputs; model inputs and outputs stay float32
+    """
+    import tensorflow as tf
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(f"Unknown quantization '{quantization}', expected one of {QUANTIZATIONS}")
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(keras_model)
+    if quantization == 'float16':
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantization == 'int8':
+        if calibration_images is None or len(calibration_images) == 0:
+            raise ValueError("int8 quantization needs calibration images")
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+
+        def representative_dataset():
+            for image in calibration_images:
+                yield [np.asarray(image, dtype=np.float32)[np.newaxis]]
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+
+    flatbuffer = converter.convert()
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(flatbuffer)
+    os.replace(tmp_path, path)
+    return len(flatbuffer)
+
+
+class TFLiteModel:
+    """Runs a TFLite model with the `predict(x, batch_size)` interface of a Keras model
+
+    The interpreter is resized to the batch size when it changes and is
+    not thread-safe, so calls are serialized with a lock.
+    """
+
+    def __init__(self, path, num_threads=None):
+        self.path = path
+        self.interpreter = _interpreter_class()(model_path=path, num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self._batch_size = int(self._input['shape'][0])
+        self._lock = threading.Lock()
+
+    @property
+    def input_shape(self):
+        return tuple(int(d) for d in self._input['shape'][1:])
+
+    def predict(self, x, batch_size=None):
+        x = np.asarray(x, dtype=np.float32)
+        with self._lock:
+            if len(x) != self._batch_size:
+                self.interpreter.resize_tensor_input(self._input['index'], [len(x)] + list(x.shape[1:]))
+                self.interpreter.allocate_tensors()
+                self._batch_size = len(x)
+            self.interpreter.set_tensor(self._input['index'], x)
+            self.interpreter.invoke()
+            return self.interpreter.get_tensor(self._output['index']).copy()
@@ -0,0 +1,287 @@
+import os
+import json
+import queue
+import hashlib
+import threading
+import numpy as np
+import cv2
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+
+
+def _user_signature(user_dir):
+    """Hash of the file names, sizes and mtimes of a user's images; changes whenever one does"""
+    digest = hashlib.sha1()
+    for name in sorted(os.listdir(user_dir)):
+        if name.lower().endswith(IMAGE_EXTENSIONS):
+            stat = os.stat(os.path.join(user_dir, name))
+            digest.update(f'{name}\0{stat.st_size}\0{stat.st_mtime_ns}\n'.encode('utf-8'))
+    return digest.hexdigest()
+
+
+class DatasetCache:
+    """Decoded, resized training images cached on disk
+
+    Each class (user directory of `data_dir`) is decoded once into
+    `<cache_dir>/<user>.npy`, a uint8 (n, height, width, 3) RGB array, and
+    only re-decoded when the signature of its directory changes. The
+    classes are then concatenated into one memory-mapped `dataset.npy`
+    with aligned `labels.npy`, rebuilt only when some class changed.
+    Class indices follow the sorted directory names, like Keras'
+    `flow_from_directory`.
+    """
+
+    def __init__(self, data_dir, cache_dir, image_size=(224, 224)):
+        self.data_dir = data_dir
+        self.cache_dir = cache_dir
+        self.image_size = image_size
+        self.images = None
+        self.labels = None
+        self.class_indices = {}
+        self.decoded = 0
+
+    def _manifest_path(self):
+        return os.path.join(self.cache_dir, 'manifest.json')
+
+    def _read_manifest(self):
+        try:
+            with open(self._manifest_path()) as f:
+                manifest = json.load(f)
+            if tuple(manifest["image_size"]) == tuple(self.image_size):
+                return manifest
+        except (OSError, ValueError, KeyError):
+            pass
+        return {"image_size": list(self.image_size), "classes": {}, "dataset": None}
+
+    def _write_manifest(self, manifest):
+        tmp_path = self._manifest_path() + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self._manifest_path())
+
+    def _decode_user(self, user_dir):
+        width, height = self.image_size
+        images = []
+        for name in sorted(os.listdir(user_dir)):
+            if not name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            image = cv2.imread(os.path.join(user_dir, name), cv2.IMREAD_COLOR)
+            if image is None:
+                continue
+            image = cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+            images.append(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+        return np.array(images, dtype=np.uint8).reshape(-1, height, width, 3)
+
+    def load(self):
+        """Bring the cache up to date with `data_dir` and memory-map it; returns self"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        manifest = self._read_manifest()
+        classes = sorted(d for d in os.listdir(self.data_dir)
+                         if not d.startswith('.') and os.path.isdir(os.path.join(self.data_dir, d)))
+
+        changed = set(manifest["classes"]) - set(classes)
+        for user_id in classes:
+            signature = _user_signature(os.path.join(self.data_dir, user_id))
+            entry = manifest["classes"].get(user_id)
+            user_path = os.path.join(self.cache_dir, f'{user_id}.npy')
+            if entry and entry["signature"] == signature and os.path.exists(user_path):
+                continue
+            images = self._decode_user(os.path.join(self.data_dir, user_id))
+            np.save(user_path, images)
+            self.decoded += len(images)
+            manifest["classes"][user_id] = {"signature": signature, "count": len(images)}
+            changed.add(user_id)
+        for user_id in set(manifest["classes"]) - set(classes):
+            del manifest["classes"][user_id]
+            if os.path.exists(os.path.join(self.cache_dir, f'{user_id}.npy')):
+                os.remove(os.path.join(self.cache_dir, f'{user_id}.npy'))
+
+        dataset_path = os.path.join(self.cache_dir, 'dataset.npy')
+        labels_path = os.path.join(self.cache_dir, 'labels.npy')
+        if changed or manifest["dataset"] != classes or not os.path.exists(dataset_path):
+            self._write_dataset(classes, manifest, dataset_path, labels_path)
+            manifest["dataset"] = classes
+        self._write_manifest(manifest)
+
+        self.class_indices = {user_id: i for i, user_id in enumerate(classes)}
+        self.images = np.load(dataset_path, mmap_mode='r')
+        self.labels = np.load(labels_path)
+        return self
+
+    def _write_dataset(self, classes, manifest, dataset_path, labels_path):
+        """Concatenate the per-class arrays into one memmap (a copy, no decoding)"""
+        width, height = self.image_size
+        total = sum(manifest["classes"][user_id]["count"] for user_id in classes)
+        tmp_path = dataset_path + '.tmp.npy'
+        images = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.uint8, shape=(total, height, width, 3))
+        labels = np.empty(total, dtype=np.int32)
+        row = 0
+        for i, user_id in enumerate(classes):
+            user_images = np.load(os.path.join(self.cache_dir, f'{user_id}.npy'), mmap_mode='r')
+            images[row:row + len(user_images)] = user_images
+            labels[row:row + len(user_images)] = i
+            row += len(user_images)
+        images.flush()
+        del images
+        os.replace(tmp_path, dataset_path)
+        np.save(labels_path, labels)
+
+    def __len__(self):
+        return 0 if self.labels is None else len(self.labels)
+
+    @property
+    def num_classes(self):
+        return len(self.class_indices)
+
+
+def random_affine(count, size, rng, rotation=20, shift=0.2, shear=0.2, zoom=0.2):
+    """(count, 2, 3) output->input affine maps, drawn like ImageDataGenerator's
+    rotation_range, width/height_shift_range, shear_range (degrees) and zoom_range"""
+    height, width = size
+    theta = np.deg2rad(rng.uniform(-rotation, rotation, count))
+    shear_angle = np.deg2rad(rng.uniform(-shear, shear, count))
+    zx, zy = rng.uniform(1 - zoom, 1 + zoom, (2, count))
+    tx = rng.uniform(-shift, shift, count) * width
+    ty = rng.uniform(-shift, shift, count) * height
+
+    cos, sin = np.cos(theta), np.sin(theta)
+    # rotation @ shear @ zoom, about the image centre
+    a = cos * zx
+    b = (-sin + cos * np.tan(shear_angle)) * zy
+    c = sin * zx
+    d = (cos + sin * np.tan(shear_angle)) * zy
+    cx, cy = (width - 1) / 2.0, (height - 1) / 2.0
+    matrices = np.empty((count, 2, 3), dtype=np.float32)
+    matrices[:, 0, 0], matrices[:, 0, 1] = a, b
+    matrices[:, 1, 0], matrices[:, 1, 1] = c, d
+    matrices[:, 0, 2] = cx - a * cx - b * cy + tx
+    matrices[:, 1, 2] = cy - c * cx - d * cy + ty
+    return matrices
+
+
+def augment_batch(images, rng, out=None, flip=True, **ranges):
+    """Randomly rotate, shift, shear, zoom and flip a (n, h, w, 3) uint8 batch
+
+    The transforms of the whole batch are drawn in one go and flips folded
+    into them, so each image costs a single OpenCV warp (nearest-neighbour,
+    repeating the border like fill_mode='nearest'); the batch is then
+    scaled to float32 [0, 1] in one operation.
+    """
+    count, height, width, channels = images.shape
+    matrices = random_affine(count, (height, width), rng, **ranges)
+    if flip:
+        flipped = rng.random(count) < 0.5
+        # Mirror the output x coordinate before the affine map
+        matrices[flipped, :, 2] += matrices[flipped, :, 0] * (width - 1)
+        matrices[flipped, :, 0] *= -1
+
+    warped = np.empty((count, height, width, channels), dtype=np.uint8)
+    for image, matrix, target in zip(images, matrices, warped):
+        cv2.warpAffine(image, matrix, (width, height), dst=target,
+                       flags=cv2.WARP_INVERSE_MAP | cv2.INTER_NEAREST, borderMode=cv2.BORDER_REPLICATE)
+    if out is None:
+        out = np.empty(warped.shape, dtype=np.float32)
+    np.multiply(warped, 1.0 / 255, out=out, casting='unsafe')
+    return out
+
+
+class BatchLoader:
+    """Endless (images, one-hot labels) batches from a DatasetCache, prepared ahead of training
+
+    `workers` threads gather, augment and scale batches into a queue of
+    `prefetch` ready batches, so the next batches are built while the
+    model trains on the current one (numpy and OpenCV release the GIL).
+    `indices` restricts the loader to a subset of the dataset, and
+    `label_map` translates dataset labels into the model's class indices
+    (of which there are `num_classes`).
+    """
+
+    def __init__(self, dataset, batch_size=32, augment=True, shuffle=True, prefetch=4, workers=2, seed=None,
+                 indices=None, label_map=None, num_classes=None):
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.indices = np.arange(len(dataset)) if indices is None else np.asarray(indices, dtype=np.intp)
+        if len(self.indices) == 0:
+            raise ValueError("No images to load batches from")
+        self.label_map = np.arange(dataset.num_classes) if label_map is None else np.asarray(label_map)
+        self.num_classes = num_classes or dataset.num_classes
+        self.augment = augment
+        self.shuffle = shuffle
+        self._queue = queue.Queue(maxsize=prefetch)
+        self._lock = threading.Lock()
+        self._rng = np.random.default_rng(seed)
+        self._order = np.arange(0)
+        self._position = 0
+        self._stopped = threading.Event()
+        self._error = None
+        self._workers = [
+            threading.Thread(target=self._work, args=(np.random.default_rng(self._rng.integers(1 << 32)),),
+                             name=f'batch-loader-{i}', daemon=True)
+            for i in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    @property
+    def steps_per_epoch(self):
+        return max(len(self.indices) // self.batch_size, 1)
+
+    def _next_indices(self):
+        """Indices of the next batch; every image is seen once per pass in random order"""
+        with self._lock:
+            indices = []
+            while len(indices) < self.batch_size:
+                if self._position >= len(self._order):
+                    self._order = self.indices.copy()
+                    if self.shuffle:
+                        self._rng.shuffle(self._order)
+                    self._position = 0
+                take = self._order[self._position:self._position + self.batch_size - len(indices)]
+                self._position += len(take)
+                indices.extend(take)
+            return np.sort(indices)
+
+    def _make_batch(self, indices, rng):
+        images = self.dataset.images[indices]
+        if self.augment:
+            x = augment_batch(images, rng)
+        else:
+            x = images.astype(np.float32) * (1.0 / 255)
+        y = np.zeros((len(indices), self.num_classes), dtype=np.float32)
+        y[np.arange(len(indices)), self.label_map[self.dataset.labels[indices]]] = 1.0
+        return x, y
+
+    def _work(self, rng):
+        while not self._stopped.is_set():
+            try:
+                batch = self._make_batch(self._next_indices(), rng)
+            except Exception as e:
+                # Hand the error to the consumer instead of leaving it waiting for a batch
+                self._error = e
+                batch = e
+            while not self._stopped.is_set():
+                try:
+                    self._queue.put(batch, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+            if self._error is not None:
+                return
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        """The next batch; raises the error a worker failed with"""
+        if self._error is not None:
+            raise self._error
+        batch = self._queue.get()
+        if isinstance(batch, Exception):
+            raise batch
+        return batch
+
+    def close(self):
+        """Stop the workers and wait for the batch they are building"""
+        self._stopped.set()
+        for worker in self._workers:
+            worker.join()